@@ -0,0 +1,14 @@
+from geoalchemy2.elements import WKTElement
+from sqlalchemy.orm import Session
+from app.models.elec_models import Substation
+from app.schemas.elec_schemas import RcesSubstationSchema
+from app.services.layers import SRID
+
+def create_substation(db: Session, substation: RcesSubstationSchema) -> RcesSubstationSchema:
+    row = Substation(
+        **substation.model_dump(exclude={"lon", "lat"}, exclude_none=True),
+        geom=WKTElement(f"POINT({substation.lon} {substation.lat})", srid=SRID),
+    )
+    db.add(row)
+    db.commit()
+    return substation.model_copy(update={"substation_id": row.substation_id})
@@ -1,60 +1,91 @@
-from fastapi import FastAPI, APIRouter, Depends, HTTPException, Request
-from pydantic import BaseModel
-from sqlalchemy.orm import Session
-from sqlalchemy import text
-from typing import Dict, Any
-from app.database import SessionLocal, Base, engine
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Response
+from app.database import AsyncSessionLocal, Base, async_engine, engine
+from app.routers import (
+    admin_router, analysis_router, dynamic_router, elec_router, feature_router, feed_path_router, layer_router,
+    tile_router, topology_router,
+)
+from app.services.change_feed import CHANGES_CHANNEL, install_change_triggers, parse_change
+from app.services.clusters import ClusterRefresher
+from app.services.feed_paths import FEED_PATH_TABLES, install_feed_paths
+from app.services.islands import islands
+from app.services.metrics import PROMETHEUS_MEDIA_TYPE, MetricsMiddleware, render_metrics
+from app.services.notifications import listener
+from app.services.result_cache import install_invalidation, invalidate_tables
+from app.services.spatial_index import SPATIAL_INDEX_AUTOCREATE, check_spatial_indexes
+from app.services.spatial_snapshot import load_snapshots, refresh_later, reload_snapshots, snapshots
+from app.services.tile_cache import get_tile_cache
+from app.services.topology import topology
+
+cluster_refresher = ClusterRefresher(AsyncSessionLocal, leader=lambda: listener.is_leader("point_clusters"))
+
+async def on_network_change(payload: str):
+    # Covers writes made outside this worker, which the engine events never see
+    change = parse_change(payload)
+    tables = [change["table"]]
+    if change["table"] in FEED_PATH_TABLES:
+        # Rewritten by the feed path triggers in the same transaction
+        tables.append("feed_paths")
+    invalidate_tables(tables)
+    cluster_refresher.handle_change(change)
+    topology.handle_change(change)
+    islands.handle_change(change)
+    if change.get("bbox"):
+        get_tile_cache().invalidate_later(change["table"], tuple(change["bbox"]))
+    if change["table"] in snapshots:
+        refresh_later(AsyncSessionLocal, change["table"], change["id"])
+
+async def on_listener_reconnect():
+    await reload_snapshots(AsyncSessionLocal)
+    await topology.load()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await dynamic_router.init_dynamic_routes()
+    await install_change_triggers(async_engine)
+    await install_feed_paths(async_engine)
+    await check_spatial_indexes(async_engine, create=SPATIAL_INDEX_AUTOCREATE)
+    await load_snapshots(AsyncSessionLocal)
+    await topology.load()
+    listener.subscribe(CHANGES_CHANNEL, on_network_change, resync=on_listener_reconnect)
+    await listener.start()
+    yield
+    await listener.stop()
 
 app = FastAPI(
     title="Electric Network API",
     description="API for querying electric infrastructure dynamically.",
     version="1.0.0",
     docs_url="/docs",
-    redoc_url="/redoc"
+    redoc_url="/redoc",
+    lifespan=lifespan,
 )
 
 # Create tables (if managed via SQLAlchemy)
 Base.metadata.create_all(bind=engine)
 
-# Dynamic routing setup
-router = APIRouter()
-registered_routes = {}
-
-class EndpointRequest(BaseModel):
-    name: str
-    sql: str
-
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
-def register_dynamic_route(name: str, sql: str):
-    path = f"/api/custom/{name}"
-
-    async def dynamic_handler(request: Request, db: Session = Depends(get_db)):
-        params: Dict[str, Any] = dict(request.query_params)
-        try:
-            result = db.execute(text(sql), params)
-            return [dict(row._mapping) for row in result]
-        except Exception as e:
-            raise HTTPException(status_code=500, detail=str(e))
-
-    app.add_api_route(path, dynamic_handler, methods=["GET"], name=name)
-    registered_routes[name] = sql
-
-@router.post("/create-endpoint/")
-def create_endpoint(req: EndpointRequest, db: Session = Depends(get_db)):
-    if req.name in registered_routes:
-        raise HTTPException(status_code=400, detail="Endpoint already exists")
-    register_dynamic_route(req.name, req.sql)
-    return {"message": f"Dynamic GET endpoint created at /api/custom/{req.name}"}
-
-# Register router and root
-app.include_router(router, prefix="/api", tags=["Dynamic SQL"])
+# Drop cached endpoint results when a committed write touches a table they read
+install_invalidation(engine)
+install_invalidation(async_engine.sync_engine)
+
+# Latency, status and response size for every route, scraped from /metrics
+app.add_middleware(MetricsMiddleware)
+
+# Dynamic SQL endpoints are served by a single /api/custom/{name} dispatcher
+app.include_router(dynamic_router.router, prefix="/api", tags=["Dynamic SQL"])
+app.include_router(layer_router.router, tags=["Layers"])
+app.include_router(tile_router.router, tags=["Vector Tiles"])
+app.include_router(feature_router.router, tags=["Features"])
+app.include_router(topology_router.router, tags=["Topology"])
+app.include_router(analysis_router.router, tags=["Analysis"])
+app.include_router(feed_path_router.router, tags=["Feed Paths"])
+app.include_router(admin_router.router, prefix="/admin", tags=["Admin"])
+app.include_router(elec_router.router, tags=["Network Assets"])
 
 @app.get("/")
 def root():
     return {"message": "Electric Network API is running"}
+
+@app.get("/metrics", include_in_schema=False)
+def metrics():
+    return Response(content=render_metrics(), media_type=PROMETHEUS_MEDIA_TYPE)
@@ -0,0 +1,17 @@
+# app/models/cluster_models.py
+from sqlalchemy import Column, Float, Integer, SmallInteger, String
+from app.database import Base
+
+class PointCluster(Base):
+    """Grid cluster of one point layer at one zoom; cells are in Web Mercator metres."""
+    __tablename__ = 'point_clusters'
+    __table_args__ = {'schema': 'network'}
+    layer = Column(String(50), primary_key=True)
+    zoom = Column(SmallInteger, primary_key=True)
+    cell_x = Column(Integer, primary_key=True)
+    cell_y = Column(Integer, primary_key=True)
+    point_count = Column(Integer, nullable=False)
+    # Customers served through the clustered meters; NULL for other layers
+    customer_count = Column(Integer)
+    lon = Column(Float, nullable=False)
+    lat = Column(Float, nullable=False)
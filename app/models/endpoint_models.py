@@ -0,0 +1,13 @@
+# app/models/endpoint_models.py
+from sqlalchemy import Column, String, Text, TIMESTAMP, func
+from sqlalchemy.dialects.postgresql import ARRAY, JSONB
+from app.database import Base
+
+class DynamicEndpoint(Base):
+    __tablename__ = 'dynamic_endpoints'
+    name = Column(String(255), primary_key=True)
+    sql = Column(Text, nullable=False)
+    # Parameter types inferred at registration, so a warm start needs no round trip per endpoint
+    param_types = Column(ARRAY(String), nullable=False, default=list)
+    options = Column(JSONB, nullable=False, default=dict)
+    created_at = Column(TIMESTAMP, server_default=func.now())
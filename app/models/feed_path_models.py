@@ -0,0 +1,17 @@
+# app/models/feed_path_models.py
+from sqlalchemy import Column, Index, Integer, String, Text
+from app.database import Base
+
+class FeedPath(Base):
+    """Materialized feed path of one asset, e.g. 'S3/F12/T408/P9120/M51007'.
+
+    The "C" collation makes the path index usable for prefix range scans.
+    """
+    __tablename__ = 'feed_paths'
+    kind = Column(String(32), primary_key=True)
+    asset_id = Column(Integer, primary_key=True)
+    path = Column(Text(collation='C'), nullable=False)
+    __table_args__ = (
+        Index('ix_feed_paths_path', 'path'),
+        {'schema': 'network'},
+    )
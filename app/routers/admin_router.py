@@ -0,0 +1,48 @@
+from fastapi import APIRouter, HTTPException, Query
+from app.database import AsyncSessionLocal, async_engine
+from app.services.clusters import CLUSTER_LAYERS, rebuild_clusters
+from app.services.feed_paths import rebuild_feed_paths
+from app.services.reconcile import DEFAULT_TOLERANCE_M, JOBS, run_job
+from app.services.spatial_index import check_spatial_indexes
+
+router = APIRouter()
+
+@router.get("/spatial-indexes")
+async def get_spatial_indexes():
+    return await check_spatial_indexes(async_engine)
+
+@router.post("/spatial-indexes")
+async def create_spatial_indexes():
+    """Build missing GiST/BRIN indexes (CONCURRENTLY, so writes continue) and rebuild invalid ones.
+
+    Builds still running elsewhere are reported as ``building`` and left to finish.
+    """
+    return await check_spatial_indexes(async_engine, create=True)
+
+@router.post("/reconcile/{job}")
+async def reconcile(
+    job: str,
+    tolerance_m: float = Query(DEFAULT_TOLERANCE_M, gt=0),
+    only_missing: bool = True,
+    apply: bool = False,
+):
+    """Diff (and with ``apply=true`` write) nearest-parent assignments for ``job``.
+
+    Jobs: meters-to-poles, poles-to-transformers. Dry run by default.
+    """
+    if job not in JOBS:
+        raise HTTPException(status_code=404, detail=f"Reconcile job '{job}' not found")
+    return await run_job(AsyncSessionLocal, job, tolerance_m, only_missing, apply)
+
+@router.post("/clusters/{layer}/rebuild")
+async def rebuild_layer_clusters(layer: str):
+    """Full rebuild of one layer's clusters; edits afterwards are refreshed incrementally."""
+    if layer not in CLUSTER_LAYERS:
+        raise HTTPException(status_code=404, detail=f"Cluster layer '{layer}' not found")
+    return {"layer": layer, "cells": await rebuild_clusters(AsyncSessionLocal, layer)}
+
+@router.post("/feed-paths/rebuild")
+async def rebuild_paths():
+    """Recompute every materialized feed path; triggers keep them current afterwards."""
+    async with async_engine.begin() as conn:
+        return await rebuild_feed_paths(conn)
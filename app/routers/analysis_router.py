@@ -0,0 +1,61 @@
+from typing import List, Literal, Optional
+from fastapi import APIRouter, HTTPException, Response
+from pydantic import BaseModel, Field
+from app.services.json_encoding import JSON_MEDIA_TYPE, dumps
+from app.services.outage import trace_outage
+from app.services.switching import simulate_plans
+from app.services.topology import topology
+
+router = APIRouter()
+MAX_SCENARIOS = 200
+
+class OutageRequest(BaseModel):
+    switch_ids: List[int] = []
+    fuse_ids: List[int] = []
+    # Counts only when false; ids can run to hundreds of thousands for a feeder breaker
+    include_ids: bool = True
+
+@router.post("/analysis/outage")
+async def analyse_outage(req: OutageRequest):
+    """Poles, meters, customers and service points de-energized if the given switches open and fuses blow.
+
+    Runs on the in-memory topology; devices already open are reported but change nothing.
+    """
+    if not req.switch_ids and not req.fuse_ids:
+        raise HTTPException(status_code=400, detail="Give at least one switch or fuse id")
+    try:
+        result = trace_outage(topology.get(), req.switch_ids, req.fuse_ids, req.include_ids)
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=e.args[0])
+    # Id lists for a feeder breaker run to hundreds of thousands; encode them with orjson, not jsonable_encoder
+    return Response(content=dumps(result), media_type=JSON_MEDIA_TYPE)
+
+class SwitchChange(BaseModel):
+    switch_id: int
+    state: Literal["open", "closed"]
+
+class Scenario(BaseModel):
+    name: Optional[str] = None
+    changes: List[SwitchChange]
+
+class SimulationRequest(BaseModel):
+    scenarios: List[Scenario] = Field(min_length=1, max_length=MAX_SCENARIOS)
+
+@router.post("/analysis/switching")
+async def simulate_switching(req: SimulationRequest):
+    """Customers interrupted/restored and transformer kVA affected by each switching plan.
+
+    Every scenario is applied on its own to the current in-memory topology; nothing is written.
+    """
+    graph = topology.get()
+    plans = [[(c.switch_id, c.state == "open") for c in scenario.changes] for scenario in req.scenarios]
+    try:
+        results = await simulate_plans(graph, plans)
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=e.args[0])
+    return {
+        "scenarios": [
+            {"name": scenario.name if scenario.name is not None else str(i), **result}
+            for i, (scenario, result) in enumerate(zip(req.scenarios, results))
+        ]
+    }
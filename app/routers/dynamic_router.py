@@ -1,47 +1,207 @@
-from fastapi import APIRouter, Depends, HTTPException, Request, FastAPI
-from pydantic import BaseModel
-from sqlalchemy.orm import Session
-from sqlalchemy import text
-from typing import Dict, Any
-from app.database import SessionLocal
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, Field
+from typing import Any, Dict, Optional
+import dataclasses
+import logging
+import time
+from sqlalchemy.exc import DBAPIError, IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.database import AsyncSessionLocal
+from app.services.dynamic_sql import (
+    CURSOR_PARAM, DEFAULT_MAX_ROWS, GEOMETRY_PARAM, DEFAULT_STATEMENT_TIMEOUT_MS, NDJSON_MEDIA_TYPE, CompiledEndpoint, compile_endpoint, fetch_page,
+    stream_endpoint, stream_partitions, wants_stream
+)
+from app.services.export_formats import export_stream, negotiate_export
+from app.services.json_encoding import JSON_MEDIA_TYPE, dumps
+from app.services.metrics import DB_TIME, LABEL_SCOPE_KEY, POOL_WAIT, ROWS, SERIALIZE_TIME
+from app.services.endpoint_registry import ENDPOINTS_CHANNEL, load_endpoints, save_endpoint
+from app.services.notifications import listener
+from app.services.plan_guard import check_plan
+from app.services.result_cache import cache_key, endpoint_caches, register_cache
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter()
-registered_routes = {}
+# Every /custom/{name} request is resolved here with one dict lookup, so the
+# number of registered endpoints never affects routing or the OpenAPI schema
+registered_routes: Dict[str, CompiledEndpoint] = {}
+registry_stats: Dict[str, Any] = {}
+# SQLSTATE raised when statement_timeout cancels a query
+QUERY_CANCELED = "57014"
 
 class EndpointRequest(BaseModel):
     name: str
     sql: str
+    stream: bool = False
+    # Seconds to cache results for; omit to always hit the database
+    cache_ttl: Optional[float] = Field(default=None, gt=0)
+    cache_size: int = Field(default=256, gt=0)
+    # Unique, non-null result column to page on with ?cursor=; pages stay O(limit) at any depth
+    order_key: Optional[str] = None
+    # Hard cap on rows per request (page, stream or export), applied as LIMIT in the database
+    max_rows: int = Field(default=DEFAULT_MAX_ROWS, gt=0)
+    statement_timeout_ms: int = Field(default=DEFAULT_STATEMENT_TIMEOUT_MS, gt=0)
+    # Representative query params used to EXPLAIN the endpoint at registration
+    sample_params: Dict[str, str] = {}
+    # Reject the endpoint if the planner's estimated cost is higher than this
+    max_cost: Optional[float] = Field(default=None, gt=0)
 
-def get_db():
-    db = SessionLocal()
-    try:
+async def get_db():
+    async with AsyncSessionLocal() as db:
         yield db
-    finally:
-        db.close()
 
 @router.post("/create-endpoint/")
-def create_endpoint(req: EndpointRequest, db: Session = Depends(get_db)):
-    return register_route(req.name, req.sql, router)
+async def create_endpoint(req: EndpointRequest, db: AsyncSession = Depends(get_db)):
+    return await register_route(
+        req.name, req.sql, db, req.sample_params, req.max_cost,
+        stream=req.stream, cache_ttl=req.cache_ttl, cache_size=req.cache_size,
+        order_key=req.order_key, max_rows=req.max_rows, statement_timeout_ms=req.statement_timeout_ms,
+    )
+
+@router.get("/cache-stats/")
+def cache_stats():
+    return {name: cache.stats() for name, cache in endpoint_caches.items()}
 
-def register_route(name: str, sql: str, app_or_router):
+@router.get("/registry-stats/")
+def get_registry_stats():
+    return {**registry_stats, "endpoints": len(registered_routes)}
+
+def install_endpoint(endpoint: CompiledEndpoint):
+    registered_routes[endpoint.name] = endpoint
+    endpoint_caches.pop(endpoint.name, None)
+    if endpoint.cache_ttl:
+        register_cache(endpoint.name, endpoint.sql, endpoint.cache_ttl, endpoint.cache_size)
+
+async def register_route(
+    name: str, sql: str, db: AsyncSession,
+    sample_params: Optional[Dict[str, str]] = None, max_cost: Optional[float] = None, **options
+):
     if name in registered_routes:
         raise HTTPException(status_code=400, detail="Endpoint already exists")
 
-    path = f"/api/custom/{name}"
+    try:
+        endpoint = await compile_endpoint(name, sql, db, **options)
+        plan = await check_plan(db, endpoint, sample_params or {}, max_cost)
+    except (ValueError, DBAPIError) as e:
+        await db.rollback()
+        raise HTTPException(status_code=400, detail=f"Invalid endpoint: {e}")
+    # Drop the EXPLAIN transaction (and its SET LOCAL) before saving
+    await db.rollback()
+    endpoint = dataclasses.replace(
+        endpoint, plan_cost=plan.total_cost, plan_warnings=tuple(plan.warnings)
+    )
+
+    try:
+        await save_endpoint(db, endpoint)
+    except IntegrityError:
+        await db.rollback()
+        raise HTTPException(status_code=400, detail="Endpoint already exists")
+
+    install_endpoint(endpoint)
+    return {"message": f"Dynamic GET endpoint created at /api/custom/{name}", "plan": plan.as_dict()}
+
+@router.get("/custom/{name}")
+async def dynamic_handler(name: str, request: Request, db: AsyncSession = Depends(get_db)):
+    endpoint = registered_routes.get(name)
+    if endpoint is None:
+        raise HTTPException(status_code=404, detail=f"Endpoint '{name}' not found")
+    label = f"/api/custom/{name}"
+    request.scope[LABEL_SCOPE_KEY] = label
 
-    async def dynamic_handler(request: Request, db: Session = Depends(get_db)):
-        params: Dict[str, Any] = dict(request.query_params)
+    try:
+        params = endpoint.bind(request.query_params)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    accept = request.headers.get("accept", "")
+    export_type = negotiate_export(accept)
+    if export_type is not None:
+        if not endpoint.stream:
+            raise HTTPException(
+                status_code=406, detail=f"Endpoint '{name}' is not registered with stream=true; exports need it"
+            )
+        try:
+            wkb_columns = endpoint.geometry_columns if params.get(GEOMETRY_PARAM) == "wkb" else ()
+            body = export_stream(export_type, stream_partitions(AsyncSessionLocal, endpoint, params), wkb_columns)
+        except RuntimeError as e:
+            raise HTTPException(status_code=406, detail=str(e))
+        return StreamingResponse(body, media_type=export_type)
+
+    if wants_stream(endpoint, accept):
+        ndjson = NDJSON_MEDIA_TYPE in accept
+        return StreamingResponse(
+            stream_endpoint(AsyncSessionLocal, endpoint, params, ndjson),
+            media_type=NDJSON_MEDIA_TYPE if ndjson else JSON_MEDIA_TYPE,
+        )
+
+    cache = endpoint_caches.get(name)
+    key = cache_key(name, params)
+    # Rows are encoded once to bytes (and cached that way), bypassing jsonable_encoder
+    page = cache.get(key) if cache is not None else None
+    if page is None:
         try:
-            result = db.execute(text(sql), params)
-            return [dict(row) for row in result]
+            started = time.perf_counter()
+            # Pool checkout; a new connection or its BEGIN lands in POOL_WAIT too
+            await db.connection()
+            acquired = time.perf_counter()
+            rows, next_cursor = await fetch_page(db, endpoint, params)
+        except DBAPIError as e:
+            if getattr(e.orig, "sqlstate", None) == QUERY_CANCELED:
+                raise HTTPException(
+                    status_code=504, detail=f"Query exceeded {endpoint.statement_timeout_ms} ms statement_timeout"
+                )
+            raise HTTPException(status_code=500, detail=str(e))
         except Exception as e:
             raise HTTPException(status_code=500, detail=str(e))
+        fetched = time.perf_counter()
+        page = (dumps(rows), next_cursor)
+        POOL_WAIT.observe(acquired - started, label)
+        DB_TIME.observe(fetched - acquired, label)
+        SERIALIZE_TIME.observe(time.perf_counter() - fetched, label)
+        ROWS.observe(len(rows), label)
+        if cache is not None:
+            cache.set(key, page)
+
+    body, next_cursor = page
+    response = Response(content=body, media_type=JSON_MEDIA_TYPE)
+    if next_cursor is not None:
+        response.headers["X-Next-Cursor"] = next_cursor
+        next_url = request.url.include_query_params(**{CURSOR_PARAM: next_cursor})
+        response.headers["Link"] = f'<{next_url}>; rel="next"'
+    return response
+
+# ✅ Restore routes on startup: one bulk query, compiled from stored parameter types
+async def init_dynamic_routes():
+    await reload_dynamic_routes()
+    listener.subscribe(ENDPOINTS_CHANNEL, _on_endpoint_changed, resync=reload_dynamic_routes)
+
+async def reload_dynamic_routes():
+    started = time.perf_counter()
+    async with AsyncSessionLocal() as db:
+        endpoints = await load_endpoints(db)
+    loaded = time.perf_counter()
+
+    registered_routes.clear()
+    endpoint_caches.clear()
+    for endpoint in endpoints:
+        install_endpoint(endpoint)
+    finished = time.perf_counter()
 
-    app_or_router.add_api_route(path, dynamic_handler, methods=["GET"])
-    registered_routes[name] = sql
-    return {"message": f"Dynamic GET endpoint created at {path}"}
+    registry_stats.update(
+        restored=len(endpoints),
+        query_ms=round((loaded - started) * 1000, 2),
+        compile_ms=round((finished - loaded) * 1000, 2),
+        total_ms=round((finished - started) * 1000, 2),
+    )
+    logger.info("Restored %d dynamic endpoints in %.1f ms", len(endpoints), registry_stats["total_ms"])
 
-# ✅ Re-register routes on startup
-def init_dynamic_routes(app: FastAPI):
-    for name, sql in registered_routes.items():
-        register_route(name, sql, app)
+async def _on_endpoint_changed(name: str):
+    # Sent by whichever worker created the endpoint; every worker reloads it from the table
+    async with AsyncSessionLocal() as db:
+        endpoints = await load_endpoints(db, name)
+    if endpoints:
+        install_endpoint(endpoints[0])
+    else:
+        registered_routes.pop(name, None)
+        endpoint_caches.pop(name, None)
@@ -0,0 +1,150 @@
+from enum import Enum
+from typing import Any, Dict, List, Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
+from pydantic import BaseModel, Field
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.database import AsyncSessionLocal
+from app.models.elec_models import Meter
+from app.services.clusters import CLUSTER_LAYERS, CLUSTER_MAX_ZOOM, query_clusters
+from app.services.json_encoding import JSON_MEDIA_TYPE, dumps
+from app.services.layers import LAYERS, bbox_filter, geojson_feature, parse_bbox, select_properties
+from app.services.nearest import MAX_K, MAX_QUERY_POINTS, hit_dicts, nearest
+from app.services.spatial_snapshot import get_snapshot
+
+router = APIRouter()
+
+GEOJSON_MEDIA_TYPE = "application/geo+json"
+MAX_FEATURES = 10_000
+
+LayerName = Enum("LayerName", {name: name for name in LAYERS}, type=str)
+ClusterLayerName = Enum("ClusterLayerName", {name: name for name in CLUSTER_LAYERS}, type=str)
+
+class Feature(BaseModel):
+    type: str = "Feature"
+    id: int
+    geometry: Dict[str, Any]
+    properties: Dict[str, Any]
+
+class FeatureCollection(BaseModel):
+    type: str = "FeatureCollection"
+    features: List[Feature]
+
+class QueryPoint(BaseModel):
+    lon: float = Field(..., ge=-180, le=180)
+    lat: float = Field(..., ge=-90, le=90)
+
+class NearestRequest(BaseModel):
+    points: List[QueryPoint] = []
+    meter_ids: List[int] = []
+    k: int = Field(1, gt=0, le=MAX_K)
+    max_distance_m: Optional[float] = Field(None, gt=0)
+
+def feature_collection(features: List[str]) -> Response:
+    body = '{"type":"FeatureCollection","features":[' + ",".join(features) + "]}"
+    return Response(content=body, media_type=GEOJSON_MEDIA_TYPE)
+
+async def get_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+@router.get(
+    "/features/{layer}",
+    response_class=Response,
+    responses={200: {"model": FeatureCollection, "content": {GEOJSON_MEDIA_TYPE: {}}}},
+)
+async def get_features(
+    layer: LayerName,
+    bbox: str = Query(..., description="minx,miny,maxx,maxy in EPSG:4326"),
+    limit: int = Query(1000, gt=0, le=MAX_FEATURES),
+    properties: Optional[str] = Query(None, description="Comma-separated property columns; all when omitted"),
+    db: AsyncSession = Depends(get_db),
+):
+    """Features whose bounding box overlaps ``bbox``.
+
+    The filter is always the ``&&`` operator against a bound envelope, which the
+    GiST index on geom answers directly; callers needing exact intersection can
+    refine the (small) result client-side.
+    """
+    model = LAYERS[layer.value]
+    try:
+        box = parse_bbox(bbox)
+        columns = select_properties(model, properties)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    # The in-memory snapshot holds features with every property
+    snapshot = get_snapshot(layer.value)
+    if snapshot is not None and properties is None:
+        return feature_collection(snapshot.query_bbox(box, limit))
+
+    statement = select(geojson_feature(model, columns)).where(bbox_filter(model, box)).limit(limit)
+    return feature_collection((await db.execute(statement)).scalars().all())
+
+async def find_nearest(db: AsyncSession, layer: LayerName, request: NearestRequest):
+    points = [(p.lon, p.lat) for p in request.points]
+    if request.meter_ids:
+        rows = await db.execute(
+            select(Meter.meter_id, func.ST_X(Meter.geom), func.ST_Y(Meter.geom))
+            .where(Meter.meter_id.in_(request.meter_ids))
+        )
+        located = {meter_id: (x, y) for meter_id, x, y in rows}
+        missing = [m for m in request.meter_ids if m not in located]
+        if missing:
+            raise HTTPException(status_code=404, detail=f"Meter(s) not found: {', '.join(map(str, missing))}")
+        points += [located[m] for m in request.meter_ids]
+    if not points:
+        raise HTTPException(status_code=400, detail="Provide at least one point or meter_id")
+    if len(points) > MAX_QUERY_POINTS:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_QUERY_POINTS} query points per request")
+
+    snapshot = get_snapshot(layer.value)
+    if snapshot is not None:
+        results = [hit_dicts(snapshot.nearest(lon, lat, request.k, request.max_distance_m)) for lon, lat in points]
+    else:
+        results = await nearest(db, LAYERS[layer.value], points, request.k, request.max_distance_m)
+    body = [
+        {"lon": lon, "lat": lat, "results": hits} for (lon, lat), hits in zip(points, results)
+    ]
+    return Response(content=dumps(body), media_type=JSON_MEDIA_TYPE)
+
+@router.get("/nearest/{layer}", response_class=Response)
+async def get_nearest(
+    layer: LayerName,
+    lon: Optional[float] = Query(None, ge=-180, le=180),
+    lat: Optional[float] = Query(None, ge=-90, le=90),
+    meter_id: Optional[int] = None,
+    k: int = Query(1, gt=0, le=MAX_K),
+    max_distance_m: Optional[float] = Query(None, gt=0),
+    db: AsyncSession = Depends(get_db),
+):
+    """The ``k`` nearest features of ``layer`` to a point (lon/lat) or to a meter."""
+    if (lon is None) != (lat is None):
+        raise HTTPException(status_code=400, detail="lon and lat must be given together")
+    request = NearestRequest(
+        points=[QueryPoint(lon=lon, lat=lat)] if lon is not None else [],
+        meter_ids=[meter_id] if meter_id is not None else [],
+        k=k,
+        max_distance_m=max_distance_m,
+    )
+    return await find_nearest(db, layer, request)
+
+@router.post("/nearest/{layer}", response_class=Response)
+async def post_nearest(layer: LayerName, request: NearestRequest, db: AsyncSession = Depends(get_db)):
+    """Batch form: one result list per query point, points first, then meters, in request order."""
+    return await find_nearest(db, layer, request)
+
+@router.get("/clusters/{layer}", response_class=Response)
+async def get_clusters(
+    layer: ClusterLayerName,
+    zoom: int = Query(..., ge=0, le=CLUSTER_MAX_ZOOM),
+    bbox: str = Query(..., description="minx,miny,maxx,maxy in EPSG:4326"),
+    db: AsyncSession = Depends(get_db),
+):
+    """Precomputed point clusters for low zoom map views; above CLUSTER_MAX_ZOOM use /features."""
+    try:
+        box = parse_bbox(bbox)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    features = await query_clusters(db, layer.value, zoom, box)
+    return Response(content=dumps({"type": "FeatureCollection", "features": features}), media_type=GEOJSON_MEDIA_TYPE)
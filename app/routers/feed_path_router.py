@@ -0,0 +1,49 @@
+from enum import Enum
+from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.database import AsyncSessionLocal
+from app.services.feed_paths import FEED_PATH_CODES, descendants, get_path, parse_path
+from app.services.topology import parse_kinds
+
+router = APIRouter()
+
+FeedPathKind = Enum("FeedPathKind", {name: name for name in FEED_PATH_CODES}, type=str)
+
+async def get_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+async def _path_or_404(db: AsyncSession, kind: str, asset_id: int) -> str:
+    path = await get_path(db, kind, asset_id)
+    if path is None:
+        raise HTTPException(status_code=404, detail=f"{kind} {asset_id} has no feed path")
+    return path
+
+@router.get("/feed-paths/{kind}/{asset_id}")
+async def get_feed_path(kind: FeedPathKind, asset_id: int, db: AsyncSession = Depends(get_db)):
+    """The asset's materialized path and the assets feeding it, root first."""
+    path = await _path_or_404(db, kind.value, asset_id)
+    return {
+        "kind": kind.value,
+        "id": asset_id,
+        "path": path,
+        "ancestors": [{"kind": k, "id": i} for k, i in parse_path(path)[:-1]],
+    }
+
+@router.get("/feed-paths/{kind}/{asset_id}/descendants")
+async def get_feed_path_descendants(
+    kind: FeedPathKind,
+    asset_id: int,
+    kinds: Optional[str] = Query(None, description="Comma-separated kinds to keep, e.g. customers,meters"),
+    limit: int = Query(1000, gt=0, le=10000),
+    db: AsyncSession = Depends(get_db),
+):
+    """Everything the asset feeds, from one range scan of the path index."""
+    try:
+        kinds = parse_kinds(kinds)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    path = await _path_or_404(db, kind.value, asset_id)
+    counts, assets = await descendants(db, path, kinds, limit)
+    return {"kind": kind.value, "id": asset_id, "path": path, "counts": counts, "assets": assets}
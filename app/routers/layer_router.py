@@ -0,0 +1,45 @@
+from typing import AsyncIterator, Optional
+from fastapi import APIRouter, HTTPException, Query
+from fastapi.responses import StreamingResponse
+from sqlalchemy import select
+from app.database import AsyncSessionLocal
+from app.services.layers import bbox_filter, geojson_feature, get_layer, parse_bbox
+
+router = APIRouter()
+
+GEOJSON_MEDIA_TYPE = "application/geo+json"
+# Features fetched per round trip from the server-side cursor
+LAYER_BATCH_SIZE = 5000
+
+async def stream_feature_collection(statement) -> AsyncIterator[bytes]:
+    # Features arrive as JSON text built by PostGIS and are only joined here,
+    # so a layer of any size never materializes in Python
+    async with AsyncSessionLocal() as db:
+        result = await db.stream(statement, execution_options={"yield_per": LAYER_BATCH_SIZE})
+        yield b'{"type":"FeatureCollection","features":['
+        first = True
+        async for features in result.scalars().partitions():
+            yield (("" if first else ",") + ",".join(features)).encode()
+            first = False
+        yield b"]}"
+
+@router.get("/layers/{table}")
+async def get_layer_features(
+    table: str,
+    bbox: Optional[str] = Query(None, description="minx,miny,maxx,maxy in EPSG:4326"),
+    limit: Optional[int] = Query(None, gt=0),
+):
+    model = get_layer(table)
+    if model is None:
+        raise HTTPException(status_code=404, detail=f"Layer '{table}' not found")
+
+    statement = select(geojson_feature(model))
+    if bbox is not None:
+        try:
+            statement = statement.where(bbox_filter(model, parse_bbox(bbox)))
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    if limit is not None:
+        statement = statement.limit(limit)
+
+    return StreamingResponse(stream_feature_collection(statement), media_type=GEOJSON_MEDIA_TYPE)
@@ -0,0 +1,39 @@
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.database import AsyncSessionLocal
+from app.services.tile_cache import get_tile_cache, layers_key
+from app.services.vector_tiles import MVT_MEDIA_TYPE, render_tile, resolve_layers, select_attributes, validate_tile
+
+router = APIRouter()
+
+async def get_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+@router.get("/tiles/cache-stats")
+async def tile_cache_stats():
+    return get_tile_cache().stats()
+
+@router.get("/tiles/{layer}/{z}/{x}/{y}.pbf")
+async def get_tile(layer: str, z: int, x: int, y: int, request: Request, db: AsyncSession = Depends(get_db)):
+    """``layer`` may be one layer, a group such as ``network`` or a comma-separated list.
+
+    Attributes default per layer and can be overridden with a query param named
+    after the layer, e.g. ``?poles=pole_id,material_type``.
+    """
+    try:
+        validate_tile(z, x, y)
+        layers = [
+            (tile_layer, select_attributes(tile_layer, request.query_params.get(tile_layer.name)))
+            for tile_layer in resolve_layers(layer)
+        ]
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    # Empty tiles are cached too, so blank areas never go back to the database
+    cache = get_tile_cache()
+    key = layers_key(layers)
+    tile = await cache.render(key, z, x, y, lambda: render_tile(db, layers, z, x, y))
+    if not tile:
+        return Response(status_code=204)
+    return Response(content=tile, media_type=MVT_MEDIA_TYPE)
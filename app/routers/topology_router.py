@@ -0,0 +1,61 @@
+from enum import Enum
+from typing import Optional
+from fastapi import APIRouter, HTTPException, Query, Response
+from app.services.islands import islands
+from app.services.json_encoding import JSON_MEDIA_TYPE, dumps
+from app.services.topology import KIND_INDEX, parse_kinds, topology
+
+router = APIRouter()
+
+NodeKindName = Enum("NodeKindName", {name: name for name in KIND_INDEX}, type=str)
+
+@router.get("/topology/{kind}/{asset_id}/upstream")
+async def get_upstream(kind: NodeKindName, asset_id: int):
+    """Feed path from the asset's direct parent up to its substation."""
+    try:
+        path = topology.get().upstream(kind.value, asset_id)
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=e.args[0])
+    return {"kind": kind.value, "id": asset_id, "upstream": [{"kind": k, "id": i} for k, i in path]}
+
+@router.get("/topology/{kind}/{asset_id}/downstream")
+async def get_downstream(
+    kind: NodeKindName,
+    asset_id: int,
+    ids: Optional[str] = Query(None, description="Comma-separated kinds to list ids for, e.g. customers,meters"),
+):
+    """Counts per kind of everything the asset feeds (itself included), plus ids for the kinds asked for."""
+    graph = topology.get()
+    try:
+        kinds = parse_kinds(ids)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    try:
+        index = graph.index(kind.value, asset_id)
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=e.args[0])
+    result = {"kind": kind.value, "id": asset_id, "counts": graph.downstream_counts(index)}
+    if kinds:
+        # Id lists run to hundreds of thousands below a substation; encode them with orjson, not jsonable_encoder
+        result["ids"] = graph.group_ids(graph.subtree(index), kinds)
+        return Response(content=dumps(result), media_type=JSON_MEDIA_TYPE)
+    return result
+
+@router.get("/topology/poles/{pole_id}/island")
+async def get_island(pole_id: int, substation_id: Optional[int] = None):
+    """The pole's island of closed conductors and the substations feeding it.
+
+    With ``substation_id``, ``energized_from`` tells whether that substation is one of them.
+    """
+    graph = islands.get()
+    try:
+        result = graph.island(pole_id)
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=e.args[0])
+    if substation_id is not None:
+        result["energized_from"] = graph.energized_from(pole_id, substation_id)
+    return result
+
+@router.get("/topology/islands")
+async def get_island_stats():
+    return islands.get().stats()
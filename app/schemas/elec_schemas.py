@@ -0,0 +1,10 @@
+from typing import Optional
+from pydantic import BaseModel, Field
+
+class RcesSubstationSchema(BaseModel):
+    substation_id: Optional[int] = None
+    substation_name: str = Field(..., max_length=255)
+    voltage_level_kv: float
+    status: str = Field("Active", max_length=50)
+    lon: float = Field(..., ge=-180, le=180)
+    lat: float = Field(..., ge=-90, le=90)
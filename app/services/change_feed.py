@@ -0,0 +1,107 @@
+# app/services/change_feed.py
+"""Row-level change notifications for the network.* tables.
+
+Triggers publish one JSON payload per changed row on CHANGES_CHANNEL:
+
+    {"table": "poles", "op": "UPDATE", "id": 12,
+     "bbox": [minx, miny, maxx, maxy],   # old and new geometry together, EPSG:4326
+     "row": {...}, "old": {...}}         # columns without geom; "old" on UPDATE only
+
+Tile caches, in-memory indexes and the topology graph subscribe to it through
+app.services.notifications.listener, so they also see writes made by other
+workers and by tools outside the API.
+"""
+import hashlib
+import json
+from typing import Any, Dict
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from app.models.elec_models import (
+    Conductor, Customer, Feeder, Fuse, Meter, Pole, ServicePoint, Substation, Switch, Transformer
+)
+
+CHANGES_CHANNEL = "network_changes"
+CHANGE_MODELS = (Substation, Feeder, Transformer, Pole, Conductor, Switch, Fuse, Meter, Customer, ServicePoint)
+
+TRIGGER_FUNCTION_SQL = f"""
+CREATE OR REPLACE FUNCTION network.notify_change() RETURNS trigger
+LANGUAGE plpgsql AS $$
+DECLARE
+    row_json jsonb;
+    box box2d;
+BEGIN
+    IF TG_OP = 'DELETE' THEN row_json := to_jsonb(OLD); ELSE row_json := to_jsonb(NEW); END IF;
+    IF TG_ARGV[1] = 'geom' THEN
+        IF TG_OP = 'INSERT' THEN box := Box2D(NEW.geom);
+        ELSIF TG_OP = 'DELETE' THEN box := Box2D(OLD.geom);
+        ELSE box := Box2D(ST_Collect(OLD.geom, NEW.geom));
+        END IF;
+    END IF;
+    PERFORM pg_notify('{CHANGES_CHANNEL}', json_build_object(
+        'table', TG_TABLE_NAME,
+        'op', TG_OP,
+        'id', row_json -> TG_ARGV[0],
+        'bbox', CASE WHEN box IS NULL THEN NULL
+                     ELSE json_build_array(ST_XMin(box), ST_YMin(box), ST_XMax(box), ST_YMax(box)) END,
+        'row', row_json - 'geom',
+        'old', CASE WHEN TG_OP = 'UPDATE' THEN to_jsonb(OLD) - 'geom' END
+    )::text);
+    RETURN NULL;
+END
+$$
+"""
+
+
+def _trigger_sql(model) -> str:
+    table = model.__table__
+    pk = table.primary_key.columns.values()[0].name
+    has_geom = "geom" if "geom" in table.columns else ""
+    return (
+        f'CREATE TRIGGER notify_change AFTER INSERT OR UPDATE OR DELETE ON "{table.schema}"."{table.name}" '
+        f"FOR EACH ROW EXECUTE FUNCTION network.notify_change('{pk}', '{has_geom}')"
+    )
+
+
+async def install_triggers(conn, function: str, function_sql: str, trigger: str, triggers: Dict[str, str]) -> bool:
+    """Create ``function`` and one ``trigger`` per table (name -> CREATE TRIGGER) unless already current.
+
+    The installed version is a hash of the DDL, kept as the function's
+    comment. Callers hold an advisory lock, so the first worker to start
+    installs and the others find the version and every trigger in place, and
+    skip DROP TRIGGER and its ACCESS EXCLUSIVE lock on each table. Returns
+    whether the DDL ran.
+    """
+    version = hashlib.sha1("\n".join([function_sql, *triggers.values()]).encode()).hexdigest()
+    installed, count = (await conn.execute(
+        text(
+            "SELECT obj_description(to_regprocedure(:function), 'pg_proc'), "
+            "(SELECT count(*) FROM pg_trigger WHERE tgname = :trigger AND tgrelid IN "
+            "(SELECT to_regclass(t) FROM unnest(CAST(:tables AS text[])) AS t))"
+        ),
+        {"function": f"{function}()", "trigger": trigger, "tables": list(triggers)},
+    )).one()
+    if installed == version and count == len(triggers):
+        return False
+    await conn.execute(text(function_sql))
+    for table, sql in triggers.items():
+        await conn.execute(text(f"DROP TRIGGER IF EXISTS {trigger} ON {table}"))
+        await conn.execute(text(sql))
+    await conn.execute(text(f"COMMENT ON FUNCTION {function}() IS '{version}'"))
+    return True
+
+
+async def install_change_triggers(engine: AsyncEngine):
+    """Create (or refresh) the notify triggers; safe to run from every worker at startup."""
+    async with engine.begin() as conn:
+        # Serialise concurrent workers; all but the first find the triggers current
+        await conn.execute(text("SELECT pg_advisory_xact_lock(hashtext(:key))"), {"key": CHANGES_CHANNEL})
+        triggers = {
+            f'"{model.__table__.schema}"."{model.__table__.name}"': _trigger_sql(model) for model in CHANGE_MODELS
+        }
+        await install_triggers(conn, "network.notify_change", TRIGGER_FUNCTION_SQL, "notify_change", triggers)
+
+
+def parse_change(payload: str) -> Dict[str, Any]:
+    return json.loads(payload)
@@ -0,0 +1,245 @@
+# app/services/clusters.py
+"""Precomputed grid clusters of meters and service points for low zoom levels.
+
+At zoom z a cluster cell is CLUSTER_PIXELS wide on a 256 px tile, i.e.
+WORLD_WIDTH / 2**z / (256 / CLUSTER_PIXELS) Web Mercator metres. Every cell
+holding points is stored in network.point_clusters with its point count (and
+customer count for meters) and the mean position of its points, so a
+viewport is one primary-key range scan however many points it covers.
+
+The whole table is built in one pass per layer (admin endpoint or
+``python -m app.services.clusters``). After that, the change feed marks the cells
+touched by each edit, and ClusterRefresher recomputes only those cells in
+batches every CLUSTER_REFRESH_DELAY seconds. All workers receive the feed, so
+one of them is elected (an advisory lock on its listener connection) to do the
+refreshing; the others drop their dirty cells. A leader that dies mid-flush
+loses that batch, which the admin rebuild repairs.
+"""
+import argparse
+import asyncio
+import logging
+import math
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from sqlalchemy import func, select, text
+
+from app.models.cluster_models import PointCluster
+from app.models.elec_models import Customer, Meter, ServicePoint
+from app.services.layers import BBox
+
+logger = logging.getLogger(__name__)
+
+CLUSTER_LAYERS = {"meters": Meter, "service_points": ServicePoint}
+CLUSTER_MAX_ZOOM = 13
+CLUSTER_PIXELS = 64
+CLUSTER_REFRESH_DELAY = 2.0
+# Web Mercator half-width in metres
+ORIGIN_SHIFT = 20037508.342789244
+WORLD_WIDTH = 2 * ORIGIN_SHIFT
+
+# One writer per layer at a time; every worker sees the same change feed
+LOCK_SQL = "SELECT pg_advisory_xact_lock(hashtext('point_clusters:' || :layer))"
+
+CellRange = Tuple[int, int, int, int]
+
+
+def cell_size(zoom: int) -> float:
+    return WORLD_WIDTH / 2 ** zoom / (256 / CLUSTER_PIXELS)
+
+
+def to_mercator(lon: float, lat: float) -> Tuple[float, float]:
+    lat = max(min(lat, 85.0511287798), -85.0511287798)
+    return lon * ORIGIN_SHIFT / 180.0, math.log(math.tan((90.0 + lat) * math.pi / 360.0)) * ORIGIN_SHIFT / math.pi
+
+
+def cell_range(bbox: BBox, zoom: int) -> CellRange:
+    size = cell_size(zoom)
+    minx, miny = to_mercator(bbox[0], bbox[1])
+    maxx, maxy = to_mercator(bbox[2], bbox[3])
+    return (math.floor(minx / size), math.floor(miny / size), math.floor(maxx / size), math.floor(maxy / size))
+
+
+def _cluster_select(layer: str, zoom_sql: str, where: str = "", zoom_source: str = "") -> str:
+    """SELECT producing point_clusters rows for the zoom(s) given by ``zoom_sql``."""
+    model = CLUSTER_LAYERS[layer]
+    table = model.__table__
+    customers = "NULL::bigint"
+    join = ""
+    if model is Meter:
+        ct = f'"{Customer.__table__.schema}"."{Customer.__table__.name}"'
+        if where:
+            # A few cells: look customers up per meter rather than aggregating them all
+            customers = f"(SELECT count(*) FROM {ct} AS c WHERE c.meter_id = t.meter_id)"
+        else:
+            customers = "coalesce(c.customers, 0)"
+            join = (
+                f"LEFT JOIN (SELECT meter_id, count(*) AS customers FROM {ct} "
+                f"GROUP BY meter_id) AS c ON c.meter_id = t.meter_id "
+            )
+    # Points are projected once, then bucketed for every zoom
+    return (
+        f"SELECT '{layer}' AS layer, grid.z AS zoom, floor(ST_X(p) / grid.size)::int AS cell_x, "
+        f"floor(ST_Y(p) / grid.size)::int AS cell_y, count(*) AS point_count, sum(customers) AS customer_count, "
+        f"avg(lon) AS lon, avg(lat) AS lat "
+        f"FROM (SELECT ST_Transform(t.geom, 3857) AS p, ST_X(t.geom) AS lon, ST_Y(t.geom) AS lat, "
+        f'{customers} AS customers FROM "{table.schema}"."{table.name}" AS t {join}{where}) AS points '
+        f"{zoom_source} CROSS JOIN LATERAL (SELECT {zoom_sql} AS z, "
+        f"{WORLD_WIDTH} / (2 ^ {zoom_sql}) / {256 // CLUSTER_PIXELS} AS size) AS grid "
+        f"GROUP BY grid.z, cell_x, cell_y"
+    )
+
+
+def _insert_sql(select_sql: str) -> str:
+    table = PointCluster.__table__
+    return (
+        f'INSERT INTO "{table.schema}"."{table.name}" '
+        f"(layer, zoom, cell_x, cell_y, point_count, customer_count, lon, lat) {select_sql}"
+    )
+
+
+async def rebuild_clusters(session_factory, layer: str) -> int:
+    """Recompute every zoom of ``layer`` in one scan of the source table."""
+    table = PointCluster.__table__
+    zooms = f"generate_series(0, {CLUSTER_MAX_ZOOM})"
+    async with session_factory() as db:
+        await db.execute(text(LOCK_SQL), {"layer": layer})
+        await db.execute(text(f'DELETE FROM "{table.schema}"."{table.name}" WHERE layer = :layer'), {"layer": layer})
+        select_sql = _cluster_select(layer, "zooms.z", zoom_source=f"CROSS JOIN {zooms} AS zooms(z)")
+        result = await db.execute(text(_insert_sql(select_sql)))
+        await db.commit()
+    return result.rowcount
+
+
+async def refresh_cells(session_factory, layer: str, cells: Dict[int, Set[Tuple[int, int]]]):
+    """Recompute the given cells (zoom -> {(cell_x, cell_y)}), deleting those left empty."""
+    table = PointCluster.__table__
+    async with session_factory() as db:
+        await db.execute(text(LOCK_SQL), {"layer": layer})
+        for zoom, keys in cells.items():
+            xs = [x for x, _ in keys]
+            ys = [y for _, y in keys]
+            cell_params = {"xs": xs, "ys": ys}
+            dirty = "(cell_x, cell_y) IN (SELECT * FROM unnest(CAST(:xs AS int[]), CAST(:ys AS int[])))"
+            # One envelope per dirty cell; && ANY(...) runs as a bitmap scan of the GiST index
+            # Left untyped, :size next to the int cell numbers is inferred as int4 and truncated
+            size = "CAST(:size AS float8)"
+            envelopes = (
+                "WHERE t.geom && ANY(ARRAY(SELECT ST_Transform(ST_MakeEnvelope("
+                f"d.x * {size}, d.y * {size}, (d.x + 1) * {size}, (d.y + 1) * {size}, 3857), 4326) "
+                "FROM unnest(CAST(:xs AS int[]), CAST(:ys AS int[])) AS d(x, y)))"
+            )
+            await db.execute(
+                text(f'DELETE FROM "{table.schema}"."{table.name}" WHERE layer = :layer AND zoom = :zoom AND {dirty}'),
+                {"layer": layer, "zoom": zoom, **cell_params},
+            )
+            select_sql = _cluster_select(layer, "CAST(:zoom AS int)", envelopes)
+            await db.execute(
+                text(_insert_sql(f"SELECT * FROM ({select_sql}) AS fresh WHERE {dirty}")),
+                {"zoom": zoom, "size": cell_size(zoom), **cell_params},
+            )
+        await db.commit()
+
+
+async def query_clusters(db, layer: str, zoom: int, bbox: BBox) -> List[Dict[str, Any]]:
+    x0, y0, x1, y1 = cell_range(bbox, zoom)
+    rows = await db.execute(
+        select(PointCluster.lon, PointCluster.lat, PointCluster.point_count, PointCluster.customer_count)
+        .where(PointCluster.layer == layer, PointCluster.zoom == zoom)
+        .where(PointCluster.cell_x.between(x0, x1), PointCluster.cell_y.between(y0, y1))
+    )
+    features = []
+    for lon, lat, count, customers in rows:
+        properties = {"count": count}
+        if customers is not None:
+            properties["customers"] = customers
+        features.append({"type": "Feature", "geometry": {"type": "Point", "coordinates": [lon, lat]},
+                         "properties": properties})
+    return features
+
+
+class ClusterRefresher:
+    """Collects cells dirtied by the change feed and refreshes them in batches."""
+
+    def __init__(
+        self, session_factory, delay: float = CLUSTER_REFRESH_DELAY,
+        leader: Optional[Callable[[], Awaitable[bool]]] = None,
+    ):
+        self.session_factory = session_factory
+        self.delay = delay
+        # Every worker sees the same change feed; only the leader refreshes
+        self.leader = leader
+        self._dirty: Dict[str, Dict[int, Set[Tuple[int, int]]]] = {}
+        self._meter_ids: Set[int] = set()
+        self._task: Optional[asyncio.Task] = None
+
+    def mark_points(self, layer: str, points: Iterable[Tuple[float, float]]):
+        zooms = self._dirty.setdefault(layer, {})
+        for lon, lat in points:
+            for zoom in range(CLUSTER_MAX_ZOOM + 1):
+                x, y, _, _ = cell_range((lon, lat, lon, lat), zoom)
+                zooms.setdefault(zoom, set()).add((x, y))
+        self._schedule()
+
+    def mark_meters(self, meter_ids: Iterable[int]):
+        # Customer edits change customer_count in their meter's cells
+        self._meter_ids.update(i for i in meter_ids if i is not None)
+        self._schedule()
+
+    def handle_change(self, change: Dict[str, Any]):
+        table = change["table"]
+        if table in CLUSTER_LAYERS and change.get("bbox"):
+            # The layers are points, so the old and new positions are opposite
+            # corners of the change bbox; marking all four covers both
+            minx, miny, maxx, maxy = change["bbox"]
+            self.mark_points(table, [(minx, miny), (minx, maxy), (maxx, miny), (maxx, maxy)])
+        elif table == Customer.__tablename__:
+            rows = (change.get("row") or {}, change.get("old") or {})
+            self.mark_meters(row.get("meter_id") for row in rows)
+
+    def _schedule(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.ensure_future(self._flush_later())
+
+    async def _flush_later(self):
+        await asyncio.sleep(self.delay)
+        try:
+            await self.flush()
+        except Exception:
+            logger.exception("Cluster refresh failed")
+        # Changes that arrived while flushing get their own round
+        self._task = None
+        if self._dirty or self._meter_ids:
+            self._schedule()
+
+    async def flush(self):
+        if self.leader is not None and not await self.leader():
+            self._meter_ids, self._dirty = set(), {}
+            return
+        meter_ids, self._meter_ids = self._meter_ids, set()
+        if meter_ids:
+            async with self.session_factory() as db:
+                points = await db.execute(
+                    select(func.ST_X(Meter.geom), func.ST_Y(Meter.geom)).where(Meter.meter_id.in_(meter_ids))
+                )
+                self.mark_points(Meter.__tablename__, points.all())
+        dirty, self._dirty = self._dirty, {}
+        for layer, cells in dirty.items():
+            await refresh_cells(self.session_factory, layer, cells)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rebuild the precomputed point clusters")
+    parser.add_argument("layers", nargs="*", default=list(CLUSTER_LAYERS), choices=list(CLUSTER_LAYERS))
+    args = parser.parse_args()
+
+    from app.database import AsyncSessionLocal
+
+    async def run():
+        for layer in args.layers:
+            print(f"{layer}: {await rebuild_clusters(AsyncSessionLocal, layer)} cluster cells")
+
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    main()
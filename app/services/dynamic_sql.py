@@ -0,0 +1,362 @@
+# app/services/dynamic_sql.py
+import base64
+import binascii
+import re
+import uuid
+from dataclasses import dataclass, field, fields
+from datetime import date, datetime, time
+from decimal import Decimal
+from typing import Any, AsyncIterator, Callable, Dict, List, Mapping, Optional, Tuple
+
+import asyncpg
+from sqlalchemy import Boolean, Date, DateTime, Float, Integer, Numeric, String, Time, Uuid, bindparam, text
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.sql.elements import TextClause
+from sqlalchemy.types import NullType, TypeEngine
+
+from app.services.json_encoding import dumps
+
+# Same pattern text() uses to find :name binds, so "::type" casts are left alone
+BIND_PARAM_RE = re.compile(r"(?<![:\w\\]):(\w+)(?!:)")
+ENDPOINT_NAME_RE = re.compile(r"^[A-Za-z0-9_\-]+$")
+COLUMN_NAME_RE = re.compile(r"^\w+$")
+
+# Query parameters handled by the dispatcher itself rather than bound into the SQL
+CURSOR_PARAM = "cursor"
+LIMIT_PARAM = "limit"
+GEOMETRY_PARAM = "geom_format"
+RESERVED_PARAMS = (CURSOR_PARAM, LIMIT_PARAM, GEOMETRY_PARAM)
+DEFAULT_MAX_ROWS = 10000
+DEFAULT_STATEMENT_TIMEOUT_MS = 30000
+
+# Binary geometry output selected with ?geom_format=: asyncpg hands bytea back
+# as plain bytes, so no per-row wrapper objects are built. TWKB is quantized to
+# TWKB_PRECISION decimals (7 is ~1 cm in EPSG:4326) and is several times smaller.
+GEOMETRY_TYPES = ("geometry", "geography")
+TWKB_PRECISION = 7
+GEOMETRY_FORMATS = {
+    "wkb": "ST_AsBinary(page.\"{}\")",
+    "twkb": f"ST_AsTWKB(page.\"{{}}\"::geometry, {TWKB_PRECISION})",
+}
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+# Rows fetched per round trip from the server-side cursor when streaming
+STREAM_BATCH_SIZE = 2000
+
+
+def _parse_bool(value: str) -> bool:
+    lowered = value.lower()
+    if lowered in ("true", "t", "1", "yes"):
+        return True
+    if lowered in ("false", "f", "0", "no"):
+        return False
+    raise ValueError(f"invalid boolean '{value}'")
+
+
+# PostgreSQL parameter type -> (SQLAlchemy bind type, query string converter).
+# asyncpg encodes parameters in binary, so values must already have the right Python type.
+PG_PARAM_TYPES: Dict[str, Tuple[TypeEngine, Callable[[str], Any]]] = {
+    "int2": (Integer(), int),
+    "int4": (Integer(), int),
+    "int8": (Integer(), int),
+    "numeric": (Numeric(), Decimal),
+    "float4": (Float(), float),
+    "float8": (Float(), float),
+    "bool": (Boolean(), _parse_bool),
+    "date": (Date(), date.fromisoformat),
+    "time": (Time(), time.fromisoformat),
+    "timestamp": (DateTime(), datetime.fromisoformat),
+    "timestamptz": (DateTime(timezone=True), datetime.fromisoformat),
+    "text": (String(), str),
+    "varchar": (String(), str),
+    "bpchar": (String(), str),
+    "uuid": (Uuid(), uuid.UUID),
+}
+
+# Order key value -> cursor text, the inverse of the converter above for types
+# whose str() it does not read back exactly; others use str()
+CURSOR_FORMATS: Dict[str, Callable[[Any], str]] = {
+    "float4": repr,
+    "float8": repr,
+    "bool": lambda value: "true" if value else "false",
+    "date": date.isoformat,
+    "time": time.isoformat,
+    "timestamp": datetime.isoformat,
+    "timestamptz": datetime.isoformat,
+}
+
+
+CORE_FIELDS = (
+    "name", "sql", "statement", "param_names", "param_types", "first_page", "next_page", "geometry_pages"
+)
+
+
+@dataclass(frozen=True)
+class CompiledEndpoint:
+    name: str
+    sql: str
+    statement: TextClause
+    param_names: Tuple[str, ...]
+    param_types: Tuple[str, ...]
+    # statement wrapped with keyset ordering and LIMIT, for the first and following pages
+    first_page: TextClause
+    next_page: Optional[TextClause]
+    # (first_page, next_page) per GEOMETRY_FORMATS entry, geometry columns re-encoded
+    geometry_pages: Dict[str, Tuple[TextClause, Optional[TextClause]]] = field(default_factory=dict)
+    stream: bool = False
+    cache_ttl: Optional[float] = None
+    cache_size: int = 256
+    order_key: Optional[str] = None
+    order_key_type: Optional[str] = None
+    max_rows: int = DEFAULT_MAX_ROWS
+    statement_timeout_ms: int = DEFAULT_STATEMENT_TIMEOUT_MS
+    # Planner estimate and warnings recorded at registration
+    plan_cost: Optional[float] = None
+    plan_warnings: Tuple[str, ...] = ()
+    # Result columns in order and the geometry ones among them, recorded at registration
+    columns: Tuple[str, ...] = ()
+    geometry_columns: Tuple[str, ...] = ()
+
+    def options(self) -> Dict[str, Any]:
+        return {f.name: getattr(self, f.name) for f in fields(self) if f.name not in CORE_FIELDS}
+
+    def bind(self, query_params: Mapping[str, str], allow_missing: bool = False) -> Dict[str, Any]:
+        """Convert query parameters to bind values.
+
+        ``max_rows`` is bound as the LIMIT of every statement run for a
+        request, paged, streamed or exported alike.
+        """
+        unknown = sorted(set(query_params) - set(self.param_names) - set(RESERVED_PARAMS))
+        if unknown:
+            raise ValueError(f"Unknown query parameter(s): {', '.join(unknown)}")
+        missing = [n for n in self.param_names if n not in query_params]
+        if missing and not allow_missing:
+            raise ValueError(f"Missing query parameter(s): {', '.join(missing)}")
+
+        params: Dict[str, Any] = {name: None for name in missing}
+        for name, pg_type in zip(self.param_names, self.param_types):
+            if name in missing:
+                continue
+            convert = PG_PARAM_TYPES.get(pg_type, (None, str))[1]
+            try:
+                params[name] = convert(query_params[name])
+            except (ValueError, ArithmeticError):
+                raise ValueError(f"Query parameter '{name}' must be of type {pg_type}")
+
+        try:
+            params[LIMIT_PARAM] = int(query_params.get(LIMIT_PARAM, self.max_rows))
+        except ValueError:
+            raise ValueError(f"Query parameter '{LIMIT_PARAM}' must be an integer")
+        if not 0 < params[LIMIT_PARAM] <= self.max_rows:
+            raise ValueError(f"Query parameter '{LIMIT_PARAM}' must be between 1 and {self.max_rows}")
+
+        if CURSOR_PARAM in query_params:
+            if self.next_page is None:
+                raise ValueError(f"Endpoint '{self.name}' has no order_key to page on")
+            params[CURSOR_PARAM] = self._decode_cursor(query_params[CURSOR_PARAM])
+
+        if GEOMETRY_PARAM in query_params:
+            geom_format = query_params[GEOMETRY_PARAM]
+            if geom_format not in GEOMETRY_FORMATS:
+                raise ValueError(
+                    f"Query parameter '{GEOMETRY_PARAM}' must be one of: {', '.join(GEOMETRY_FORMATS)}"
+                )
+            if not self.geometry_columns:
+                raise ValueError(f"Endpoint '{self.name}' has no geometry columns")
+            params[GEOMETRY_PARAM] = geom_format
+        return params
+
+    def page_statement(self, params: Dict[str, Any]) -> TextClause:
+        default = (self.first_page, self.next_page)
+        first_page, next_page = self.geometry_pages.get(params.get(GEOMETRY_PARAM), default)
+        return next_page if CURSOR_PARAM in params else first_page
+
+    def encode_cursor(self, row) -> str:
+        value = CURSOR_FORMATS.get(self.order_key_type, str)(row._mapping[self.order_key])
+        return base64.urlsafe_b64encode(value.encode()).decode()
+
+    def _decode_cursor(self, cursor: str) -> Any:
+        convert = PG_PARAM_TYPES.get(self.order_key_type, (None, str))[1]
+        try:
+            return convert(base64.urlsafe_b64decode(cursor.encode()).decode())
+        except (ValueError, ArithmeticError, binascii.Error):
+            raise ValueError(f"Invalid {CURSOR_PARAM}")
+
+
+def _param_names(sql: str) -> Tuple[str, ...]:
+    names = []
+    for name in BIND_PARAM_RE.findall(sql):
+        if name not in names:
+            names.append(name)
+    return tuple(names)
+
+
+def _to_positional(sql: str, names: Tuple[str, ...]) -> str:
+    positions = {name: i + 1 for i, name in enumerate(names)}
+    return BIND_PARAM_RE.sub(lambda m: f"${positions[m.group(1)]}", sql)
+
+
+async def _introspect(db: AsyncSession, sql: str) -> Tuple[Tuple[str, ...], Dict[str, str]]:
+    """Return the parameter types and result column types PostgreSQL infers for ``sql``."""
+    connection = await db.connection()
+    raw = await connection.get_raw_connection()
+    try:
+        prepared = await raw.driver_connection.prepare(sql)
+    except (asyncpg.PostgresError, asyncpg.InterfaceError) as e:
+        raise ValueError(str(e))
+    param_types = tuple(t.name for t in prepared.get_parameters())
+    column_types = {a.name: a.type.name for a in prepared.get_attributes()}
+    return param_types, column_types
+
+
+async def compile_endpoint(name: str, sql: str, db: AsyncSession, **options) -> CompiledEndpoint:
+    """Parse, prepare and type-check ``sql`` once so requests only bind and execute."""
+    if not ENDPOINT_NAME_RE.match(name):
+        raise ValueError("Endpoint name may only contain letters, digits, '_' and '-'")
+    sql = sql.strip().rstrip(";")
+    reserved = set(_param_names(sql)) & set(RESERVED_PARAMS)
+    if reserved:
+        raise ValueError(f"Bind parameter name(s) reserved for paging: {', '.join(sorted(reserved))}")
+
+    # Let PostgreSQL infer parameter types; invalid SQL fails here instead of per request
+    param_types, column_types = await _introspect(db, _to_positional(sql, _param_names(sql)))
+
+    order_key = options.get("order_key")
+    if order_key is not None:
+        if not COLUMN_NAME_RE.match(order_key) or order_key not in column_types:
+            raise ValueError(f"order_key '{order_key}' is not a column of the query result")
+        options["order_key_type"] = column_types[order_key]
+    options["columns"] = tuple(column_types)
+    options["geometry_columns"] = tuple(c for c, t in column_types.items() if t in GEOMETRY_TYPES)
+    return build_endpoint(name, sql, param_types, **options)
+
+
+def build_endpoint(name: str, sql: str, param_types: Tuple[str, ...], **options) -> CompiledEndpoint:
+    names = _param_names(sql)
+    binds = [
+        bindparam(n, type_=PG_PARAM_TYPES.get(t, (NullType(), str))[0])
+        for n, t in zip(names, param_types)
+    ]
+    limit = bindparam(LIMIT_PARAM, type_=Integer())
+    order_key = options.get("order_key")
+    cursor = bindparam(
+        CURSOR_PARAM, type_=PG_PARAM_TYPES.get(options.get("order_key_type"), (NullType(), str))[0]
+    )
+
+    # Keyset paging: every page is an index range scan on the key, however deep,
+    # and LIMIT caps the rows in the database rather than after the fetch
+    def pages(select_list: str) -> Tuple[TextClause, Optional[TextClause]]:
+        if order_key is None:
+            first_page = text(f"SELECT {select_list} FROM ({sql}) AS page LIMIT :{LIMIT_PARAM}")
+            return first_page.bindparams(*binds, limit), None
+        first_page = text(
+            f'SELECT {select_list} FROM ({sql}) AS page ORDER BY page."{order_key}" LIMIT :{LIMIT_PARAM}'
+        )
+        next_page = text(
+            f'SELECT {select_list} FROM ({sql}) AS page WHERE page."{order_key}" > :{CURSOR_PARAM} '
+            f'ORDER BY page."{order_key}" LIMIT :{LIMIT_PARAM}'
+        )
+        return first_page.bindparams(*binds, limit), next_page.bindparams(*binds, limit, cursor)
+
+    for key in ("plan_warnings", "columns", "geometry_columns"):
+        if key in options:
+            options[key] = tuple(options[key])
+    first_page, next_page = pages("*")
+    geometry_pages = {}
+    geometry_columns = options.get("geometry_columns", ())
+    if geometry_columns:
+        for geom_format, encode in GEOMETRY_FORMATS.items():
+            select_list = ", ".join(
+                f'{encode.format(c)} AS "{c}"' if c in geometry_columns else f'page."{c}"'
+                for c in options["columns"]
+            )
+            geometry_pages[geom_format] = pages(select_list)
+
+    return CompiledEndpoint(
+        name=name,
+        sql=sql,
+        statement=text(sql).bindparams(*binds),
+        param_names=names,
+        param_types=param_types,
+        first_page=first_page,
+        next_page=next_page,
+        geometry_pages=geometry_pages,
+        **options,
+    )
+
+
+async def apply_statement_timeout(db: AsyncSession, endpoint: CompiledEndpoint):
+    # SET LOCAL lasts until the end of the request's transaction only
+    await db.execute(text(f"SET LOCAL statement_timeout = {int(endpoint.statement_timeout_ms)}"))
+
+
+async def fetch_page(
+    db: AsyncSession, endpoint: CompiledEndpoint, params: Dict[str, Any]
+) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """Run one page of the endpoint and return its rows and the cursor for the next page."""
+    limit = params[LIMIT_PARAM]
+    # asyncpg keeps a server-side prepared statement per pooled connection, keyed on
+    # the compiled SQL, so repeat calls skip parse/plan. One extra row tells us
+    # whether another page exists.
+    await apply_statement_timeout(db, endpoint)
+    result = await db.execute(endpoint.page_statement(params), {**params, LIMIT_PARAM: limit + 1})
+    keys = tuple(result.keys())
+    rows = result.all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        if endpoint.order_key is not None:
+            next_cursor = endpoint.encode_cursor(rows[-1])
+    return [dict(zip(keys, row)) for row in rows], next_cursor
+
+
+def wants_stream(endpoint: CompiledEndpoint, accept: str) -> bool:
+    return endpoint.stream or NDJSON_MEDIA_TYPE in accept
+
+
+async def stream_partitions(
+    session_factory, endpoint: CompiledEndpoint, params: Dict[str, Any]
+) -> AsyncIterator[Tuple[List[str], List[Any]]]:
+    """Yield ``(column names, rows)`` batches from a server-side cursor.
+
+    At least one (possibly empty) batch is yielded so callers always learn the
+    columns. The generator owns its session because a response body outlives
+    the request dependencies.
+    """
+    async with session_factory() as db:
+        await apply_statement_timeout(db, endpoint)
+        result = await db.stream(
+            endpoint.page_statement(params), params, execution_options={"yield_per": STREAM_BATCH_SIZE}
+        )
+        columns = list(result.keys())
+        empty = True
+        async for rows in result.partitions():
+            empty = False
+            yield columns, rows
+        if empty:
+            yield columns, []
+
+
+async def stream_endpoint(
+    session_factory, endpoint: CompiledEndpoint, params: Dict[str, Any], ndjson: bool
+) -> AsyncIterator[bytes]:
+    """Yield the result as NDJSON lines or one chunked JSON array.
+
+    Rows are encoded one batch at a time, so memory stays flat however many
+    rows the query returns.
+    """
+    first = True
+    if not ndjson:
+        yield b"["
+    async for columns, rows in stream_partitions(session_factory, endpoint, params):
+        if not rows:
+            continue
+        records = [dict(zip(columns, row)) for row in rows]
+        if ndjson:
+            yield b"\n".join(dumps(record) for record in records) + b"\n"
+        else:
+            # Encode the whole batch as one array and drop its brackets
+            yield (b"" if first else b",") + dumps(records)[1:-1]
+        first = False
+    if not ndjson:
+        yield b"]"
@@ -0,0 +1,41 @@
+# app/services/endpoint_registry.py
+from typing import List, Optional
+
+from sqlalchemy import select, text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models.endpoint_models import DynamicEndpoint
+from app.services.dynamic_sql import CompiledEndpoint, build_endpoint
+
+# Workers LISTEN here and reload the endpoint named in the payload
+ENDPOINTS_CHANNEL = "dynamic_endpoints"
+
+
+async def save_endpoint(db: AsyncSession, endpoint: CompiledEndpoint):
+    db.add(DynamicEndpoint(
+        name=endpoint.name,
+        sql=endpoint.sql,
+        param_types=list(endpoint.param_types),
+        options=endpoint.options(),
+    ))
+    await db.flush()
+    # Delivered on commit, so other workers never see an uncommitted endpoint
+    await db.execute(
+        text("SELECT pg_notify(:channel, :name)"),
+        {"channel": ENDPOINTS_CHANNEL, "name": endpoint.name},
+    )
+    await db.commit()
+
+
+async def load_endpoints(db: AsyncSession, name: Optional[str] = None) -> List[CompiledEndpoint]:
+    """Fetch endpoints in one query and compile them without further round trips."""
+    query = select(
+        DynamicEndpoint.name, DynamicEndpoint.sql, DynamicEndpoint.param_types, DynamicEndpoint.options
+    )
+    if name is not None:
+        query = query.where(DynamicEndpoint.name == name)
+    rows = (await db.execute(query)).all()
+    return [
+        build_endpoint(row.name, row.sql, tuple(row.param_types), **row.options)
+        for row in rows
+    ]
@@ -0,0 +1,184 @@
+# app/services/export_formats.py
+"""Columnar exports (Arrow IPC stream, Parquet, CSV) for dynamic endpoint results.
+
+Batches come straight from the server-side cursor as row tuples and are
+transposed into columns, so no per-row dicts are built. Arrow and Parquet need
+the optional ``pyarrow`` package; CSV works without it.
+
+Geometry requested as WKB (``?geom_format=wkb``) becomes an Arrow binary column
+tagged with the ``geoarrow.wkb`` extension name, so readers such as GeoPandas
+decode the whole column at once (``shapely.from_wkb(column.to_numpy(False))``)
+instead of one geometry object per row. CSV writes binary values as hex.
+"""
+import csv
+import io
+from decimal import Decimal
+from typing import Any, AsyncIterator, List, Optional, Sequence, Tuple
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # optional dependency
+    pa = None
+    pq = None
+
+ARROW_MEDIA_TYPE = "application/vnd.apache.arrow.stream"
+PARQUET_MEDIA_TYPE = "application/vnd.apache.parquet"
+CSV_MEDIA_TYPE = "text/csv"
+EXPORT_MEDIA_TYPES = (ARROW_MEDIA_TYPE, PARQUET_MEDIA_TYPE, CSV_MEDIA_TYPE)
+
+Batches = AsyncIterator[Tuple[List[str], List[Any]]]
+GEOARROW_WKB = {b"ARROW:extension:name": b"geoarrow.wkb", b"ARROW:extension:metadata": b"{}"}
+
+
+def _accept_entries(accept: str) -> List[Tuple[str, float]]:
+    """(media type, q) for each media range of an Accept header."""
+    entries = []
+    for part in accept.split(","):
+        media_type, *params = [p.strip() for p in part.split(";")]
+        q = 1.0
+        for param in params:
+            if param.lower().startswith("q="):
+                try:
+                    q = float(param[2:])
+                except ValueError:
+                    q = 0.0
+        if media_type:
+            entries.append((media_type.lower(), q))
+    return entries
+
+
+def negotiate_export(accept: str) -> Optional[str]:
+    """The export format the client prefers, or None if it prefers JSON (or anything else)."""
+    entries = _accept_entries(accept)
+    exports = [(q, -i, m) for i, (m, q) in enumerate(entries) if m in EXPORT_MEDIA_TYPES and q > 0]
+    if not exports:
+        return None
+    q, _, media_type = max(exports)
+    if any(other_q > q for m, other_q in entries if m not in EXPORT_MEDIA_TYPES):
+        return None
+    return media_type
+
+
+class _ChunkSink(io.RawIOBase):
+    """Write-only file that hands back what was written since the last drain.
+
+    tell() keeps counting across drains because the Parquet writer records
+    absolute column chunk offsets in the footer.
+    """
+
+    def __init__(self):
+        self._chunks: List[bytes] = []
+        self._position = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        data = bytes(data)
+        self._chunks.append(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def _column(values, type_=None):
+    first = next((v for v in values if v is not None), None)
+    if isinstance(first, Decimal):
+        # Unconstrained numeric columns would infer a different decimal128(p, s)
+        # from every batch, so they are exported as float64 throughout
+        values = [None if v is None else float(v) for v in values]
+        type_ = type_ or pa.float64()
+    try:
+        return pa.array(values, type=type_, from_pandas=False)
+    except (pa.ArrowInvalid, pa.ArrowTypeError, TypeError, OverflowError):
+        if type_ is not None and not pa.types.is_string(type_):
+            # The schema is pinned by the first batch; later batches must match it
+            return pa.array(values, from_pandas=False).cast(type_, safe=False)
+        # Types pyarrow cannot infer (geometry wrappers, ranges, ...) go out as text
+        return pa.array([None if v is None else str(v) for v in values], type=pa.string())
+
+
+def _record_batch(columns: List[str], rows: List[Any], schema=None, wkb_columns: Sequence[str] = ()):
+    values = list(zip(*rows)) if rows else [()] * len(columns)
+    if schema is None:
+        arrays = [_column(col, pa.binary() if name in wkb_columns else None) for name, col in zip(columns, values)]
+        # An all-NULL first batch would otherwise pin the column to the null type
+        arrays = [a.cast(pa.string()) if pa.types.is_null(a.type) else a for a in arrays]
+        return pa.RecordBatch.from_arrays(arrays, names=columns)
+    arrays = [_column(col, field.type) for col, field in zip(values, schema)]
+    return pa.RecordBatch.from_arrays(arrays, schema=schema)
+
+
+def _tag_wkb(batch, wkb_columns: Sequence[str]):
+    if not wkb_columns:
+        return batch
+    schema = pa.schema([
+        f.with_metadata(GEOARROW_WKB) if f.name in wkb_columns and pa.types.is_binary(f.type) else f
+        for f in batch.schema
+    ])
+    return pa.RecordBatch.from_arrays(batch.columns, schema=schema)
+
+
+async def _arrow_stream(batches: Batches, wkb_columns: Sequence[str]) -> AsyncIterator[bytes]:
+    sink = _ChunkSink()
+    writer = schema = None
+    async for columns, rows in batches:
+        batch = _record_batch(columns, rows, schema, wkb_columns)
+        if writer is None:
+            batch = _tag_wkb(batch, wkb_columns)
+            schema = batch.schema
+            writer = pa.ipc.new_stream(pa.PythonFile(sink, mode="w"), schema)
+        writer.write_batch(batch)
+        yield sink.drain()
+    writer.close()
+    yield sink.drain()
+
+
+async def _parquet_stream(batches: Batches, wkb_columns: Sequence[str]) -> AsyncIterator[bytes]:
+    sink = _ChunkSink()
+    writer = schema = None
+    async for columns, rows in batches:
+        batch = _record_batch(columns, rows, schema, wkb_columns)
+        if writer is None:
+            batch = _tag_wkb(batch, wkb_columns)
+            schema = batch.schema
+            writer = pq.ParquetWriter(pa.PythonFile(sink, mode="w"), schema)
+        # One row group per cursor batch keeps the writer's buffer bounded
+        writer.write_batch(batch)
+        yield sink.drain()
+    writer.close()
+    yield sink.drain()
+
+
+async def _csv_stream(batches: Batches) -> AsyncIterator[bytes]:
+    buffer = io.StringIO()
+    out = csv.writer(buffer)
+    header = True
+    async for columns, rows in batches:
+        if header:
+            out.writerow(columns)
+            header = False
+        # Binary values (WKB/TWKB geometry, bytea) go out as hex. Checked per value: a column
+        # whose first batch is all NULL can still hold bytes later
+        out.writerows([v.hex() if isinstance(v, (bytes, memoryview)) else v for v in row] for row in rows)
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+
+
+def export_stream(media_type: str, batches: Batches, wkb_columns: Sequence[str] = ()) -> AsyncIterator[bytes]:
+    if media_type == CSV_MEDIA_TYPE:
+        return _csv_stream(batches)
+    if pa is None:
+        raise RuntimeError(f"{media_type} export requires the optional 'pyarrow' package")
+    if media_type == ARROW_MEDIA_TYPE:
+        return _arrow_stream(batches, wkb_columns)
+    return _parquet_stream(batches, wkb_columns)
@@ -0,0 +1,205 @@
+# app/services/feed_paths.py
+"""Materialized feed paths: every asset's chain of feeding assets in one column.
+
+network.feed_paths holds one row per asset with its path from the root of the
+hierarchy, one segment per level, e.g. a customer's path is
+
+    S3/F12/T408/P9120/M51007/C88120
+
+(substation 3, feeder 12, ...). Assets without a parent start a path of their
+own. With the path column in the "C" collation:
+
+* ancestors are a primary-key lookup of one row, then a split on '/'
+* a subtree is one range scan of the path index: everything below ``p`` sorts
+  in [p || '/', p || '0'), since '0' is the character after '/'
+
+Row triggers on the hierarchy tables keep the table current for every writer,
+the API or not: an insert adds a row under its parent's path, and re-parenting
+an asset rewrites its row and the prefix of all its descendants with one
+range UPDATE. Writers serialise on the feed_paths rows: an insert reads its
+parent's path FOR SHARE, and a re-parent locks its own row and then the rows
+below it FOR UPDATE before rewriting them, so no row is written under a path
+that is being replaced. ``python -m app.services.feed_paths`` (or the admin endpoint)
+rebuilds the table set-wise, one INSERT ... SELECT per level.
+"""
+import argparse
+import asyncio
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from app.models.feed_path_models import FeedPath
+from app.services.change_feed import install_triggers
+from app.services.layers import primary_key
+from app.services.topology import NODE_KINDS
+
+FEED_PATH_CODES = {
+    "substations": "S",
+    "feeders": "F",
+    "transformers": "T",
+    "poles": "P",
+    "meters": "M",
+    "customers": "C",
+    "service_points": "V",
+}
+CODE_KINDS = {code: kind for kind, code in FEED_PATH_CODES.items()}
+FEED_PATH_TABLES = frozenset(FEED_PATH_CODES)
+FEED_PATH_TABLE = f'"{FeedPath.__table__.schema}"."{FeedPath.__table__.name}"'
+# Rebuilds and trigger installs from several workers queue up behind each other
+LOCK_SQL = "SELECT pg_advisory_xact_lock(hashtext('feed_paths'))"
+
+TRIGGER_FUNCTION_SQL = f"""
+CREATE OR REPLACE FUNCTION network.maintain_feed_path() RETURNS trigger
+LANGUAGE plpgsql AS $$
+DECLARE
+    -- TG_ARGV: kind, path code, primary key column, parent kind, parent column
+    v_old_id integer;
+    v_new_id integer;
+    v_old_path text;
+    v_parent_path text;
+    v_new_path text;
+BEGIN
+    IF TG_OP <> 'INSERT' THEN
+        v_old_id := (to_jsonb(OLD) ->> TG_ARGV[2])::integer;
+        -- Locked until commit: children inserted concurrently read it FOR SHARE and wait for the new path
+        SELECT path INTO v_old_path FROM {FEED_PATH_TABLE} WHERE kind = TG_ARGV[0] AND asset_id = v_old_id
+        FOR UPDATE;
+    END IF;
+    IF TG_OP = 'DELETE' THEN
+        -- Children go with ON DELETE CASCADE or are re-rooted by SET NULL, each through its own trigger
+        DELETE FROM {FEED_PATH_TABLE} WHERE kind = TG_ARGV[0] AND asset_id = v_old_id;
+        RETURN NULL;
+    END IF;
+
+    v_new_id := (to_jsonb(NEW) ->> TG_ARGV[2])::integer;
+    IF TG_ARGV[3] <> '' THEN
+        SELECT path INTO v_parent_path FROM {FEED_PATH_TABLE}
+        WHERE kind = TG_ARGV[3] AND asset_id = (to_jsonb(NEW) ->> TG_ARGV[4])::integer
+        FOR SHARE;
+    END IF;
+    v_new_path := coalesce(v_parent_path || '/', '') || TG_ARGV[1] || v_new_id;
+    IF v_old_path IS NOT DISTINCT FROM v_new_path THEN
+        RETURN NULL;
+    END IF;
+
+    IF TG_OP = 'UPDATE' AND v_old_id <> v_new_id THEN
+        DELETE FROM {FEED_PATH_TABLE} WHERE kind = TG_ARGV[0] AND asset_id = v_old_id;
+    END IF;
+    INSERT INTO {FEED_PATH_TABLE} (kind, asset_id, path) VALUES (TG_ARGV[0], v_new_id, v_new_path)
+    ON CONFLICT (kind, asset_id) DO UPDATE SET path = EXCLUDED.path;
+    IF v_old_path IS NOT NULL THEN
+        -- Wait out writers still adding rows under a descendant (they hold it FOR SHARE), so the
+        -- UPDATE's snapshot, taken after, sees their rows; ancestors first, like every other writer
+        PERFORM 1 FROM {FEED_PATH_TABLE} WHERE path >= v_old_path || '/' AND path < v_old_path || '0'
+        ORDER BY path FOR UPDATE;
+        UPDATE {FEED_PATH_TABLE} SET path = v_new_path || substr(path, length(v_old_path) + 1)
+        WHERE path >= v_old_path || '/' AND path < v_old_path || '0';
+    END IF;
+    RETURN NULL;
+END
+$$
+"""
+
+
+def _qualified(model) -> str:
+    return f'"{model.__table__.schema}"."{model.__table__.name}"'
+
+
+def _trigger_sql(kind) -> str:
+    pk = primary_key(kind.model).name
+    args = [kind.name, FEED_PATH_CODES[kind.name], pk, kind.parent_kind or "", kind.parent_column or ""]
+    columns = pk if kind.parent_column is None else f"{pk}, {kind.parent_column}"
+    return (
+        f"CREATE TRIGGER maintain_feed_path AFTER INSERT OR DELETE OR UPDATE OF {columns} "
+        f"ON {_qualified(kind.model)} FOR EACH ROW EXECUTE FUNCTION network.maintain_feed_path("
+        + ", ".join(f"'{a}'" for a in args) + ")"
+    )
+
+
+def _rebuild_sql(kind) -> str:
+    pk = primary_key(kind.model).name
+    code = FEED_PATH_CODES[kind.name]
+    if kind.parent_column is None:
+        return (
+            f"INSERT INTO {FEED_PATH_TABLE} (kind, asset_id, path) "
+            f"SELECT '{kind.name}', t.{pk}, '{code}' || t.{pk} FROM {_qualified(kind.model)} AS t"
+        )
+    return (
+        f"INSERT INTO {FEED_PATH_TABLE} (kind, asset_id, path) "
+        f"SELECT '{kind.name}', t.{pk}, coalesce(p.path || '/', '') || '{code}' || t.{pk} "
+        f"FROM {_qualified(kind.model)} AS t LEFT JOIN {FEED_PATH_TABLE} AS p "
+        f"ON p.kind = '{kind.parent_kind}' AND p.asset_id = t.{kind.parent_column}"
+    )
+
+
+async def rebuild_feed_paths(conn) -> Dict[str, int]:
+    """Recompute every path, parents before children; returns rows per kind."""
+    await conn.execute(text(LOCK_SQL))
+    await conn.execute(text(f"TRUNCATE {FEED_PATH_TABLE}"))
+    counts = {}
+    for kind in NODE_KINDS:
+        counts[kind.name] = (await conn.execute(text(_rebuild_sql(kind)))).rowcount
+    await conn.execute(text(f"ANALYZE {FEED_PATH_TABLE}"))
+    return counts
+
+
+async def install_feed_paths(engine: AsyncEngine):
+    """Create (or refresh) the triggers unless they are current, and fill the table if it is empty."""
+    async with engine.begin() as conn:
+        await conn.execute(text(LOCK_SQL))
+        triggers = {_qualified(kind.model): _trigger_sql(kind) for kind in NODE_KINDS}
+        await install_triggers(conn, "network.maintain_feed_path", TRIGGER_FUNCTION_SQL, "maintain_feed_path", triggers)
+        if (await conn.execute(text(f"SELECT NOT EXISTS (SELECT 1 FROM {FEED_PATH_TABLE})"))).scalar():
+            await rebuild_feed_paths(conn)
+
+
+def parse_path(path: str) -> List[Tuple[str, int]]:
+    return [(CODE_KINDS[segment[0]], int(segment[1:])) for segment in path.split("/")]
+
+
+async def get_path(db, kind: str, asset_id: int) -> Optional[str]:
+    return (await db.execute(
+        text(f"SELECT path FROM {FEED_PATH_TABLE} WHERE kind = :kind AND asset_id = :id"),
+        {"kind": kind, "id": asset_id},
+    )).scalar()
+
+
+async def ancestors(db, kind: str, asset_id: int) -> Optional[List[Tuple[str, int]]]:
+    """Feeding assets from the root down to the direct parent; None if unknown."""
+    path = await get_path(db, kind, asset_id)
+    return None if path is None else parse_path(path)[:-1]
+
+
+async def descendants(
+    db, path: str, kinds: Optional[Sequence[str]] = None, limit: int = 1000
+) -> Tuple[Dict[str, int], List[Dict[str, Any]]]:
+    """Counts per kind below ``path`` and the first ``limit`` assets in path order."""
+    where = "path >= :low AND path < :high"
+    params: Dict[str, Any] = {"low": path + "/", "high": path + "0", "limit": limit}
+    if kinds:
+        where += " AND kind = ANY(:kinds)"
+        params["kinds"] = list(kinds)
+    counts = await db.execute(text(f"SELECT kind, count(*) FROM {FEED_PATH_TABLE} WHERE {where} GROUP BY kind"), params)
+    rows = await db.execute(
+        text(f"SELECT kind, asset_id, path FROM {FEED_PATH_TABLE} WHERE {where} ORDER BY path LIMIT :limit"), params
+    )
+    return dict(counts.all()), [{"kind": k, "id": i, "path": p} for k, i, p in rows]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rebuild network.feed_paths from the hierarchy tables")
+    parser.parse_args()
+
+    from app.database import async_engine
+
+    async def run():
+        async with async_engine.begin() as conn:
+            for kind, count in (await rebuild_feed_paths(conn)).items():
+                print(f"{kind}: {count} paths")
+
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,345 @@
+# app/services/islands.py
+"""Connected components (islands) of the pole graph, kept current with union-find.
+
+Two poles are in the same island when a path of closed conductors joins them;
+a conductor is closed while none of its switches is open and none of its
+fuses blown. Each island root carries the substations whose feeder heads it
+contains, so "is pole X energized from substation Y" is one ``find`` (path
+halving, O(alpha(n))) plus a set lookup.
+
+The initial labelling is vectorised: hook every closed conductor's higher
+label onto its lower one, then pointer-jump until the forest is flat. After
+that the change feed keeps it current without a reload:
+
+* closing a conductor (switch closed, fuse replaced, conductor added) is a
+  union by size, merging the two islands' substation sets;
+* opening one cannot be undone in a union-find, so two breadth-first
+  searches start from its ends. If they meet, the island holds together;
+  otherwise the side that ran out first is complete, the rest of the old
+  island is the other side, and both are relabelled. The searches cost the
+  smaller side; finding the rest is one vectorised pass over the parents.
+
+Each device's last known state is kept, so applying the same edit twice is a
+no-op. New poles and hierarchy edits arrive with the topology reload, which
+rebuilds the islands from the fresh graph; edits arriving during the build
+are replayed onto the result. benchmarks/bench_islands.py
+measures, for 500k poles, 0.1 s to build, ~6 us per energized query and
+2-4 ms (p99 under 10 ms) per switch operation or conductor delete.
+"""
+import logging
+from collections import defaultdict
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+import numpy as np
+from starlette.concurrency import run_in_threadpool
+
+from app.services.layers import primary_key
+from app.services.topology import (
+    DEVICE_MODELS, DEVICE_OPEN_STATES, KIND_INDEX, Topology, TopologyHolder, concat_ranges, row_ids, topology,
+)
+
+logger = logging.getLogger(__name__)
+
+ISLAND_TABLES = frozenset(DEVICE_OPEN_STATES) | {"conductors"}
+
+Edge = Tuple[int, int]
+
+
+def component_labels(n: int, a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """Smallest pole index of each pole's component, given edges ``a[i]-b[i]``."""
+    label = np.arange(n, dtype=np.int32)
+    while True:
+        la, lb = label[a], label[b]
+        differ = la != lb
+        if not differ.any():
+            return label
+        # label[x] <= x always holds, so hooking high onto low cannot make cycles
+        np.minimum.at(label, np.maximum(la, lb)[differ], np.minimum(la, lb)[differ])
+        while True:
+            jumped = label[label]
+            if np.array_equal(jumped, label):
+                break
+            label = jumped
+
+
+class Islands:
+    def __init__(self, graph: Topology):
+        self.graph = graph
+        n = len(graph.feed_tin)
+        self._pole_offset = int(graph.offsets[KIND_INDEX["poles"]])
+
+        # Conductor id each open device is on, and open devices per conductor id;
+        # both sparse since nearly all devices are closed
+        self.device_open_on: Dict[Tuple[str, int], int] = {}
+        for kind, (ids, on, is_open) in graph.devices.items():
+            for i in np.flatnonzero(is_open).tolist():
+                device = (kind, int(ids[i]))
+                conductor_id = int(graph.conductor_ids[on[i]]) if on[i] >= 0 else graph.unlinked_devices.get(device)
+                if conductor_id is not None:
+                    self.device_open_on[device] = conductor_id
+        self.open_devices: Dict[int, int] = defaultdict(int)
+        for conductor_id in self.device_open_on.values():
+            self.open_devices[conductor_id] += 1
+        # Conductors re-routed, added or deleted since the topology was loaded
+        self.moved: Dict[int, Optional[Edge]] = {}
+        self.extra: Dict[int, Dict[int, int]] = defaultdict(dict)
+        self.has_extra = np.zeros(n, dtype=bool)
+        self.closed = (graph.conductor_start >= 0) & (graph.conductor_end >= 0) & ~graph.conductor_open
+
+        linked = np.flatnonzero(self.closed)
+        self.parent = component_labels(n, graph.conductor_start[linked], graph.conductor_end[linked])
+        self.size = np.bincount(self.parent, minlength=n).astype(np.int32)
+
+        # Substation feeding each feeder head, found through the hierarchy
+        heads = np.flatnonzero((graph.feed_edge < 0) & (graph.feed_tin >= 0))
+        node = heads + self._pole_offset
+        for _ in range(3):
+            node = np.where(node >= 0, graph.parent[np.maximum(node, 0)], -1)
+        fed = (node >= 0) & (graph.kind[np.maximum(node, 0)] == KIND_INDEX["substations"])
+        self.head_substation = np.full(n, -1, dtype=np.int64)
+        substations = graph.ids[KIND_INDEX["substations"]]
+        self.head_substation[heads[fed]] = substations[node[fed] - graph.offsets[KIND_INDEX["substations"]]]
+        self.sources: Dict[int, Set[int]] = defaultdict(set)
+        for head in heads[fed].tolist():
+            self.sources[int(self.parent[head])].add(int(self.head_substation[head]))
+
+    # --- queries ----------------------------------------------------------
+
+    def find(self, pole: int) -> int:
+        parent = self.parent
+        while parent[pole] != pole:
+            parent[pole] = parent[parent[pole]]
+            pole = int(parent[pole])
+        return pole
+
+    def _pole(self, pole_id: int) -> int:
+        return self.graph.index("poles", pole_id) - self._pole_offset
+
+    def energized_from(self, pole_id: int, substation_id: int) -> bool:
+        return substation_id in self.sources.get(self.find(self._pole(pole_id)), ())
+
+    def island(self, pole_id: int) -> Dict[str, Any]:
+        root = self.find(self._pole(pole_id))
+        substations = sorted(self.sources.get(root, ()))
+        return {
+            "pole_id": pole_id,
+            "island": int(self.graph.ids[KIND_INDEX["poles"]][root]),
+            "poles": int(self.size[root]),
+            "energized": bool(substations),
+            "substations": substations,
+        }
+
+    def stats(self) -> Dict[str, int]:
+        roots = np.flatnonzero(self.parent == np.arange(len(self.parent)))
+        return {
+            "poles": len(self.parent),
+            "islands": len(roots),
+            "energized_islands": sum(1 for root in roots.tolist() if self.sources.get(root)),
+            "moved_conductors": len(self.moved),
+        }
+
+    # --- incremental maintenance ------------------------------------------
+
+    def _base(self, conductor_id: int) -> int:
+        ids = self.graph.conductor_ids
+        i = int(np.searchsorted(ids, conductor_id))
+        return i if i < len(ids) and ids[i] == conductor_id else -1
+
+    def _edge(self, conductor_id: int) -> Optional[Edge]:
+        """The poles a conductor joins while it is closed, else None."""
+        if self.open_devices.get(conductor_id):
+            return None
+        if conductor_id in self.moved:
+            return self.moved[conductor_id]
+        i = self._base(conductor_id)
+        if i < 0 or self.graph.conductor_start[i] < 0 or self.graph.conductor_end[i] < 0:
+            return None
+        return int(self.graph.conductor_start[i]), int(self.graph.conductor_end[i])
+
+    def _update(self, conductor_id: int, change: Callable[[], None]):
+        before = self._edge(conductor_id)
+        change()
+        after = self._edge(conductor_id)
+        if before == after:
+            return
+        if before is not None:
+            self._unlink(conductor_id, before)
+            self._split(*before)
+        if after is not None:
+            self._link(conductor_id, after)
+            self._union(*after)
+
+    def _unlink(self, conductor_id: int, edge: Edge):
+        i = self._base(conductor_id)
+        if i >= 0:
+            self.closed[i] = False
+        for a, b in (edge, edge[::-1]):
+            self.extra[a].pop(conductor_id, None)
+            if not self.extra[a]:
+                del self.extra[a]
+                self.has_extra[a] = False
+
+    def _link(self, conductor_id: int, edge: Edge):
+        i = self._base(conductor_id)
+        if i >= 0 and conductor_id not in self.moved:
+            self.closed[i] = True
+            return
+        for a, b in (edge, edge[::-1]):
+            self.extra[a][conductor_id] = b
+            self.has_extra[a] = True
+
+    def _union(self, a: int, b: int):
+        ra, rb = self.find(a), self.find(b)
+        if ra == rb:
+            return
+        if self.size[ra] < self.size[rb]:
+            ra, rb = rb, ra
+        self.parent[rb] = ra
+        self.size[ra] += self.size[rb]
+        moved = self.sources.pop(rb, None)
+        if moved:
+            self.sources[ra] |= moved
+
+    def _neighbors(self, frontier: np.ndarray) -> np.ndarray:
+        """Poles one closed conductor away from ``frontier``."""
+        graph = self.graph
+        starts = graph.pole_ptr[frontier]
+        idx = concat_ranges(starts, graph.pole_ptr[frontier + 1] - starts)
+        reached: List[int] = graph.pole_neighbors[idx][self.closed[graph.pole_edges[idx]]].tolist()
+        for p in frontier[self.has_extra[frontier]].tolist():
+            reached.extend(self.extra[p].values())
+        return np.array(reached, dtype=np.int64)
+
+    def _sides(self, a: int, b: int) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+        """The poles still joined to ``a`` and to ``b``, or None if they still meet.
+
+        Both searches advance level by level, the smaller frontier first, so a
+        conductor on a loop is settled as soon as the two searches touch.
+        """
+        side = np.zeros(len(self.parent), dtype=np.int8)
+        side[a], side[b] = 1, 2
+        frontiers = {1: np.array([a]), 2: np.array([b])}
+        while len(frontiers[1]) and len(frontiers[2]):
+            s = 1 if len(frontiers[1]) <= len(frontiers[2]) else 2
+            reached = self._neighbors(frontiers[s])
+            if (side[reached] == 3 - s).any():
+                return None
+            frontiers[s] = np.unique(reached[side[reached] == 0])
+            side[frontiers[s]] = s
+        # One side is complete and the rest of the old island is the other:
+        # flatten the forest (every pole straight onto its root) to find it
+        done = 1 if not len(frontiers[1]) else 2
+        root = self.find(a)
+        while True:
+            jumped = self.parent[self.parent]
+            if np.array_equal(jumped, self.parent):
+                break
+            self.parent = jumped
+        side[(self.parent == root) & (side != done)] = 3 - done
+        return np.flatnonzero(side == 1), np.flatnonzero(side == 2)
+
+    def _relabel(self, root: int, poles: np.ndarray):
+        self.parent[poles] = root
+        self.size[root] = len(poles)
+        substations = self.head_substation[poles]
+        self.sources[root] = set(substations[substations >= 0].tolist())
+        if not self.sources[root]:
+            del self.sources[root]
+
+    def _split(self, a: int, b: int):
+        sides = self._sides(a, b)
+        if sides is None:
+            return
+        self.sources.pop(self.find(a), None)
+        self._relabel(a, sides[0])
+        self._relabel(b, sides[1])
+
+    def _set_conductor(self, conductor_id: int, edge: Optional[Edge]):
+        i = self._base(conductor_id)
+        if i >= 0 and edge == (int(self.graph.conductor_start[i]), int(self.graph.conductor_end[i])):
+            self.moved.pop(conductor_id, None)
+        else:
+            self.moved[conductor_id] = edge
+
+    def _count_device(self, conductor_id: int, delta: int):
+        self.open_devices[conductor_id] += delta
+        if self.open_devices[conductor_id] <= 0:
+            del self.open_devices[conductor_id]
+
+    def _set_device(self, device: Tuple[str, int], conductor_id: Optional[int]):
+        """Record the conductor ``device`` holds open, None if it holds none open."""
+        before = self.device_open_on.pop(device, None)
+        if conductor_id is not None:
+            self.device_open_on[device] = conductor_id
+        if before == conductor_id:
+            return
+        if before is not None:
+            self._update(before, lambda: self._count_device(before, -1))
+        if conductor_id is not None:
+            self._update(conductor_id, lambda: self._count_device(conductor_id, 1))
+
+    def handle_change(self, change: Dict[str, Any]):
+        table, op = change["table"], change["op"]
+        row = change.get("row") or {}
+        new = None if op == "DELETE" else row
+        if table == "conductors":
+            edge = None
+            if new is not None:
+                ends = [self._pole_or_none(new.get(c)) for c in ("start_pole_id", "end_pole_id")]
+                edge = None if None in ends else tuple(ends)
+            conductor_id = int(row["conductor_id"])
+            self._update(conductor_id, lambda: self._set_conductor(conductor_id, edge))
+            return
+        before, after = row_ids(change, primary_key(DEVICE_MODELS[table]).name)
+        if before is not None and before != after:
+            self._set_device((table, before), None)
+        if after is not None:
+            is_open = (row.get("operational_status") or "").lower() in DEVICE_OPEN_STATES[table]
+            conductor_id = row.get("conductor_id")
+            self._set_device((table, after), int(conductor_id) if is_open and conductor_id is not None else None)
+
+    def _pole_or_none(self, pole_id) -> Optional[int]:
+        if pole_id is None:
+            return None
+        try:
+            return self._pole(int(pole_id))
+        except KeyError:
+            return None  # poles added since the last topology load
+
+
+class IslandIndex:
+    """Islands of the current topology; rebuilt on every topology load."""
+
+    def __init__(self, holder: TopologyHolder):
+        self.current: Optional[Islands] = None
+        holder.on_load.append(self.rebuild)
+        # Edits seen while new islands are built, replayed onto them
+        self._log: Optional[List[Dict[str, Any]]] = None
+
+    async def rebuild(self, graph: Topology):
+        # The device states are copied here, on the loop, so every edit after the copy is in the log
+        self._log = []
+        try:
+            built = await run_in_threadpool(Islands, graph.snapshot())
+        finally:
+            log, self._log = self._log, None
+        for change in log:
+            built.handle_change(change)
+        self.current = built
+        logger.info("Built pole islands: %s", built.stats())
+
+    def handle_change(self, change: Dict[str, Any]):
+        if change["table"] not in ISLAND_TABLES:
+            return
+        if self._log is not None:
+            self._log.append(change)
+        if self.current is not None:
+            self.current.handle_change(change)
+
+    def get(self) -> Islands:
+        if self.current is None:
+            raise RuntimeError("Pole islands are not built")
+        return self.current
+
+
+islands = IslandIndex(topology)
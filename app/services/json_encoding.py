@@ -0,0 +1,34 @@
+# app/services/json_encoding.py
+import base64
+from decimal import Decimal
+from typing import Any
+
+import orjson
+from geoalchemy2.elements import WKBElement, WKTElement
+
+JSON_MEDIA_TYPE = "application/json"
+INT64_MIN, INT64_MAX = -(2 ** 63), 2 ** 63 - 1
+
+
+def _default(value: Any) -> Any:
+    # orjson handles str/int/float/bool/None, datetime/date/time and UUID natively;
+    # only the types it does not know reach this hook
+    if isinstance(value, Decimal):
+        if not value.is_finite():
+            # numeric NaN/Infinity: JSON has no such numbers, and orjson writes float ones as null too
+            return None
+        if value.as_tuple().exponent >= 0:
+            # Same output as jsonable_encoder: integral values stay ints, as far as orjson (and
+            # bigint) reaches; beyond that a string keeps every digit
+            return int(value) if INT64_MIN <= value <= INT64_MAX else str(value)
+        return float(value)
+    if isinstance(value, (WKBElement, WKTElement)):
+        return value.desc
+    if isinstance(value, (bytes, memoryview)):
+        return base64.b64encode(value).decode()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def dumps(value: Any) -> bytes:
+    """Encode rows (dicts, lists, scalars) straight to JSON bytes."""
+    return orjson.dumps(value, default=_default)
@@ -0,0 +1,83 @@
+# app/services/layers.py
+from itertools import chain
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy import Column, Text, cast, func, literal
+from sqlalchemy.dialects.postgresql import JSON
+
+from app.models.elec_models import (
+    Conductor, Feeder, Fuse, Meter, Pole, ServicePoint, Substation, Switch, Transformer
+)
+
+SRID = 4326
+# Coordinate decimals in GeoJSON output; 7 digits is ~1 cm at the equator
+GEOJSON_PRECISION = 7
+
+# Every network table with a geometry column, keyed by table name
+LAYERS: Dict[str, type] = {
+    model.__tablename__: model
+    for model in (Substation, Feeder, Transformer, Pole, Conductor, Switch, Fuse, Meter, ServicePoint)
+}
+
+BBox = Tuple[float, float, float, float]
+
+
+def get_layer(name: str) -> Optional[type]:
+    return LAYERS.get(name)
+
+
+def primary_key(model) -> Column:
+    return model.__table__.primary_key.columns.values()[0]
+
+
+def property_columns(model) -> List[Column]:
+    return [c for c in model.__table__.columns if c.name != "geom"]
+
+
+def parse_bbox(value: str) -> BBox:
+    """Parse ``minx,miny,maxx,maxy`` in EPSG:4326."""
+    try:
+        minx, miny, maxx, maxy = (float(v) for v in value.split(","))
+    except ValueError:
+        raise ValueError("bbox must be minx,miny,maxx,maxy")
+    if minx > maxx or miny > maxy:
+        raise ValueError("bbox min values must not exceed max values")
+    return minx, miny, maxx, maxy
+
+
+def envelope(bbox: BBox):
+    return func.ST_MakeEnvelope(*bbox, SRID)
+
+
+def bbox_filter(model, bbox: BBox):
+    # && compares bounding boxes and is answered from the GiST index on geom
+    return model.geom.op("&&")(envelope(bbox))
+
+
+def select_properties(model, requested: Optional[str]) -> List[Column]:
+    """Property columns named in a comma-separated ``requested``; all of them when None."""
+    columns = property_columns(model)
+    if requested is None:
+        return columns
+    by_name = {c.name: c for c in columns}
+    names = [n for n in requested.split(",") if n]
+    unknown = [n for n in names if n not in by_name]
+    if unknown:
+        raise ValueError(f"Unknown propert{'y' if len(unknown) == 1 else 'ies'}: {', '.join(unknown)}")
+    return [by_name[n] for n in names]
+
+
+def geojson_feature(model, columns: Optional[Sequence[Column]] = None):
+    """A whole GeoJSON Feature rendered by PostgreSQL as text, ready to stream."""
+    if columns is None:
+        columns = property_columns(model)
+    properties = func.json_build_object(
+        *chain.from_iterable((literal(c.name), c) for c in columns)
+    )
+    feature = func.json_build_object(
+        literal("type"), literal("Feature"),
+        literal("id"), primary_key(model),
+        literal("geometry"), cast(func.ST_AsGeoJSON(model.geom, GEOJSON_PRECISION), JSON),
+        literal("properties"), properties,
+    )
+    return cast(feature, Text)
@@ -0,0 +1,144 @@
+# app/services/metrics.py
+"""Minimal Prometheus metrics: histograms and counters rendered in the text format.
+
+Observations are a bisect plus two list/float updates under an uncontended
+lock, so the instrumentation is cheap enough to leave on in production (see
+benchmarks/bench_metrics_overhead.py). The lock matters because observations
+also come from threadpool code and /metrics renders in the threadpool:
+rendering copies each series under it, so a scrape never sees a bucket
+counted but not yet summed, or a dict resized mid-iteration.
+"""
+import threading
+import time
+from bisect import bisect_left
+from typing import Dict, List, Optional, Tuple
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+ROW_BUCKETS = (0, 1, 10, 100, 1000, 10_000, 100_000, 1_000_000)
+BYTE_BUCKETS = (256, 1024, 4096, 16_384, 65_536, 262_144, 1_048_576, 4_194_304, 16_777_216)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(names: Tuple[str, ...], values: Tuple[str, ...], le: Optional[str] = None) -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if le is not None:
+        pairs.append(f'le="{le}"')
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Histogram:
+    def __init__(self, name: str, documentation: str, buckets: Tuple[float, ...], labelnames=("endpoint",)):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = tuple(buckets)
+        self.labelnames = tuple(labelnames)
+        # label values -> [per-bucket counts (last is +Inf), sum]
+        self._series: Dict[Tuple[str, ...], list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labels: str):
+        bucket = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][bucket] += 1
+            series[1] += value
+
+    def render(self, lines: List[str]):
+        lines.append(f"# HELP {self.name} {self.documentation}")
+        lines.append(f"# TYPE {self.name} histogram")
+        with self._lock:
+            snapshot = [(labels, list(counts), total) for labels, (counts, total) in self._series.items()]
+        for labels, counts, total in sorted(snapshot):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(float(bound))
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, labels, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, labels)} {total}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, labels)} {cumulative}")
+
+
+class Counter:
+    def __init__(self, name: str, documentation: str, labelnames=("endpoint",)):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels: str, amount: float = 1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self, lines: List[str]):
+        lines.append(f"# HELP {self.name} {self.documentation}")
+        lines.append(f"# TYPE {self.name} counter")
+        with self._lock:
+            snapshot = list(self._values.items())
+        for labels, value in sorted(snapshot):
+            lines.append(f"{self.name}{_labels(self.labelnames, labels)} {value}")
+
+
+REQUEST_LATENCY = Histogram(
+    "http_request_duration_seconds", "End-to-end request latency.", LATENCY_BUCKETS
+)
+REQUESTS = Counter("http_requests_total", "Requests by endpoint and status.", ("endpoint", "status"))
+RESPONSE_BYTES = Histogram("http_response_bytes", "Response body size.", BYTE_BUCKETS)
+DB_TIME = Histogram("dynamic_db_seconds", "Time spent executing and fetching the query.", LATENCY_BUCKETS)
+SERIALIZE_TIME = Histogram("dynamic_serialize_seconds", "Time spent encoding rows to JSON.", LATENCY_BUCKETS)
+POOL_WAIT = Histogram(
+    "db_pool_wait_seconds",
+    "Time to check out the request's connection, including any connect and BEGIN done on checkout.",
+    LATENCY_BUCKETS,
+)
+ROWS = Histogram("dynamic_rows", "Rows returned per request.", ROW_BUCKETS)
+
+REGISTRY = (REQUEST_LATENCY, REQUESTS, RESPONSE_BYTES, DB_TIME, SERIALIZE_TIME, POOL_WAIT, ROWS)
+PROMETHEUS_MEDIA_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+# Scope key a handler can set to label its request more precisely than the route template
+LABEL_SCOPE_KEY = "metrics_label"
+
+
+def render_metrics() -> str:
+    lines: List[str] = []
+    for metric in REGISTRY:
+        metric.render(lines)
+    return "\n".join(lines) + "\n"
+
+
+class MetricsMiddleware:
+    """Pure ASGI middleware recording latency, status and body size per route."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        started = time.perf_counter()
+        status = [500]
+        size = [0]
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            elif message["type"] == "http.response.body":
+                size[0] += len(message.get("body", b""))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            label = scope.get(LABEL_SCOPE_KEY)
+            if label is None:
+                route = scope.get("route")
+                label = route.path if route is not None else "unmatched"
+            REQUEST_LATENCY.observe(time.perf_counter() - started, label)
+            RESPONSE_BYTES.observe(size[0], label)
+            REQUESTS.inc(label, str(status[0]))
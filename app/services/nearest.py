@@ -0,0 +1,172 @@
+# app/services/nearest.py
+"""K-nearest-neighbour lookups over the network layers.
+
+Candidates come from the GiST index through the ``<->`` operator, one LATERAL
+index probe per query point, so latency depends on k and the number of
+points, not on table size. ``<->`` orders by planar distance in degrees, which
+stretches east-west; each probe therefore fetches KNN_OVERSAMPLE * k
+candidates that are ranked by true (spheroid) distance in metres.
+
+The planar order can still leave a row that is nearer on the spheroid outside
+a full candidate set, so points whose probe came back full get a second query
+for every row within their k-th candidate distance (``ST_DWithin`` on
+geography, behind a degree box that keeps it on the index). Those rows are a
+superset of the true k nearest, so the result is exact.
+"""
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import orjson
+from geoalchemy2 import Geography
+from sqlalchemy import Float, bindparam, cast, func, select, true
+from sqlalchemy.types import ARRAY
+
+from app.services.layers import SRID, geojson_feature, primary_key
+
+MAX_K = 100
+MAX_QUERY_POINTS = 1000
+KNN_OVERSAMPLE = 4
+# Metres per degree of latitude at the equator, the shortest anywhere on the
+# spheroid; longitude degrees are at least this times cos(latitude)
+METRES_PER_DEGREE = 110_574.0
+
+# Added to recheck radii: ST_DWithin and ST_Distance on geography need not agree
+# to the last bit, and a row at exactly the k-th distance must not drop out
+RECHECK_SLACK_M = 0.01
+
+Point = Tuple[float, float]
+Hit = Tuple[float, int, str]
+
+
+def degrees_within(metres, lat):
+    """Planar degree radius that covers ``metres`` in every direction from latitude ``lat``.
+
+    Uses the latitude furthest from the equator the radius can reach, where
+    longitude degrees are shortest, so an ``ST_DWithin`` on geometry with it
+    never drops a row within ``metres``. Works on SQL expressions.
+    """
+    worst = func.least(func.abs(lat) + metres / METRES_PER_DEGREE, 89.9)
+    return metres / (METRES_PER_DEGREE * func.cos(func.radians(worst)))
+
+
+def _geography_distance(model, point):
+    return func.ST_Distance(cast(model.geom, Geography(srid=SRID)), cast(point, Geography(srid=SRID)))
+
+
+def nearest_statement(model, with_max_distance: bool):
+    """Query points arrive as two float8 arrays so any batch size is one prepared statement."""
+    points = (
+        func.unnest(bindparam("lons", type_=ARRAY(Float)), bindparam("lats", type_=ARRAY(Float)))
+        .table_valued("lon", "lat", with_ordinality="ord")
+        .render_derived(name="q")
+    )
+    point = func.ST_SetSRID(func.ST_MakePoint(points.c.lon, points.c.lat), SRID)
+    candidates = select(
+        primary_key(model).label("id"),
+        _geography_distance(model, point).label("distance_m"),
+        geojson_feature(model).label("feature"),
+    )
+    if with_max_distance:
+        # Keeps the probe on the index; the exact metre cut happens when ranking
+        candidates = candidates.where(
+            func.ST_DWithin(model.geom, point, degrees_within(bindparam("max_distance", type_=Float), points.c.lat))
+        )
+    candidates = (
+        candidates.order_by(model.geom.op("<->")(point)).limit(bindparam("candidates")).lateral("candidates")
+    )
+    return (
+        select(points.c.ord, candidates.c.id, candidates.c.distance_m, candidates.c.feature)
+        .select_from(points.join(candidates, true()))
+    )
+
+
+def within_statement(model):
+    """Every row within ``radii[i]`` metres of point i, for the points in ``lons``/``lats``."""
+    points = (
+        func.unnest(
+            bindparam("lons", type_=ARRAY(Float)),
+            bindparam("lats", type_=ARRAY(Float)),
+            bindparam("radii", type_=ARRAY(Float)),
+        )
+        .table_valued("lon", "lat", "radius", with_ordinality="ord")
+        .render_derived(name="q")
+    )
+    point = func.ST_SetSRID(func.ST_MakePoint(points.c.lon, points.c.lat), SRID)
+    hits = (
+        select(
+            primary_key(model).label("id"),
+            _geography_distance(model, point).label("distance_m"),
+            geojson_feature(model).label("feature"),
+        )
+        .where(func.ST_DWithin(model.geom, point, degrees_within(points.c.radius, points.c.lat)))
+        .where(func.ST_DWithin(cast(model.geom, Geography(srid=SRID)), cast(point, Geography(srid=SRID)),
+                               points.c.radius))
+        .lateral("hits")
+    )
+    return (
+        select(points.c.ord, hits.c.id, hits.c.distance_m, hits.c.feature)
+        .select_from(points.join(hits, true()))
+    )
+
+
+def _group(rows, count: int) -> List[List[Hit]]:
+    grouped: List[List[Hit]] = [[] for _ in range(count)]
+    for ordinal, id_, distance, feature in rows:
+        grouped[ordinal - 1].append((distance, id_, feature))
+    return grouped
+
+
+def rank(grouped: Sequence[Sequence[Hit]], k: int, max_distance: Optional[float]) -> List[List[Dict]]:
+    """Nearest first, keeping k within ``max_distance`` per query point."""
+    return [
+        hit_dicts(sorted(h for h in hits if max_distance is None or h[0] <= max_distance)[:k])
+        for hits in grouped
+    ]
+
+
+def hit_dicts(hits: Sequence[Hit]) -> List[Dict]:
+    # Features are GeoJSON text from PostGIS; Fragment embeds them without re-parsing
+    return [{"id": id_, "distance_m": distance, "feature": orjson.Fragment(feature)} for distance, id_, feature in hits]
+
+
+def statement_params(points: Sequence[Point], k: int, max_distance: Optional[float]) -> Dict:
+    params = {
+        "lons": [p[0] for p in points],
+        "lats": [p[1] for p in points],
+        "candidates": k * KNN_OVERSAMPLE,
+    }
+    if max_distance is not None:
+        params["max_distance"] = max_distance
+    return params
+
+
+def recheck_radii(grouped: Sequence[Sequence[Hit]], k: int, max_distance: Optional[float]) -> Dict[int, float]:
+    """Query point index -> radius that must be searched exhaustively.
+
+    A probe that returned fewer than KNN_OVERSAMPLE * k rows saw every row in
+    reach and is already exact; a full one is re-searched out to its k-th
+    spheroid distance (capped at ``max_distance``).
+    """
+    radii = {}
+    for i, hits in enumerate(grouped):
+        if len(hits) >= k * KNN_OVERSAMPLE:
+            radius = sorted(h[0] for h in hits)[k - 1] + RECHECK_SLACK_M
+            radii[i] = radius if max_distance is None else min(radius, max_distance)
+    return radii
+
+
+async def nearest(db, model, points: Sequence[Point], k: int, max_distance: Optional[float]) -> List[List[Dict]]:
+    """The k nearest rows of ``model`` to each point, by spheroid distance, as hit dicts."""
+    statement = nearest_statement(model, max_distance is not None)
+    rows = await db.execute(statement, statement_params(points, k, max_distance))
+    grouped = _group(rows, len(points))
+    radii = recheck_radii(grouped, k, max_distance)
+    if radii:
+        indexes = list(radii)
+        rows = await db.execute(within_statement(model), {
+            "lons": [points[i][0] for i in indexes],
+            "lats": [points[i][1] for i in indexes],
+            "radii": [radii[i] for i in indexes],
+        })
+        for i, hits in zip(indexes, _group(rows, len(indexes))):
+            grouped[i] = hits
+    return rank(grouped, k, max_distance)
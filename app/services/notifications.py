@@ -0,0 +1,100 @@
+# app/services/notifications.py
+import asyncio
+import logging
+from typing import Awaitable, Callable, Dict, List, Optional, Set
+
+import asyncpg
+
+from app.database import DATABASE_URL
+
+logger = logging.getLogger(__name__)
+
+Handler = Callable[[str], Awaitable[None]]
+
+
+class NotificationListener:
+    """Dispatches PostgreSQL LISTEN/NOTIFY payloads to async handlers.
+
+    One dedicated connection per worker; if it drops, the listener reconnects
+    and calls the resync hooks, since notifications sent meanwhile are lost.
+    The same connection holds the session advisory locks that elect one
+    worker to do work every worker would otherwise repeat (see is_leader).
+    """
+
+    def __init__(self, dsn: str, reconnect_delay: float = 5.0):
+        self.dsn = dsn
+        self.reconnect_delay = reconnect_delay
+        self._handlers: Dict[str, List[Handler]] = {}
+        self._resync_hooks: List[Callable[[], Awaitable[None]]] = []
+        self._connection: Optional[asyncpg.Connection] = None
+        self._tasks: Set[asyncio.Task] = set()
+        self._stopping = False
+        self._leading: Set[str] = set()
+        self._lock = asyncio.Lock()
+
+    def subscribe(self, channel: str, handler: Handler, resync: Callable[[], Awaitable[None]] = None):
+        self._handlers.setdefault(channel, []).append(handler)
+        if resync is not None:
+            self._resync_hooks.append(resync)
+
+    async def start(self):
+        self._stopping = False
+        self._connection = await asyncpg.connect(self.dsn)
+        # Session locks die with the old connection; leadership is contested afresh
+        self._leading = set()
+        self._connection.add_termination_listener(self._on_terminated)
+        for channel in self._handlers:
+            await self._connection.add_listener(channel, self._on_notification)
+
+    async def stop(self):
+        self._stopping = True
+        if self._connection is not None:
+            await self._connection.close()
+            self._connection = None
+        for task in list(self._tasks):
+            task.cancel()
+
+    async def is_leader(self, key: str) -> bool:
+        """Whether this worker leads for ``key``; the first worker to ask keeps it until its connection drops."""
+        if self._connection is None:
+            return True  # not listening (CLI, or reconnecting): nobody to defer to
+        async with self._lock:
+            if key not in self._leading:
+                if await self._connection.fetchval("SELECT pg_try_advisory_lock(hashtext($1))", key):
+                    self._leading.add(key)
+            return key in self._leading
+
+    def _spawn(self, coro: Awaitable[None]):
+        task = asyncio.ensure_future(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    def _on_notification(self, connection, pid, channel, payload):
+        for handler in self._handlers.get(channel, ()):
+            self._spawn(self._run(handler, payload))
+
+    async def _run(self, handler: Callable[..., Awaitable[None]], *args):
+        try:
+            await handler(*args)
+        except Exception:
+            logger.exception("Notification handler %r failed", handler)
+
+    def _on_terminated(self, connection):
+        self._connection = None
+        if not self._stopping:
+            self._spawn(self._reconnect())
+
+    async def _reconnect(self):
+        while not self._stopping:
+            await asyncio.sleep(self.reconnect_delay)
+            try:
+                await self.start()
+            except (OSError, asyncpg.PostgresError) as e:
+                logger.warning("Notification listener reconnect failed: %s", e)
+                continue
+            for resync in self._resync_hooks:
+                await self._run(resync)
+            return
+
+
+listener = NotificationListener(DATABASE_URL)
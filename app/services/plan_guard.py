@@ -0,0 +1,125 @@
+# app/services/plan_guard.py
+import json
+import re
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterator, List, Mapping, Optional
+
+from sqlalchemy import bindparam, text
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.types import ARRAY, String
+
+from app.services.dynamic_sql import CompiledEndpoint, apply_statement_timeout
+
+# Reject endpoints whose estimated cost, without the paging LIMIT, exceeds this;
+# None only reports the cost
+MAX_PLAN_COST: Optional[float] = None
+# Sequential scans over tables with at least this many rows (pg_class.reltuples) are flagged
+LARGE_TABLE_ROWS = 100_000
+
+SPATIAL_PREDICATE_RE = re.compile(
+    r"\bST_(?:Intersects|DWithin|Contains|Within|Covers|CoveredBy|Touches|Overlaps|Crosses|DFullyWithin)\b|&&|<->",
+    re.IGNORECASE,
+)
+SPATIAL_INDEX_METHODS = ("gist", "spgist", "brin")
+
+
+@dataclass
+class PlanReport:
+    # Estimates for the query under the paging LIMIT, which the guard checks
+    total_cost: float
+    plan_rows: float
+    # Estimated cost of one page, the LIMIT included
+    page_cost: float
+    seq_scans: List[str] = field(default_factory=list)
+    warnings: List[str] = field(default_factory=list)
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "total_cost": self.total_cost,
+            "plan_rows": self.plan_rows,
+            "page_cost": self.page_cost,
+            "seq_scans": self.seq_scans,
+            "warnings": self.warnings,
+        }
+
+
+def _walk(node: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+    yield node
+    for child in node.get("Plans", ()):
+        yield from _walk(child)
+
+
+async def explain_endpoint(
+    db: AsyncSession, endpoint: CompiledEndpoint, sample_params: Mapping[str, str]
+) -> PlanReport:
+    """EXPLAIN the endpoint's first page with representative parameters and flag risky plans.
+
+    The planner discounts a Limit node's cost to the fraction of rows it
+    keeps, which hides what a selective filter or a sort costs before the
+    first row comes out; the cost reported is that of the plan below it.
+    """
+    params = endpoint.bind(sample_params, allow_missing=True)
+    missing = [n for n in endpoint.param_names if n not in sample_params]
+
+    explain = text(f"EXPLAIN (FORMAT JSON, VERBOSE) {endpoint.first_page.text}")
+    await apply_statement_timeout(db, endpoint)
+    output = (await db.execute(explain, params)).scalar_one()
+    # asyncpg hands json back as text unless a codec decodes it
+    plan = (json.loads(output) if isinstance(output, str) else output)[0]["Plan"]
+    nodes = list(_walk(plan))
+
+    query = plan["Plans"][0] if plan["Node Type"] == "Limit" else plan
+    report = PlanReport(total_cost=query["Total Cost"], plan_rows=query["Plan Rows"], page_cost=plan["Total Cost"])
+    if missing:
+        report.warnings.append(f"Estimated with NULL for parameter(s): {', '.join(missing)}")
+
+    scanned = {
+        (n.get("Schema", "public"), n["Relation Name"]) for n in nodes if n["Node Type"] == "Seq Scan"
+    }
+    if scanned:
+        schemas, tables = zip(*sorted(scanned))
+        sizes = await db.execute(
+            text(
+                "SELECT t.schema_name || '.' || t.table_name, c.reltuples "
+                "FROM unnest(:schemas, :tables) AS t(schema_name, table_name) "
+                "JOIN pg_class c "
+                "ON c.oid = to_regclass(quote_ident(t.schema_name) || '.' || quote_ident(t.table_name))"
+            ).bindparams(
+                bindparam("schemas", type_=ARRAY(String())), bindparam("tables", type_=ARRAY(String()))
+            ),
+            {"schemas": list(schemas), "tables": list(tables)},
+        )
+        for name, reltuples in sizes:
+            if reltuples >= LARGE_TABLE_ROWS:
+                report.seq_scans.append(name)
+                report.warnings.append(f"Sequential scan on {name} (~{int(reltuples)} rows)")
+
+    if SPATIAL_PREDICATE_RE.search(endpoint.sql):
+        index_names = sorted({n["Index Name"] for n in nodes if "Index Name" in n})
+        spatial = 0
+        if index_names:
+            spatial = (await db.execute(
+                text(
+                    "SELECT count(*) FROM pg_class c JOIN pg_am a ON a.oid = c.relam "
+                    "WHERE c.relkind = 'i' AND c.relname = ANY(:names) AND a.amname = ANY(:methods)"
+                ).bindparams(
+                    bindparam("names", type_=ARRAY(String())), bindparam("methods", type_=ARRAY(String()))
+                ),
+                {"names": index_names, "methods": list(SPATIAL_INDEX_METHODS)},
+            )).scalar_one()
+        if not spatial:
+            report.warnings.append("Spatial predicate is not using a spatial (GiST/SP-GiST/BRIN) index")
+    return report
+
+
+async def check_plan(
+    db: AsyncSession,
+    endpoint: CompiledEndpoint,
+    sample_params: Mapping[str, str],
+    max_cost: Optional[float] = None,
+) -> PlanReport:
+    report = await explain_endpoint(db, endpoint, sample_params)
+    limit = max_cost if max_cost is not None else MAX_PLAN_COST
+    if limit is not None and report.total_cost > limit:
+        raise ValueError(f"Estimated plan cost {report.total_cost:.0f} exceeds the limit of {limit:.0f}")
+    return report
@@ -0,0 +1,245 @@
+# app/services/reconcile.py
+"""Set-based reconciliation of feed assignments by proximity.
+
+Jobs assign each child row (meter, pole) the nearest parent (pole,
+transformer) within a tolerance. The work is split into grid cells of
+PARTITION_DEGREES; each cell is one statement in PostGIS and one transaction
+holding an advisory lock on the cell. Per child, a KNN LATERAL probe finds
+the closest of a few planar candidates, and a second ST_DWithin probe on
+geography out to that distance picks the exact nearest parent. Cells run concurrently
+within a process, and several processes (API workers or the CLI) can run the
+same job at once without doing a cell twice.
+
+    python -m app.services.reconcile meters-to-poles --tolerance 30 --apply
+"""
+import argparse
+import asyncio
+import math
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+from geoalchemy2 import Geography
+from sqlalchemy import Column, Float, bindparam, cast, func, select, text, true, update
+from sqlalchemy.types import ARRAY
+
+from app.models.elec_models import Meter, Pole, Transformer
+from app.services.layers import SRID, primary_key
+from app.services.nearest import KNN_OVERSAMPLE, METRES_PER_DEGREE, RECHECK_SLACK_M, degrees_within
+
+PARTITION_DEGREES = 0.1
+APPLY_BATCH_SIZE = 5000
+DEFAULT_TOLERANCE_M = 50.0
+DEFAULT_CONCURRENCY = 4
+# Diff entries returned in the report; counts always cover every change
+MAX_REPORT_ROWS = 10_000
+
+
+@dataclass(frozen=True)
+class ReconcileJob:
+    name: str
+    child: type
+    foreign_key: Column
+    parent: type
+
+
+JOBS: Dict[str, ReconcileJob] = {
+    job.name: job
+    for job in (
+        ReconcileJob("meters-to-poles", Meter, Meter.pole_id, Pole),
+        ReconcileJob("poles-to-transformers", Pole, Pole.transformer_id, Transformer),
+    )
+}
+
+Cell = Tuple[int, int]
+
+
+def _cell_index(geom):
+    return (
+        func.floor(func.ST_X(geom) / PARTITION_DEGREES).label("cx"),
+        func.floor(func.ST_Y(geom) / PARTITION_DEGREES).label("cy"),
+    )
+
+
+def partitions_statement(job: ReconcileJob, only_missing: bool):
+    cx, cy = _cell_index(job.child.geom)
+    statement = select(cx, cy).distinct()
+    if only_missing:
+        statement = statement.where(job.foreign_key.is_(None))
+    return statement
+
+
+def diff_statement(job: ReconcileJob, only_missing: bool):
+    """Changed assignments in one cell: (id, old parent, new parent, distance in metres)."""
+    child, parent = job.child, job.parent
+    geography = Geography(srid=SRID)
+    parent_id = primary_key(parent)
+    distance = func.ST_Distance(cast(parent.geom, geography), cast(child.geom, geography))
+    tolerance_m = bindparam("tolerance_m", type_=Float)
+    knn = (
+        select(distance.label("distance_m"))
+        .where(func.ST_DWithin(parent.geom, child.geom, bindparam("tolerance_deg")))
+        .order_by(parent.geom.op("<->")(child.geom))
+        .limit(KNN_OVERSAMPLE)
+        .correlate(child)
+        .subquery("knn")
+    )
+    # The closest of the oversampled KNN candidates bounds the search: the planar <-> order
+    # can miss a parent nearer on the spheroid, but not one beyond that candidate
+    reach = (
+        select(func.least(func.coalesce(func.min(knn.c.distance_m) + RECHECK_SLACK_M, tolerance_m), tolerance_m)
+               .label("radius_m"))
+        .select_from(knn)
+        .lateral("reach")
+    )
+    nearest = (
+        select(parent_id.label("new_id"), distance.label("distance_m"))
+        .where(func.ST_DWithin(parent.geom, child.geom, degrees_within(reach.c.radius_m, func.ST_Y(child.geom))))
+        .where(func.ST_DWithin(cast(parent.geom, geography), cast(child.geom, geography), reach.c.radius_m))
+        .order_by(distance, parent_id)
+        .limit(1)
+        .lateral("nearest")
+    )
+    cx, cy = _cell_index(child.geom)
+    statement = (
+        select(primary_key(child).label("id"), job.foreign_key.label("old_id"), nearest.c.new_id, nearest.c.distance_m)
+        .select_from(child.__table__.join(reach, true()).join(nearest, true()))
+        # && keeps the cell on the GiST index; the floor() test drops points on its border twice
+        .where(child.geom.op("&&")(func.ST_MakeEnvelope(
+            bindparam("minx"), bindparam("miny"), bindparam("maxx"), bindparam("maxy"), SRID
+        )))
+        .where(cx == bindparam("cx"), cy == bindparam("cy"))
+        .where(job.foreign_key.is_distinct_from(nearest.c.new_id))
+    )
+    if only_missing:
+        statement = statement.where(job.foreign_key.is_(None))
+    return statement
+
+
+def apply_statement(job: ReconcileJob):
+    """One UPDATE ... FROM unnest() per batch, so its rowcount is the rows actually changed.
+
+    Only rows still holding the value the diff saw are updated, so concurrent edits win.
+    """
+    child_id = primary_key(job.child)
+    key_array = ARRAY(job.foreign_key.type)
+    batch = (
+        func.unnest(
+            bindparam("b_ids", type_=ARRAY(child_id.type)), bindparam("b_old", type_=key_array),
+            bindparam("b_new", type_=key_array),
+        )
+        .table_valued("id", "old_id", "new_id")
+        .render_derived(name="batch")
+    )
+    return (
+        update(job.child.__table__)
+        .where(child_id == batch.c.id)
+        .where(job.foreign_key.is_not_distinct_from(batch.c.old_id))
+        .values({job.foreign_key.name: batch.c.new_id})
+    )
+
+
+def cell_params(cell: Cell, tolerance_m: float) -> Dict[str, Any]:
+    cx, cy = cell
+    miny, maxy = cy * PARTITION_DEGREES, (cy + 1) * PARTITION_DEGREES
+    # Degrees of longitude shrink towards the poles; size the radius for the cell's worst latitude
+    widest = max(abs(miny), abs(maxy))
+    tolerance_deg = tolerance_m / (METRES_PER_DEGREE * max(math.cos(math.radians(min(widest, 89.0))), 0.01))
+    return {
+        "cx": float(cx), "cy": float(cy),
+        "minx": cx * PARTITION_DEGREES, "miny": miny,
+        "maxx": (cx + 1) * PARTITION_DEGREES, "maxy": maxy,
+        "tolerance_m": tolerance_m, "tolerance_deg": tolerance_deg,
+    }
+
+
+async def reconcile_cell(session_factory, job: ReconcileJob, cell: Cell, tolerance_m: float,
+                         only_missing: bool, apply: bool) -> Optional[Tuple[List[Dict[str, Any]], int]]:
+    """Diff (and optionally update) one cell: the changes and the rows updated, or None if another process holds it."""
+    async with session_factory() as db:
+        locked = (await db.execute(
+            text("SELECT pg_try_advisory_xact_lock(hashtext(:job), hashtext(:cell))"),
+            {"job": job.name, "cell": f"{cell[0]}:{cell[1]}"},
+        )).scalar_one()
+        if not locked:
+            return None
+        rows = (await db.execute(diff_statement(job, only_missing), cell_params(cell, tolerance_m))).all()
+        changes = [
+            {"id": row.id, "old_id": row.old_id, "new_id": row.new_id, "distance_m": row.distance_m}
+            for row in rows
+        ]
+        updated = 0
+        if apply and changes:
+            statement = apply_statement(job)
+            for start in range(0, len(changes), APPLY_BATCH_SIZE):
+                batch = changes[start:start + APPLY_BATCH_SIZE]
+                result = await db.execute(statement, {
+                    "b_ids": [c["id"] for c in batch],
+                    "b_old": [c["old_id"] for c in batch],
+                    "b_new": [c["new_id"] for c in batch],
+                })
+                updated += result.rowcount
+        await db.commit()
+        return changes, updated
+
+
+async def run_job(session_factory, name: str, tolerance_m: float = DEFAULT_TOLERANCE_M,
+                  only_missing: bool = True, apply: bool = False,
+                  concurrency: int = DEFAULT_CONCURRENCY) -> Dict[str, Any]:
+    job = JOBS.get(name)
+    if job is None:
+        raise ValueError(f"Unknown reconcile job '{name}'; expected one of: {', '.join(JOBS)}")
+    started = time.perf_counter()
+    async with session_factory() as db:
+        cells = [(int(cx), int(cy)) for cx, cy in await db.execute(partitions_statement(job, only_missing))]
+
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def run_cell(cell: Cell):
+        async with semaphore:
+            return await reconcile_cell(session_factory, job, cell, tolerance_m, only_missing, apply)
+
+    results = await asyncio.gather(*(run_cell(cell) for cell in cells))
+    changes = [change for result in results if result for change in result[0]]
+    updated = sum(result[1] for result in results if result)
+    return {
+        "job": name,
+        "applied": apply,
+        "tolerance_m": tolerance_m,
+        "partitions": len(cells),
+        # Cells locked by a concurrent run of the same job
+        "skipped_partitions": sum(result is None for result in results),
+        "changes": len(changes),
+        "updated": updated,
+        # Rows edited by someone else between the diff and the update, left as they were
+        "skipped_rows": len(changes) - updated if apply else 0,
+        "elapsed_s": round(time.perf_counter() - started, 3),
+        "diff": changes[:MAX_REPORT_ROWS],
+        "truncated": len(changes) > MAX_REPORT_ROWS,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Assign children to their nearest parent asset")
+    parser.add_argument("job", choices=list(JOBS))
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE_M, help="metres")
+    parser.add_argument("--all", action="store_true", help="recheck assigned rows too, not only NULL ones")
+    parser.add_argument("--apply", action="store_true", help="write the updates; default is a dry run")
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY)
+    args = parser.parse_args()
+
+    from app.database import AsyncSessionLocal
+    report = asyncio.run(run_job(
+        AsyncSessionLocal, args.job, args.tolerance, not args.all, args.apply, args.concurrency
+    ))
+    for change in report["diff"]:
+        print(f"{change['id']}\t{change['old_id']}\t{change['new_id']}\t{change['distance_m']:.1f}")
+    outcome = f"{report['updated']} updated, {report['skipped_rows']} edited meanwhile" if args.apply else "dry run"
+    print(
+        f"{report['changes']} change(s) in {report['partitions']} partition(s), "
+        f"{report['skipped_partitions']} skipped, {outcome}, {report['elapsed_s']}s"
+    )
+
+
+if __name__ == "__main__":
+    main()
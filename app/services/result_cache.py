@@ -0,0 +1,116 @@
+# app/services/result_cache.py
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Iterable, Optional, Set, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# Tables a query reads; good enough for FROM/JOIN lists written by hand
+READ_TABLE_RE = re.compile(r"\b(?:FROM|JOIN)\s+([\w\".]+)", re.IGNORECASE)
+WRITE_TABLE_RE = re.compile(
+    r"\b(?:INSERT\s+INTO|UPDATE|DELETE\s+FROM|TRUNCATE(?:\s+TABLE)?)\s+(?:ONLY\s+)?([\w\".]+)",
+    re.IGNORECASE,
+)
+
+def _table_key(identifier: str) -> str:
+    # Compare on the bare table name so "network.poles" and "poles" match; a
+    # needless invalidation is cheap, a missed one serves stale data
+    return identifier.replace('"', "").split(".")[-1].lower()
+
+
+def read_tables(sql: str) -> Set[str]:
+    return {_table_key(t) for t in READ_TABLE_RE.findall(sql)}
+
+
+def write_tables(sql: str) -> Set[str]:
+    return {_table_key(t) for t in WRITE_TABLE_RE.findall(sql)}
+
+
+class EndpointCache:
+    """TTL + size-bounded LRU cache for one dynamic endpoint."""
+
+    def __init__(self, ttl: float, max_entries: int, tables: Iterable[str]):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.tables = frozenset(tables)
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key: Hashable, value: Any):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl": self.ttl,
+            "tables": sorted(self.tables),
+        }
+
+
+endpoint_caches: Dict[str, EndpointCache] = {}
+
+
+def register_cache(name: str, sql: str, ttl: float, max_entries: int) -> EndpointCache:
+    cache = EndpointCache(ttl, max_entries, read_tables(sql))
+    endpoint_caches[name] = cache
+    return cache
+
+
+def cache_key(name: str, params: Dict[str, Any]) -> Tuple:
+    # params are already converted to their SQL types, so "7" and "07" share an entry
+    return (name, tuple(sorted(params.items())))
+
+
+def invalidate_tables(tables: Iterable[str]):
+    tables = {_table_key(t) for t in tables}
+    for cache in endpoint_caches.values():
+        if cache.tables & tables:
+            cache.clear()
+
+
+def install_invalidation(engine: Engine):
+    """Clear caches reading a table once a transaction that wrote to it commits."""
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _track_writes(conn, cursor, statement, parameters, context, executemany):
+        tables = write_tables(statement)
+        if tables:
+            conn.info.setdefault("written_tables", set()).update(tables)
+
+    @event.listens_for(engine, "commit")
+    def _invalidate_on_commit(conn):
+        tables = conn.info.pop("written_tables", None)
+        if tables:
+            invalidate_tables(tables)
+
+    @event.listens_for(engine, "rollback")
+    def _forget_on_rollback(conn):
+        conn.info.pop("written_tables", None)
@@ -0,0 +1,132 @@
+# app/services/spatial_index.py
+"""Creates and validates the spatial (GiST) and BRIN indexes on network.* tables.
+
+Tables created through SQLAlchemy get a GiST index from GeoAlchemy2, but
+tables loaded by other tools often have none, and an interrupted
+CREATE INDEX CONCURRENTLY leaves an invalid index the planner ignores. Every
+bbox, tile and nearest-neighbour query depends on these indexes.
+
+Building holds a session advisory lock, so of several workers starting
+together one builds and the others only report. An index that is invalid
+because a build is still running (pg_stat_progress_create_index) is reported
+as building and left alone.
+"""
+import logging
+import os
+from dataclasses import dataclass
+from typing import Any, Dict, List
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from app.services.layers import LAYERS
+
+logger = logging.getLogger(__name__)
+
+# Create missing indexes at startup instead of only reporting them; off by
+# default because building GiST over a large table takes minutes
+SPATIAL_INDEX_AUTOCREATE = os.getenv("SPATIAL_INDEX_AUTOCREATE", "0") == "1"
+# Append-mostly tables get a BRIN index on created_at: rows arrive in time
+# order, so a few kilobytes of block ranges replace a full B-tree
+BRIN_TABLES = tuple(t for t in os.getenv("BRIN_TABLES", "meters,service_points").split(",") if t)
+BUILD_LOCK_KEY = "spatial_indexes"
+
+EXISTING_INDEXES_SQL = text("""
+SELECT c.relname AS table_name, i.relname AS index_name, am.amname AS method,
+       a.attname AS column_name, ix.indisvalid AS valid,
+       EXISTS (SELECT 1 FROM pg_stat_progress_create_index p WHERE p.index_relid = ix.indexrelid) AS building
+FROM pg_index ix
+JOIN pg_class i ON i.oid = ix.indexrelid
+JOIN pg_class c ON c.oid = ix.indrelid
+JOIN pg_namespace n ON n.oid = c.relnamespace
+JOIN pg_am am ON am.oid = i.relam
+JOIN pg_attribute a ON a.attrelid = c.oid AND a.attnum = ix.indkey[0]
+WHERE n.nspname = :schema
+""")
+
+
+@dataclass(frozen=True)
+class IndexSpec:
+    schema: str
+    table: str
+    column: str
+    method: str
+
+    @property
+    def name(self) -> str:
+        # GeoAlchemy2 names its GiST indexes idx_<table>_<column>; keep that for gist
+        suffix = "" if self.method == "gist" else f"_{self.method}"
+        return f"idx_{self.table}_{self.column}{suffix}"
+
+    def create_sql(self) -> str:
+        return (
+            f'CREATE INDEX CONCURRENTLY IF NOT EXISTS "{self.name}" '
+            f'ON "{self.schema}"."{self.table}" USING {self.method} ("{self.column}")'
+        )
+
+
+def required_indexes() -> List[IndexSpec]:
+    specs = []
+    for name, model in LAYERS.items():
+        schema = model.__table__.schema
+        specs.append(IndexSpec(schema, name, "geom", "gist"))
+        if name in BRIN_TABLES:
+            specs.append(IndexSpec(schema, name, "created_at", "brin"))
+    return specs
+
+
+async def check_spatial_indexes(engine: AsyncEngine, create: bool = False) -> List[Dict[str, Any]]:
+    """Report each required index as ok, missing, invalid or building; with ``create`` also fix them.
+
+    An index counts when its leading column and access method match, whatever
+    its name, so hand-made indexes are not duplicated. While another session
+    holds the build lock nothing is created, as without ``create``.
+    """
+    specs = required_indexes()
+    report = []
+    # CONCURRENTLY cannot run inside a transaction block
+    async with engine.connect() as conn:
+        conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+        # Try, never wait: a session waiting for the lock holds a snapshot that the
+        # builder's CREATE INDEX CONCURRENTLY would in turn wait for
+        locked = create and await conn.scalar(
+            text("SELECT pg_try_advisory_lock(hashtext(:key))"), {"key": BUILD_LOCK_KEY}
+        )
+        try:
+            existing: Dict[tuple, List[Any]] = {}
+            for schema in {spec.schema for spec in specs}:
+                for row in await conn.execute(EXISTING_INDEXES_SQL, {"schema": schema}):
+                    existing.setdefault((schema, row.table_name, row.column_name, row.method), []).append(row)
+
+            for spec in specs:
+                found = existing.get((spec.schema, spec.table, spec.column, spec.method), [])
+                valid = [row.index_name for row in found if row.valid]
+                entry = {"table": spec.table, "column": spec.column, "method": spec.method}
+                if valid:
+                    report.append({**entry, "index": valid[0], "status": "ok"})
+                    continue
+                building = [row.index_name for row in found if row.building]
+                if building:
+                    # Invalid only until the running build finishes; dropping it would cancel that work
+                    report.append({**entry, "index": building[0], "status": "building"})
+                    continue
+
+                status = "invalid" if found else "missing"
+                if locked:
+                    # A failed concurrent build leaves an invalid index that blocks IF NOT EXISTS
+                    for row in found:
+                        await conn.execute(
+                            text(f'DROP INDEX CONCURRENTLY IF EXISTS "{spec.schema}"."{row.index_name}"')
+                        )
+                    await conn.execute(text(spec.create_sql()))
+                    await conn.execute(text(f'ANALYZE "{spec.schema}"."{spec.table}"'))
+                    status = "created"
+                else:
+                    logger.warning(
+                        "%s index on %s.%s(%s) is %s", spec.method, spec.schema, spec.table, spec.column, status
+                    )
+                report.append({**entry, "index": spec.name, "status": status})
+        finally:
+            if locked:
+                await conn.execute(text("SELECT pg_advisory_unlock(hashtext(:key))"), {"key": BUILD_LOCK_KEY})
+    return report
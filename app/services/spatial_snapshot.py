@@ -0,0 +1,283 @@
+# app/services/spatial_snapshot.py
+"""In-process spatial index snapshots for read-mostly point layers.
+
+Layers listed in SPATIAL_SNAPSHOT_LAYERS (e.g. ``substations,poles``) are
+loaded at startup into packed arrays plus a Shapely STRtree, and /features
+and /nearest are answered from memory without a database round trip.
+
+Per row the snapshot keeps the id, lon/lat, a stale flag, the point the
+STRtree indexes and an offset into one buffer of PostGIS-rendered GeoJSON.
+benchmarks/bench_spatial_snapshot.py measures, for one million points,
+about 275 MB for ids, coordinates and tree plus 245 MB of pole-sized
+features, ~50 us per bbox query and ~170 us per 5-nearest.
+
+Edits from the change feed are re-read in batches every REFRESH_DELAY
+seconds into a small overlay consulted on every query; once it exceeds
+REBUILD_FRACTION of the layer, arrays and tree are rebuilt in a thread.
+"""
+import asyncio
+import logging
+import math
+import os
+from collections import defaultdict
+from typing import Dict, List, Optional, Sequence, Set, Tuple
+
+from sqlalchemy import func, select
+from starlette.concurrency import run_in_threadpool
+
+from app.services.layers import LAYERS, BBox, geojson_feature, primary_key
+
+try:
+    import numpy as np
+    import shapely
+except ImportError:  # optional dependency
+    np = None
+    shapely = None
+
+logger = logging.getLogger(__name__)
+
+SPATIAL_SNAPSHOT_LAYERS = tuple(t for t in os.getenv("SPATIAL_SNAPSHOT_LAYERS", "").split(",") if t)
+REBUILD_FRACTION = 0.05
+SNAPSHOT_BATCH_SIZE = 50_000
+EARTH_RADIUS_M = 6_371_008.8
+METRES_PER_DEGREE = math.pi * EARTH_RADIUS_M / 180
+# First search radius for nearest(); doubled until k hits are provably found
+INITIAL_RADIUS_M = 100.0
+# Changed ids are collected this long and re-read together, at most REFRESH_BATCH_SIZE per query
+REFRESH_DELAY = 0.1
+REFRESH_BATCH_SIZE = 5_000
+
+# id -> (lon, lat, feature) for inserted/updated rows, None for deleted ones
+Overlay = Dict[int, Optional[Tuple[float, float, bytes]]]
+
+
+def haversine(lon, lat, lons, lats):
+    """Great-circle distance in metres from one point to arrays of points."""
+    lon, lat, lons, lats = map(np.radians, (lon, lat, lons, lats))
+    a = np.sin((lats - lat) / 2) ** 2 + np.cos(lat) * np.cos(lats) * np.sin((lons - lon) / 2) ** 2
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+def search_boxes(lon: float, lat: float, radius: float) -> List[Tuple[float, float, float, float]]:
+    """Lon/lat boxes holding every point within ``radius`` metres, split at the antimeridian.
+
+    Longitude degrees are widened for the latitude within the radius that is
+    closest to a pole, where they are shortest; a radius reaching a pole
+    takes every longitude.
+    """
+    dlat = radius / METRES_PER_DEGREE
+    miny, maxy = max(lat - dlat, -90.0), min(lat + dlat, 90.0)
+    worst = abs(lat) + dlat
+    dlon = 180.0 if worst >= 90.0 else radius / (METRES_PER_DEGREE * math.cos(math.radians(worst)))
+    if dlon >= 180.0:
+        return [(-180.0, miny, 180.0, maxy)]
+    minx, maxx = lon - dlon, lon + dlon
+    if minx < -180.0:
+        return [(-180.0, miny, maxx, maxy), (minx + 360.0, miny, 180.0, maxy)]
+    if maxx > 180.0:
+        return [(minx, miny, 180.0, maxy), (-180.0, miny, maxx - 360.0, maxy)]
+    return [(minx, miny, maxx, maxy)]
+
+
+class LayerSnapshot:
+    def __init__(self, name: str, ids, coords, features: Sequence[bytes]):
+        self.name = name
+        self._overlay: Overlay = {}
+        self._rebuilding = False
+        self._swap(*self._build(ids, coords, features))
+
+    @staticmethod
+    def _build(ids, coords, features: Sequence[bytes]):
+        ids = np.asarray(ids, dtype=np.int64)
+        coords = np.asarray(coords, dtype=np.float64).reshape(-1, 2)
+        order = np.argsort(ids, kind="stable")
+        if not np.all(order[:-1] < order[1:]):
+            ids, coords, features = ids[order], coords[order], [features[i] for i in order]
+        offsets = np.zeros(len(features) + 1, dtype=np.int64)
+        np.cumsum([len(f) for f in features], out=offsets[1:])
+        tree = shapely.STRtree(shapely.points(coords))
+        return ids, coords, b"".join(features), offsets, tree
+
+    def _swap(self, ids, coords, blob, offsets, tree):
+        self._ids, self._coords, self._blob, self._offsets, self._tree = ids, coords, blob, offsets, tree
+        self._stale = np.zeros(len(ids), dtype=bool)
+        for id_ in self._overlay:
+            self._mark_stale(id_)
+
+    def __len__(self):
+        return int(len(self._ids) - self._stale.sum()) + sum(v is not None for v in self._overlay.values())
+
+    def _base_index(self, id_: int) -> int:
+        i = int(np.searchsorted(self._ids, id_))
+        return i if i < len(self._ids) and self._ids[i] == id_ else -1
+
+    def _mark_stale(self, id_: int):
+        i = self._base_index(id_)
+        if i >= 0:
+            self._stale[i] = True
+
+    def _feature_bytes(self, i: int) -> bytes:
+        return self._blob[self._offsets[i]:self._offsets[i + 1]]
+
+    def _feature(self, i: int) -> str:
+        return self._feature_bytes(i).decode()
+
+    def apply(self, id_: int, value: Optional[Tuple[float, float, bytes]]):
+        self._overlay[id_] = value
+        self._mark_stale(id_)
+
+    def needs_rebuild(self) -> bool:
+        return not self._rebuilding and len(self._overlay) > REBUILD_FRACTION * max(len(self._ids), 1000)
+
+    async def rebuild(self):
+        """Fold the overlay into fresh arrays and tree off the event loop."""
+        self._rebuilding = True
+        try:
+            folded = dict(self._overlay)
+            live = ~self._stale
+            ids = list(self._ids[live])
+            coords = list(map(tuple, self._coords[live]))
+            features = [self._feature_bytes(i) for i in np.flatnonzero(live)]
+            for id_, value in folded.items():
+                if value is not None:
+                    ids.append(id_)
+                    coords.append(value[:2])
+                    features.append(value[2])
+            built = await run_in_threadpool(self._build, ids, coords, features)
+            # Entries changed again while building stay in the overlay
+            for id_, value in folded.items():
+                if self._overlay.get(id_, ...) is value:
+                    del self._overlay[id_]
+            self._swap(*built)
+        finally:
+            self._rebuilding = False
+
+    def query_bbox(self, bbox: BBox, limit: int) -> List[str]:
+        """Features whose point lies in ``bbox`` (bounds inclusive, like ``&&``)."""
+        hits = self._tree.query(shapely.box(*bbox))
+        hits = hits[~self._stale[hits]][:limit]
+        features = [self._feature(i) for i in hits]
+        minx, miny, maxx, maxy = bbox
+        for value in self._overlay.values():
+            if len(features) >= limit:
+                break
+            if value is not None and minx <= value[0] <= maxx and miny <= value[1] <= maxy:
+                features.append(value[2].decode())
+        return features
+
+    def nearest(self, lon: float, lat: float, k: int, max_distance: Optional[float]) -> List[Tuple[float, int, str]]:
+        """The k nearest rows as (distance_m, id, feature).
+
+        Searches boxes of growing radius; once k rows lie within that radius no
+        row outside the boxes can be closer, so no nearer row is missed.
+        Distances are haversine on a sphere of EARTH_RADIUS_M, while the
+        database path measures on the spheroid: they differ by up to ~0.5%, so
+        rows at almost equal distances may rank differently and
+        ``max_distance`` cuts off at a slightly different place.
+        """
+        extra = [(id_, v) for id_, v in self._overlay.items() if v is not None]
+        if extra:
+            extra_d = haversine(lon, lat, np.array([v[0] for _, v in extra]), np.array([v[1] for _, v in extra]))
+        radius = min(INITIAL_RADIUS_M, max_distance) if max_distance else INITIAL_RADIUS_M
+        while True:
+            # Split boxes do not overlap, so no row is found twice
+            idx = np.concatenate([self._tree.query(shapely.box(*box)) for box in search_boxes(lon, lat, radius)])
+            idx = idx[~self._stale[idx]]
+            dist = haversine(lon, lat, self._coords[idx, 0], self._coords[idx, 1])
+            candidates = [(float(d), int(self._ids[i]), i) for d, i in zip(dist, idx) if d <= radius]
+            if extra:
+                candidates += [(float(d), id_, v) for d, (id_, v) in zip(extra_d, extra) if d <= radius]
+            exhausted = radius >= math.pi * EARTH_RADIUS_M or (max_distance and radius >= max_distance)
+            if len(candidates) >= k or exhausted:
+                break
+            radius = min(radius * 2, max_distance) if max_distance else radius * 2
+        candidates.sort(key=lambda c: (c[0], c[1]))
+        return [
+            (d, id_, self._feature(ref) if isinstance(ref, (int, np.integer)) else ref[2].decode())
+            for d, id_, ref in candidates[:k]
+        ]
+
+
+snapshots: Dict[str, LayerSnapshot] = {}
+# Ids changed per layer and not yet re-read, see refresh_later
+_pending: Dict[str, Set[int]] = defaultdict(set)
+_refresh: Optional[asyncio.Future] = None
+
+
+def get_snapshot(layer: str) -> Optional[LayerSnapshot]:
+    return snapshots.get(layer)
+
+
+def _snapshot_query(model):
+    return select(
+        primary_key(model), func.ST_X(model.geom), func.ST_Y(model.geom), geojson_feature(model)
+    )
+
+
+async def load_snapshot(db, name: str) -> LayerSnapshot:
+    model = LAYERS[name]
+    ids, coords, features = [], [], []
+    result = await db.stream(_snapshot_query(model), execution_options={"yield_per": SNAPSHOT_BATCH_SIZE})
+    async for rows in result.partitions():
+        for id_, x, y, feature in rows:
+            ids.append(id_)
+            coords.append((x, y))
+            features.append(feature.encode())
+    return await run_in_threadpool(LayerSnapshot, name, ids, coords, features)
+
+
+async def load_snapshots(session_factory):
+    if not SPATIAL_SNAPSHOT_LAYERS:
+        return
+    if shapely is None:
+        raise RuntimeError("SPATIAL_SNAPSHOT_LAYERS requires the optional 'shapely' and 'numpy' packages")
+    for name in SPATIAL_SNAPSHOT_LAYERS:
+        model = LAYERS.get(name)
+        if model is None or model.geom.type.geometry_type != "POINT":
+            raise ValueError(f"Spatial snapshots need a point layer, got '{name}'")
+        async with session_factory() as db:
+            snapshots[name] = await load_snapshot(db, name)
+        logger.info("Loaded %d %s into the spatial snapshot", len(snapshots[name]), name)
+
+
+async def refresh_rows(session_factory, name: str, ids: Sequence[int]):
+    """Re-read changed rows into the overlay; ids no longer in the table are removed."""
+    snapshot = snapshots[name]
+    model = LAYERS[name]
+    found = {}
+    async with session_factory() as db:
+        for start in range(0, len(ids), REFRESH_BATCH_SIZE):
+            chunk = ids[start:start + REFRESH_BATCH_SIZE]
+            rows = await db.execute(_snapshot_query(model).where(primary_key(model).in_(chunk)))
+            found.update((id_, (x, y, feature.encode())) for id_, x, y, feature in rows)
+    for id_ in ids:
+        snapshot.apply(id_, found.get(id_))
+    if snapshot.needs_rebuild():
+        asyncio.ensure_future(snapshot.rebuild())
+
+
+def refresh_later(session_factory, name: str, id_: int):
+    """Queue a changed row; the ids queued within REFRESH_DELAY are re-read together."""
+    global _refresh
+    _pending[name].add(id_)
+    if _refresh is None or _refresh.done():
+        _refresh = asyncio.ensure_future(_refresh_pending(session_factory))
+
+
+async def _refresh_pending(session_factory):
+    global _pending
+    while _pending:
+        await asyncio.sleep(REFRESH_DELAY)
+        pending, _pending = _pending, defaultdict(set)
+        for name, ids in pending.items():
+            try:
+                await refresh_rows(session_factory, name, sorted(ids))
+            except Exception:
+                logger.exception("Refreshing %d %s in the spatial snapshot failed", len(ids), name)
+
+
+async def reload_snapshots(session_factory):
+    """Notifications missed while the listener was down are unrecoverable; reload everything."""
+    for name in list(snapshots):
+        async with session_factory() as db:
+            snapshots[name] = await load_snapshot(db, name)
@@ -0,0 +1,362 @@
+# app/services/tile_cache.py
+"""Disk-backed vector tile cache (MBTiles-style SQLite) with LRU eviction.
+
+Tiles are keyed by layer spec and z/x/y. Rows use the MBTiles column names,
+with TMS tile_row. Invalidation is targeted: a change to one feature deletes
+only the tiles of layers showing that table whose bounds, widened by the clip
+buffer, intersect the feature's old or new bbox. Change notifications are
+coalesced for INVALIDATE_DELAY seconds, so a bulk UPDATE (one notification
+per row) costs one transaction with each affected tile range deleted once.
+A tile rendered from data older than an invalidation queued during its
+render is served but not stored (see render).
+
+Hits do not write: access times are kept in memory and flushed to the
+``accessed`` column every ACCESS_FLUSH_SECONDS (or ACCESS_FLUSH_ROWS
+entries), and before eviction. Times not yet flushed when the process exits
+are lost, which only makes eviction slightly less exact.
+
+Every uvicorn worker opens the same file, so the cache size is kept in the
+file as well: triggers on ``tiles`` maintain one ``cache_size`` row in the
+transaction of every insert, update and delete, and each put compares that
+shared total, not a per-worker count, with the limit.
+
+Seed an area ahead of time with:
+
+    python -m app.services.tile_cache --feeder 12 --zooms 12-17 --layer network
+"""
+import argparse
+import asyncio
+import logging
+import math
+import os
+import sqlite3
+import threading
+import time
+from collections import defaultdict, deque
+from typing import Awaitable, Callable, Deque, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from sqlalchemy import func, select
+from starlette.concurrency import run_in_threadpool
+
+from app.services.layers import BBox
+from app.services.vector_tiles import MAX_ZOOM, TILE_BUFFER, TILE_EXTENT, TileLayer
+
+logger = logging.getLogger(__name__)
+
+TILE_CACHE_PATH = os.getenv("TILE_CACHE_PATH", "tile_cache.mbtiles")
+TILE_CACHE_MAX_BYTES = int(os.getenv("TILE_CACHE_MAX_BYTES", str(1024 ** 3)))
+# Evict down to this fraction of the limit so eviction does not run on every insert
+EVICT_TO = 0.9
+ACCESS_FLUSH_SECONDS = 30.0
+ACCESS_FLUSH_ROWS = 1000
+INVALIDATE_DELAY = 0.5
+# Tile ranges up to this many tiles are deleted tile by tile in one executemany
+SMALL_RANGE_TILES = 16
+
+# One transaction, so a worker starting meanwhile cannot add a tile between the
+# initial sum and the triggers
+SCHEMA = """
+BEGIN IMMEDIATE;
+CREATE TABLE IF NOT EXISTS tiles (
+    layers TEXT NOT NULL,
+    zoom_level INTEGER NOT NULL,
+    tile_column INTEGER NOT NULL,
+    tile_row INTEGER NOT NULL,
+    tile_data BLOB NOT NULL,
+    size INTEGER NOT NULL,
+    accessed REAL NOT NULL,
+    PRIMARY KEY (layers, zoom_level, tile_column, tile_row)
+);
+CREATE INDEX IF NOT EXISTS tiles_position ON tiles (zoom_level, tile_column, tile_row);
+CREATE INDEX IF NOT EXISTS tiles_accessed ON tiles (accessed);
+CREATE TABLE IF NOT EXISTS cache_size (id INTEGER PRIMARY KEY CHECK (id = 0), bytes INTEGER NOT NULL);
+INSERT OR IGNORE INTO cache_size SELECT 0, coalesce(sum(size), 0) FROM tiles;
+CREATE TRIGGER IF NOT EXISTS tiles_size_insert AFTER INSERT ON tiles
+BEGIN UPDATE cache_size SET bytes = bytes + NEW.size; END;
+CREATE TRIGGER IF NOT EXISTS tiles_size_delete AFTER DELETE ON tiles
+BEGIN UPDATE cache_size SET bytes = bytes - OLD.size; END;
+CREATE TRIGGER IF NOT EXISTS tiles_size_update AFTER UPDATE OF size ON tiles
+BEGIN UPDATE cache_size SET bytes = bytes + NEW.size - OLD.size; END;
+COMMIT;
+"""
+
+
+def layers_key(layers: Sequence[Tuple[TileLayer, Sequence[str]]]) -> str:
+    # Leading/trailing commas let invalidation match a table with instr(',poles,')
+    return "," + ",".join(f"{layer.name}:{'|'.join(attrs)}" for layer, attrs in layers) + ","
+
+
+def _tms_row(z: int, y: int) -> int:
+    return (1 << z) - 1 - y
+
+
+def _tile_x(lon: float, z: int) -> float:
+    return (lon + 180.0) / 360.0 * (1 << z)
+
+
+def _tile_y(lat: float, z: int) -> float:
+    lat = max(min(lat, 85.0511287798), -85.0511287798)
+    rad = math.radians(lat)
+    return (1.0 - math.log(math.tan(rad) + 1.0 / math.cos(rad)) / math.pi) / 2.0 * (1 << z)
+
+
+def tile_range(bbox: BBox, z: int, margin: float = 0.0) -> Tuple[int, int, int, int]:
+    """Tiles (x0, y0, x1, y1) at zoom ``z`` covering ``bbox``, widened by ``margin`` tiles."""
+    minx, miny, maxx, maxy = bbox
+    last = (1 << z) - 1
+    x0 = max(0, math.floor(_tile_x(minx, z) - margin))
+    x1 = min(last, math.floor(_tile_x(maxx, z) + margin))
+    y0 = max(0, math.floor(_tile_y(maxy, z) - margin))
+    y1 = min(last, math.floor(_tile_y(miny, z) + margin))
+    return x0, y0, x1, y1
+
+
+def tiles_in_bbox(bbox: BBox, zooms: Iterable[int]) -> Iterator[Tuple[int, int, int]]:
+    for z in zooms:
+        x0, y0, x1, y1 = tile_range(bbox, z)
+        for x in range(x0, x1 + 1):
+            for y in range(y0, y1 + 1):
+                yield z, x, y
+
+
+class TileCache:
+    def __init__(self, path: str, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        # A cache can lose its last commits on power loss; WAL keeps it consistent
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        # Several uvicorn workers share the file
+        self._db.execute("PRAGMA busy_timeout=5000")
+        self._db.executescript(SCHEMA)
+        # (layers, z, x, tms row) -> last hit, not yet written to the accessed column
+        self._accessed: Dict[Tuple[str, int, int, int], float] = {}
+        self._flushed_at = time.monotonic()
+        self._pending: Dict[str, List[BBox]] = defaultdict(list)
+        self._invalidation: Optional[asyncio.Task] = None
+        # Invalidations queued so far, and (number, table, bbox) of those queued
+        # since the oldest render in flight started; renders in flight per start number
+        self._invalidations = 0
+        self._recent: Deque[Tuple[int, str, BBox]] = deque()
+        self._rendering: Dict[int, int] = defaultdict(int)
+
+    def get_sync(self, layers: str, z: int, x: int, y: int) -> Optional[bytes]:
+        key = (layers, z, x, _tms_row(z, y))
+        with self._lock:
+            row = self._db.execute(
+                "SELECT tile_data FROM tiles WHERE layers = ? AND zoom_level = ? AND tile_column = ? AND tile_row = ?",
+                key,
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._accessed[key] = time.time()
+            if len(self._accessed) >= ACCESS_FLUSH_ROWS or time.monotonic() - self._flushed_at >= ACCESS_FLUSH_SECONDS:
+                self._flush_accessed()
+            return row[0]
+
+    def _flush_accessed(self):
+        accessed, self._accessed = self._accessed, {}
+        self._flushed_at = time.monotonic()
+        if not accessed:
+            return
+        self._db.execute("BEGIN")
+        self._db.executemany(
+            "UPDATE tiles SET accessed = ? WHERE layers = ? AND zoom_level = ? AND tile_column = ? AND tile_row = ?",
+            [(when, *key) for key, when in accessed.items()],
+        )
+        self._db.execute("COMMIT")
+
+    def _size(self) -> int:
+        return self._db.execute("SELECT bytes FROM cache_size").fetchone()[0]
+
+    def put_sync(self, layers: str, z: int, x: int, y: int, tile: bytes):
+        with self._lock:
+            # An upsert, not INSERT OR REPLACE: the replaced row's delete would skip the size trigger
+            self._db.execute(
+                "INSERT INTO tiles VALUES (?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (layers, zoom_level, tile_column, tile_row) DO UPDATE SET "
+                "tile_data = excluded.tile_data, size = excluded.size, accessed = excluded.accessed",
+                (layers, z, x, _tms_row(z, y), tile, len(tile), time.time()),
+            )
+            self._accessed.pop((layers, z, x, _tms_row(z, y)), None)
+            if self._size() > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        self._flush_accessed()
+        target = int(self.max_bytes * EVICT_TO)
+        # Write-locked while the victims are chosen, so workers evicting at once do not overshoot
+        self._db.execute("BEGIN IMMEDIATE")
+        size = self._size()
+        cursor = self._db.execute("SELECT rowid, size FROM tiles ORDER BY accessed")
+        doomed = []
+        for rowid, tile_size in cursor:
+            if size <= target:
+                break
+            doomed.append((rowid,))
+            size -= tile_size
+        cursor.close()
+        self._db.executemany("DELETE FROM tiles WHERE rowid = ?", doomed)
+        self._db.execute("COMMIT")
+
+    def invalidate_sync(self, table: str, bbox: BBox) -> int:
+        """Delete tiles of layers showing ``table`` whose buffered bounds intersect ``bbox``."""
+        return self.invalidate_many_sync({table: [bbox]})
+
+    def invalidate_many_sync(self, boxes: Dict[str, Sequence[BBox]]) -> int:
+        """invalidate_sync for many (table, bbox) pairs in one transaction, each tile range deleted once."""
+        margin = TILE_BUFFER / TILE_EXTENT
+        removed = 0
+        with self._lock:
+            self._db.execute("BEGIN")
+            for table, bboxes in boxes.items():
+                pattern = f",{table}:"
+                for z in range(MAX_ZOOM + 1):
+                    tiles, ranges = set(), set()
+                    for x0, y0, x1, y1 in {tile_range(bbox, z, margin) for bbox in bboxes}:
+                        if (x1 - x0 + 1) * (y1 - y0 + 1) <= SMALL_RANGE_TILES:
+                            tiles.update((x, y) for x in range(x0, x1 + 1) for y in range(y0, y1 + 1))
+                        else:
+                            ranges.add((x0, y0, x1, y1))
+                    for x0, y0, x1, y1 in ranges:
+                        removed += self._db.execute(
+                            "DELETE FROM tiles WHERE zoom_level = ? AND tile_column BETWEEN ? AND ? "
+                            "AND tile_row BETWEEN ? AND ? AND instr(layers, ?) > 0",
+                            (z, x0, x1, _tms_row(z, y1), _tms_row(z, y0), pattern),
+                        ).rowcount
+                    removed += self._db.executemany(
+                        "DELETE FROM tiles WHERE zoom_level = ? AND tile_column = ? AND tile_row = ? "
+                        "AND instr(layers, ?) > 0",
+                        [(z, x, _tms_row(z, y), pattern) for x, y in tiles],
+                    ).rowcount
+            self._db.execute("COMMIT")
+        return removed
+
+    async def get(self, layers: str, z: int, x: int, y: int) -> Optional[bytes]:
+        return await run_in_threadpool(self.get_sync, layers, z, x, y)
+
+    async def put(self, layers: str, z: int, x: int, y: int, tile: bytes):
+        await run_in_threadpool(self.put_sync, layers, z, x, y, tile)
+
+    async def render(self, layers: str, z: int, x: int, y: int, render: Callable[[], Awaitable[bytes]]) -> bytes:
+        """The cached tile, else ``render()``'s, stored unless an edit overlapping it arrived meanwhile.
+
+        Such a tile may show the data from before the edit, and its queued
+        invalidation can run before the put; stored, it would outlive it.
+        """
+        tile = await self.get(layers, z, x, y)
+        if tile is not None:
+            return tile
+        start = self._invalidations
+        self._rendering[start] += 1
+        try:
+            tile = await render()
+            if not self._invalidated_since(start, layers, z, x, y):
+                await self.put(layers, z, x, y, tile)
+        finally:
+            self._rendering[start] -= 1
+            if not self._rendering[start]:
+                del self._rendering[start]
+            oldest = min(self._rendering, default=self._invalidations)
+            while self._recent and self._recent[0][0] <= oldest:
+                self._recent.popleft()
+        return tile
+
+    def _invalidated_since(self, start: int, layers: str, z: int, x: int, y: int) -> bool:
+        margin = TILE_BUFFER / TILE_EXTENT
+        for number, table, bbox in reversed(self._recent):
+            if number <= start:
+                break
+            if f",{table}:" in layers:
+                x0, y0, x1, y1 = tile_range(bbox, z, margin)
+                if x0 <= x <= x1 and y0 <= y <= y1:
+                    return True
+        return False
+
+    def invalidate_later(self, table: str, bbox: BBox):
+        """Queue an invalidation; the ones queued within INVALIDATE_DELAY run together."""
+        self._invalidations += 1
+        if self._rendering:
+            self._recent.append((self._invalidations, table, bbox))
+        self._pending[table].append(bbox)
+        if self._invalidation is None or self._invalidation.done():
+            self._invalidation = asyncio.ensure_future(self._invalidate_pending())
+
+    async def _invalidate_pending(self):
+        while self._pending:
+            await asyncio.sleep(INVALIDATE_DELAY)
+            boxes, self._pending = dict(self._pending), defaultdict(list)
+            try:
+                await run_in_threadpool(self.invalidate_many_sync, boxes)
+            except Exception:
+                logger.exception("Tile cache invalidation failed")
+
+    def stats(self):
+        with self._lock:
+            size = self._size()
+        return {"hits": self.hits, "misses": self.misses, "bytes": size, "max_bytes": self.max_bytes}
+
+
+_tile_cache: Optional[TileCache] = None
+
+
+def get_tile_cache() -> TileCache:
+    global _tile_cache
+    if _tile_cache is None:
+        _tile_cache = TileCache(TILE_CACHE_PATH, TILE_CACHE_MAX_BYTES)
+    return _tile_cache
+
+
+async def seed(layer: str, zooms: Sequence[int], feeder_id: Optional[int] = None,
+               substation_id: Optional[int] = None) -> int:
+    """Render and cache every tile over a feeder's or a substation's feeders' extent."""
+    from app.database import AsyncSessionLocal
+    from app.models.elec_models import Feeder
+    from app.services.vector_tiles import render_tile, resolve_layers
+
+    layers = [(tile_layer, tile_layer.attributes) for tile_layer in resolve_layers(layer)]
+    key = layers_key(layers)
+    cache = get_tile_cache()
+    extent = select(
+        func.ST_XMin(func.ST_Extent(Feeder.geom)), func.ST_YMin(func.ST_Extent(Feeder.geom)),
+        func.ST_XMax(func.ST_Extent(Feeder.geom)), func.ST_YMax(func.ST_Extent(Feeder.geom)),
+    )
+    if feeder_id is not None:
+        extent = extent.where(Feeder.feeder_id == feeder_id)
+    else:
+        extent = extent.where(Feeder.substation_id == substation_id)
+
+    async with AsyncSessionLocal() as db:
+        bbox = (await db.execute(extent)).one()
+        if bbox[0] is None:
+            raise ValueError("No feeder geometry found for the requested area")
+        count = 0
+        for z, x, y in tiles_in_bbox(tuple(bbox), zooms):
+            await cache.put(key, z, x, y, await render_tile(db, layers, z, x, y))
+            count += 1
+    return count
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pre-render vector tiles into the tile cache")
+    area = parser.add_mutually_exclusive_group(required=True)
+    area.add_argument("--feeder", type=int)
+    area.add_argument("--substation", type=int)
+    parser.add_argument("--zooms", default="12-16", help="zoom range, e.g. 12-16")
+    parser.add_argument("--layer", default="network", help="layer, group or comma-separated layers")
+    args = parser.parse_args()
+
+    low, _, high = args.zooms.partition("-")
+    zooms = range(int(low), int(high or low) + 1)
+    started = time.perf_counter()
+    count = asyncio.run(seed(args.layer, zooms, args.feeder, args.substation))
+    print(f"Seeded {count} tiles in {time.perf_counter() - started:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
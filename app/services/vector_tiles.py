@@ -0,0 +1,105 @@
+# app/services/vector_tiles.py
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.services.layers import LAYERS
+
+MVT_MEDIA_TYPE = "application/vnd.mapbox-vector-tile"
+TILE_EXTENT = 4096
+TILE_BUFFER = 64
+MAX_ZOOM = 22
+
+
+@dataclass(frozen=True)
+class TileLayer:
+    name: str
+    attributes: Tuple[str, ...]
+    minzoom: int
+    maxzoom: int = MAX_ZOOM
+
+    @property
+    def model(self):
+        return LAYERS[self.name]
+
+    def visible(self, z: int) -> bool:
+        return self.minzoom <= z <= self.maxzoom
+
+
+# Default attributes and zoom visibility; detail layers only appear once they are legible
+TILE_LAYERS: Dict[str, TileLayer] = {
+    layer.name: layer
+    for layer in (
+        TileLayer("substations", ("substation_id", "substation_name", "voltage_level_kv", "status"), 0),
+        TileLayer("feeders", ("feeder_id", "feeder_name", "substation_id", "voltage_level_kv"), 5),
+        TileLayer("transformers", ("transformer_id", "transformer_name", "feeder_id", "capacity_kva", "status"), 12),
+        TileLayer("conductors", ("conductor_id", "conductor_type", "voltage_rating_kv"), 13),
+        TileLayer("poles", ("pole_id", "transformer_id", "material_type"), 14),
+        TileLayer("switches", ("switch_id", "conductor_id", "switch_type", "operational_status"), 14),
+        TileLayer("fuses", ("fuse_id", "conductor_id", "fuse_rating_amps", "operational_status"), 14),
+        TileLayer("meters", ("meter_id", "pole_id", "meter_number"), 15),
+        TileLayer("service_points", ("service_point_id", "meter_id", "service_status"), 16),
+    )
+}
+
+# Named multi-layer tiles served in one request
+TILE_GROUPS: Dict[str, Tuple[str, ...]] = {
+    "network": ("feeders", "conductors", "poles", "transformers"),
+}
+
+
+def resolve_layers(name: str) -> List[TileLayer]:
+    """``name`` is a layer, a group from TILE_GROUPS, or a comma-separated list of layers."""
+    names = TILE_GROUPS.get(name) or tuple(name.split(","))
+    unknown = [n for n in names if n not in TILE_LAYERS]
+    if unknown:
+        raise ValueError(f"Unknown tile layer(s): {', '.join(unknown)}")
+    return [TILE_LAYERS[n] for n in names]
+
+
+def validate_tile(z: int, x: int, y: int):
+    if not 0 <= z <= MAX_ZOOM or not 0 <= x < 2 ** z or not 0 <= y < 2 ** z:
+        raise ValueError(f"Tile {z}/{x}/{y} is out of range")
+
+
+def select_attributes(layer: TileLayer, requested: Optional[str]) -> Tuple[str, ...]:
+    if requested is None:
+        return layer.attributes
+    columns = set(layer.model.__table__.columns.keys()) - {"geom"}
+    attributes = tuple(a for a in requested.split(",") if a)
+    unknown = [a for a in attributes if a not in columns]
+    if unknown:
+        raise ValueError(f"Unknown attribute(s) for {layer.name}: {', '.join(unknown)}")
+    return attributes
+
+
+def _layer_sql(layer: TileLayer, attributes: Sequence[str]) -> str:
+    table = layer.model.__table__
+    columns = "".join(f', t."{a}"' for a in attributes)
+    # The && filter uses the GiST index on geom; the envelope is widened by the
+    # clip buffer so features straddling the tile edge are not cut short
+    return (
+        f"COALESCE((SELECT ST_AsMVT(mvt.*, '{layer.name}', {TILE_EXTENT}, 'geom') FROM ("
+        f"SELECT ST_AsMVTGeom(ST_Transform(t.geom, 3857), ST_TileEnvelope(:z, :x, :y), "
+        f"{TILE_EXTENT}, {TILE_BUFFER}, true) AS geom{columns} "
+        f'FROM "{table.schema}"."{table.name}" AS t '
+        f"WHERE t.geom && ST_Transform(ST_TileEnvelope(:z, :x, :y, margin => {TILE_BUFFER / TILE_EXTENT}), 4326)"
+        f") AS mvt), ''::bytea)"
+    )
+
+
+def tile_statement(layers: Sequence[Tuple[TileLayer, Sequence[str]]]):
+    # ST_AsMVT output for separate layers can simply be concatenated into one tile
+    return text("SELECT " + " || ".join(_layer_sql(layer, attrs) for layer, attrs in layers))
+
+
+async def render_tile(
+    db: AsyncSession, layers: Sequence[Tuple[TileLayer, Sequence[str]]], z: int, x: int, y: int
+) -> bytes:
+    visible = [(layer, attrs) for layer, attrs in layers if layer.visible(z)]
+    if not visible:
+        return b""
+    tile = (await db.execute(tile_statement(visible), {"z": z, "x": x, "y": y})).scalar_one()
+    return bytes(tile or b"")
@@ -0,0 +1,95 @@
+"""Build time, query latency and incremental upkeep of app.services.islands.Islands.
+
+Replays random switch operations plus conductor inserts and deletes as
+change-feed payloads on the synthetic network, then checks the maintained
+islands and their substations against a labelling from scratch.
+
+    python -m benchmarks.bench_islands [--meters 1000000] [--changes 2000]
+"""
+import argparse
+import time
+
+import numpy as np
+
+from app.services.islands import Islands, component_labels
+from app.services.topology import KIND_INDEX, Topology
+from benchmarks.bench_topology import make_network
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--meters", type=int, default=1_000_000)
+    parser.add_argument("--changes", type=int, default=2000)
+    args = parser.parse_args()
+    rng = np.random.default_rng(7)
+
+    topology = Topology(*make_network(args.meters, rng))
+    started = time.perf_counter()
+    islands = Islands(topology)
+    print(f"build:       {time.perf_counter() - started:8.2f} s, {islands.stats()}")
+
+    pole_ids = topology.ids[KIND_INDEX["poles"]]
+    substation_ids = topology.ids[KIND_INDEX["substations"]]
+    queries = [(int(p), int(s)) for p, s in zip(rng.choice(pole_ids, 10_000), rng.choice(substation_ids, 10_000))]
+    started = time.perf_counter()
+    for pole_id, substation_id in queries:
+        islands.energized_from(pole_id, substation_id)
+    print(f"energized:   {(time.perf_counter() - started) / len(queries) * 1e6:8.2f} us per query")
+
+    # What the network looks like after the changes, tracked independently
+    ends = {int(c): (int(a), int(b)) for c, a, b in zip(topology.conductor_ids, topology.conductor_start,
+                                                         topology.conductor_end) if a >= 0 and b >= 0}
+    switch_ids, switch_on, switch_open = topology.devices["switches"]
+    status = {int(s): bool(o) for s, o in zip(switch_ids, switch_open)}
+    switch_conductor = {int(s): int(topology.conductor_ids[c]) for s, c in zip(switch_ids, switch_on) if c >= 0}
+    next_conductor = int(topology.conductor_ids.max()) + 1
+
+    timings = {"switch": [], "insert": [], "delete": []}
+    for _ in range(args.changes):
+        roll = rng.random()
+        if roll < 0.8:
+            switch = int(rng.choice(list(switch_conductor)))
+            old = {"switch_id": switch, "conductor_id": switch_conductor[switch],
+                   "operational_status": "Open" if status[switch] else "Closed"}
+            status[switch] = not status[switch]
+            change = {"table": "switches", "op": "UPDATE", "row": {**old, "operational_status":
+                      "Open" if status[switch] else "Closed"}, "old": old}
+            kind = "switch"
+        elif roll < 0.9:
+            # A new span next to an existing one, as when a line is re-conductored
+            a, b = ends[int(rng.choice(list(ends)))]
+            ends[next_conductor] = (int(a), int(b))
+            change = {"table": "conductors", "op": "INSERT", "row": {
+                "conductor_id": next_conductor, "start_pole_id": int(pole_ids[a]), "end_pole_id": int(pole_ids[b])}}
+            next_conductor += 1
+            kind = "insert"
+        else:
+            conductor = int(rng.choice(list(ends)))
+            a, b = ends.pop(conductor)
+            change = {"table": "conductors", "op": "DELETE", "row": {
+                "conductor_id": conductor, "start_pole_id": int(pole_ids[a]), "end_pole_id": int(pole_ids[b])}}
+            kind = "delete"
+        started = time.perf_counter()
+        islands.handle_change(change)
+        timings[kind].append(time.perf_counter() - started)
+    for kind, values in timings.items():
+        if values:
+            print(f"{kind + ':':<13}{np.median(values) * 1e3:8.3f} ms p50, {np.percentile(values, 99) * 1e3:8.3f} ms p99")
+
+    open_conductors = {switch_conductor[s] for s, o in status.items() if o and s in switch_conductor}
+    fuse_ids, fuse_on, fuse_open = topology.devices["fuses"]
+    open_conductors |= {int(topology.conductor_ids[c]) for c, o in zip(fuse_on, fuse_open) if c >= 0 and o}
+    edges = np.array([e for c, e in ends.items() if c not in open_conductors], dtype=np.int64).reshape(-1, 2)
+    expected = component_labels(len(pole_ids), edges[:, 0], edges[:, 1])
+    roots = np.array([islands.find(p) for p in range(len(pole_ids))])
+    # Same partition: the pairs (expected label, root) must be one-to-one
+    pairs = np.unique(np.stack([expected, roots]), axis=1)
+    assert len(pairs[0]) == len(np.unique(expected)) == len(np.unique(roots))
+    for root in np.unique(roots).tolist():
+        substations = islands.head_substation[roots == root]
+        assert islands.sources.get(root, set()) == set(substations[substations >= 0].tolist())
+    print("OK: islands and their substations match a labelling from scratch")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""Compare the old jsonable_encoder response path with app.services.json_encoding.
+
+Rows mimic network.substations / network.transformers results: ints, strings,
+Numeric (Decimal) kV/kVA values, timestamps, dates and a geometry column.
+
+    python -m benchmarks.bench_json_serialization [--sizes 10000 100000 1000000]
+"""
+import argparse
+import json
+import time
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+
+from fastapi.encoders import jsonable_encoder
+from geoalchemy2.elements import WKBElement
+
+from app.services.json_encoding import dumps
+
+POINT_WKB = "0101000020E6100000000000000000F03F0000000000000040"
+
+
+def make_rows(count):
+    created = datetime(2024, 1, 1, 12, 0)
+    installed = date(2020, 6, 1)
+    return [
+        {
+            "transformer_id": i,
+            "transformer_name": f"TX-{i:07d}",
+            "feeder_id": i // 40,
+            "capacity_kva": Decimal("112.5"),
+            "voltage_level_kv": Decimal("11"),
+            "status": "Active",
+            "installation_date": installed,
+            "created_at": created + timedelta(seconds=i),
+            "geom": WKBElement(POINT_WKB, srid=4326, extended=True),
+        }
+        for i in range(count)
+    ]
+
+
+def old_path(rows):
+    # What FastAPI did for a returned list: jsonable_encoder, then JSONResponse.render
+    return json.dumps(
+        jsonable_encoder(rows), ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":")
+    ).encode("utf-8")
+
+
+def new_path(rows):
+    return dumps(rows)
+
+
+def best_of(fn, rows, repeat):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        body = fn(rows)
+        timings.append(time.perf_counter() - started)
+    return min(timings), len(body)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    args = parser.parse_args()
+
+    print(f"{'rows':>10} {'jsonable_encoder':>18} {'orjson':>10} {'speedup':>8} {'bytes':>12}")
+    for size in args.sizes:
+        rows = make_rows(size)
+        repeat = 3 if size <= 100_000 else 1
+        old_s, _ = best_of(old_path, rows, repeat)
+        new_s, length = best_of(new_path, rows, repeat)
+        print(f"{size:>10} {old_s * 1000:>16.1f}ms {new_s * 1000:>8.1f}ms {old_s / new_s:>7.1f}x {length:>12}")
+
+
+if __name__ == "__main__":
+    main()
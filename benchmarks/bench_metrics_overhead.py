@@ -0,0 +1,74 @@
+"""Per-request cost of MetricsMiddleware and of a single Histogram.observe call.
+
+Drives a FastAPI app directly over ASGI (no sockets) with and without the
+middleware, so the difference is the instrumentation overhead.
+
+    python -m benchmarks.bench_metrics_overhead [--requests 20000]
+"""
+import argparse
+import asyncio
+import time
+
+from fastapi import FastAPI
+
+from app.services.metrics import LATENCY_BUCKETS, Histogram, MetricsMiddleware
+
+
+def make_app(instrumented: bool):
+    app = FastAPI()
+
+    @app.get("/ping")
+    async def ping():
+        return {"ok": True}
+
+    if instrumented:
+        app.add_middleware(MetricsMiddleware)
+    return app
+
+
+async def drive(app, requests: int) -> float:
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET",
+        "scheme": "http", "path": "/ping", "raw_path": b"/ping", "query_string": b"",
+        "root_path": "", "headers": [], "client": ("127.0.0.1", 1), "server": ("test", 80),
+    }
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        pass
+
+    for _ in range(200):  # warm up routing and the middleware stack
+        await app(dict(scope), receive, send)
+    started = time.perf_counter()
+    for _ in range(requests):
+        await app(dict(scope), receive, send)
+    return (time.perf_counter() - started) / requests
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=20_000)
+    args = parser.parse_args()
+
+    # Best of three alternating runs, since the difference is close to timer noise
+    plain_app, instrumented_app = make_app(False), make_app(True)
+    plain = instrumented = float("inf")
+    for _ in range(3):
+        plain = min(plain, asyncio.run(drive(plain_app, args.requests)))
+        instrumented = min(instrumented, asyncio.run(drive(instrumented_app, args.requests)))
+    print(f"plain request:        {plain * 1e6:8.1f} us")
+    print(f"instrumented request: {instrumented * 1e6:8.1f} us")
+    print(f"middleware overhead:  {(instrumented - plain) * 1e6:8.1f} us/request")
+
+    histogram = Histogram("bench", "bench", LATENCY_BUCKETS)
+    observations = 1_000_000
+    started = time.perf_counter()
+    for i in range(observations):
+        histogram.observe(0.0123, "/api/custom/bench")
+    print(f"Histogram.observe:    {(time.perf_counter() - started) / observations * 1e9:8.0f} ns")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""Latency of app.services.outage.trace_outage on the synthetic network.
+
+Opens random switches and fuses (one, and five at a time) plus the conductor
+heading the largest feed subtree, and checks every traced outage against a
+plain breadth-first search from the feeder heads with the devices open,
+also after switches are operated in place ahead of a feed forest rebuild.
+
+    python -m benchmarks.bench_outage [--meters 1000000]
+"""
+import argparse
+import time
+from collections import deque
+
+import numpy as np
+
+from app.services.outage import OUTAGE_KINDS, isolated_poles, trace_outage
+from app.services.topology import KIND_INDEX, Topology
+from benchmarks.bench_topology import make_network
+
+
+def energized(topology: Topology, opened=(), closed=()) -> np.ndarray:
+    is_open = topology.conductor_open.copy()
+    is_open[np.asarray(opened, dtype=np.int64)] = True
+    is_open[np.asarray(closed, dtype=np.int64)] = False
+    ptr, neighbors, edges = topology.pole_ptr, topology.pole_neighbors, topology.pole_edges
+    seen = np.zeros(len(topology.feed_tin), dtype=bool)
+    heads = np.flatnonzero(topology.feed_edge < 0)
+    heads = heads[topology.feed_tin[heads] >= 0]
+    seen[heads] = True
+    queue = deque(heads.tolist())
+    while queue:
+        pole = queue.popleft()
+        for i in range(ptr[pole], ptr[pole + 1]):
+            if not is_open[edges[i]] and not seen[neighbors[i]]:
+                seen[neighbors[i]] = True
+                queue.append(neighbors[i])
+    return seen
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--meters", type=int, default=1_000_000)
+    args = parser.parse_args()
+    rng = np.random.default_rng(7)
+
+    topology = Topology(*make_network(args.meters, rng))
+    closed = {}
+    for kind in ("switches", "fuses"):
+        ids, on, is_open = topology.devices[kind]
+        closed[kind] = ids[(on >= 0) & ~is_open]
+
+    def trace(switch_ids, fuse_ids, include_ids=True):
+        started = time.perf_counter()
+        result = trace_outage(topology, switch_ids, fuse_ids, include_ids)
+        return result, time.perf_counter() - started
+
+    for n in (1, 5):
+        for include_ids in (False, True):
+            timings, customers = [], []
+            for _ in range(200):
+                switch_ids = rng.choice(closed["switches"], n).tolist()
+                fuse_ids = rng.choice(closed["fuses"], n).tolist()
+                result, elapsed = trace(switch_ids, fuse_ids, include_ids)
+                timings.append(elapsed)
+                customers.append(result["counts"]["customers"])
+            print(f"{n} switch(es) + {n} fuse(s), ids={include_ids!s:<5}: "
+                  f"p50 {np.median(timings) * 1e3:6.2f} ms, p99 {np.percentile(timings, 99) * 1e3:6.2f} ms, "
+                  f"{np.mean(customers):8.0f} customers on average")
+
+    # Worst case: the conductor feeding the largest subtree of the feed forest
+    biggest = int(np.argmax(np.where(topology.feed_edge >= 0, topology.feed_size, 0)))
+    started = time.perf_counter()
+    poles = isolated_poles(topology, topology.feed_edge[[biggest]])
+    nodes = topology.subtrees(poles + topology.offsets[KIND_INDEX["poles"]])
+    topology.group_ids(nodes, OUTAGE_KINDS)
+    print(f"largest cut: {(time.perf_counter() - started) * 1e3:6.2f} ms, {len(poles):,} poles, {len(nodes):,} nodes")
+
+    # Check against a full BFS with the devices open
+    base = energized(topology)
+    for _ in range(5):
+        switch_ids = rng.choice(closed["switches"], 3).tolist()
+        fuse_ids = rng.choice(closed["fuses"], 3).tolist()
+        opened = np.concatenate([
+            topology.device_conductors("switches", switch_ids)[0], topology.device_conductors("fuses", fuse_ids)[0]
+        ])
+        expected = np.flatnonzero(base & ~energized(topology, opened))
+        assert np.array_equal(isolated_poles(topology, opened), expected)
+    print("OK: outages match a breadth-first search from the feeder heads")
+
+    # Switch devices in place, as the change feed does, and check again while
+    # the feed forest still has the old states
+    switch_ids, on, _ = topology.devices["switches"]
+    for i in rng.choice(len(switch_ids), 20, replace=False).tolist():
+        topology.set_device("switches", int(switch_ids[i]), int(topology.conductor_ids[on[i]]), bool(rng.random() < 0.5))
+    base = energized(topology)
+    for _ in range(5):
+        opened = rng.choice(len(topology.conductor_ids), 3)
+        expected = np.flatnonzero(base & ~energized(topology, opened))
+        assert np.array_equal(isolated_poles(topology, opened), expected)
+    print(f"OK: still matching with {len(topology.pending)} conductor states pending")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+"""Show that /features bbox queries are answered from the GiST index at 1M+ rows.
+
+Loads random points into a temporary copy of network.poles, times the exact
+statement GET /features/poles builds before and after the GiST index exists,
+and checks the EXPLAIN plan for an index scan. Needs PostGIS at DATABASE_URL;
+nothing outside the temporary table is touched.
+
+    python -m benchmarks.bench_spatial_index [--rows 1000000] [--queries 200]
+"""
+import argparse
+import json
+import random
+import time
+
+from geoalchemy2 import Geometry
+from sqlalchemy import Column, Integer, MetaData, Numeric, String, Table, select, text
+
+from app.database import engine
+from app.routers.feature_router import MAX_FEATURES
+from app.services.layers import bbox_filter, geojson_feature
+
+# Points are scattered over a 10 x 10 degree square; a 0.05 degree bbox then
+# holds ~25 of every million rows, a typical zoomed-in map view
+EXTENT = (-100.0, 30.0, -90.0, 40.0)
+BBOX_SIZE = 0.05
+
+table = Table(
+    "bench_poles", MetaData(),
+    Column("pole_id", Integer, primary_key=True),
+    Column("material_type", String(100)),
+    Column("height_meters", Numeric),
+    Column("geom", Geometry("POINT", 4326, spatial_index=False), nullable=False),
+    prefixes=["TEMPORARY"],
+)
+
+
+class BenchPole:
+    """Stands in for the Pole model in the app.services.layers helpers."""
+    __table__ = table
+    geom = table.c.geom
+
+
+def random_bbox(rng):
+    minx = rng.uniform(EXTENT[0], EXTENT[2] - BBOX_SIZE)
+    miny = rng.uniform(EXTENT[1], EXTENT[3] - BBOX_SIZE)
+    return minx, miny, minx + BBOX_SIZE, miny + BBOX_SIZE
+
+
+def features_statement(bbox):
+    return select(geojson_feature(BenchPole)).where(bbox_filter(BenchPole, bbox)).limit(MAX_FEATURES)
+
+
+def run_queries(conn, queries: int, seed: int = 1):
+    rng = random.Random(seed)
+    started = time.perf_counter()
+    returned = 0
+    for _ in range(queries):
+        returned += len(conn.execute(features_statement(random_bbox(rng))).scalars().all())
+    return (time.perf_counter() - started) / queries, returned / queries
+
+
+def index_nodes(conn):
+    statement = features_statement(random_bbox(random.Random(0)))
+    sql = str(statement.compile(conn, compile_kwargs={"literal_binds": True}))
+    plan = conn.execute(text(f"EXPLAIN (ANALYZE, FORMAT JSON) {sql}")).scalar_one()
+    plan = (json.loads(plan) if isinstance(plan, str) else plan)[0]["Plan"]
+    nodes, stack = [], [plan]
+    while stack:
+        node = stack.pop()
+        nodes.append(node)
+        stack.extend(node.get("Plans", ()))
+    return [n for n in nodes if "Index Name" in n], [n["Node Type"] for n in nodes]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--queries", type=int, default=200)
+    args = parser.parse_args()
+
+    with engine.connect() as conn:
+        table.create(conn)
+        started = time.perf_counter()
+        conn.execute(text(
+            "INSERT INTO bench_poles (pole_id, material_type, height_meters, geom) "
+            "SELECT i, 'Wood', 12.5, ST_SetSRID(ST_MakePoint("
+            f"{EXTENT[0]} + random() * {EXTENT[2] - EXTENT[0]}, {EXTENT[1]} + random() * {EXTENT[3] - EXTENT[1]}), 4326) "
+            "FROM generate_series(1, :rows) AS i"
+        ), {"rows": args.rows})
+        conn.execute(text("ANALYZE bench_poles"))
+        print(f"loaded {args.rows:,} rows in {time.perf_counter() - started:.1f}s")
+
+        # Fewer queries without the index; each one is a full scan
+        seq_queries = max(1, args.queries // 20)
+        seq_latency, seq_rows = run_queries(conn, seq_queries)
+        print(f"no index:   {seq_latency * 1e3:8.2f} ms/query  ({seq_rows:.0f} features)")
+
+        started = time.perf_counter()
+        conn.execute(text("CREATE INDEX idx_bench_poles_geom ON bench_poles USING gist (geom)"))
+        conn.execute(text("ANALYZE bench_poles"))
+        print(f"GiST index built in {time.perf_counter() - started:.1f}s")
+
+        indexed, node_types = index_nodes(conn)
+        gist_latency, gist_rows = run_queries(conn, args.queries)
+        print(f"GiST index: {gist_latency * 1e3:8.2f} ms/query  ({gist_rows:.0f} features)")
+        print(f"speed-up:   {seq_latency / gist_latency:8.1f}x")
+        print(f"plan nodes: {', '.join(node_types)}")
+        conn.rollback()
+
+    if not any(n["Index Name"] == "idx_bench_poles_geom" for n in indexed):
+        raise SystemExit("FAIL: the bbox query did not use the GiST index")
+    print("OK: bbox filter is answered from idx_bench_poles_geom")
+
+
+if __name__ == "__main__":
+    main()
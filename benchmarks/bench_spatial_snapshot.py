@@ -0,0 +1,92 @@
+"""Memory and latency of LayerSnapshot at 1M points, checked against brute force.
+
+Builds a snapshot from synthetic pole-like features (no database), reports the
+resident memory of the arrays plus STRtree and of the packed feature text, then
+times bbox and k-nearest queries and verifies a sample of them exactly. Memory
+is read from /proc, so run it on Linux; GEOS allocations are invisible to
+tracemalloc.
+
+    python -m benchmarks.bench_spatial_snapshot [--rows 1000000] [--queries 2000]
+"""
+import argparse
+import ctypes
+import gc
+import os
+import random
+import time
+
+import numpy as np
+
+from app.services.spatial_snapshot import LayerSnapshot, haversine
+
+EXTENT = (-100.0, 30.0, -90.0, 40.0)
+
+
+def make_features(rows: int, rng):
+    lons = rng.uniform(EXTENT[0], EXTENT[2], rows)
+    lats = rng.uniform(EXTENT[1], EXTENT[3], rows)
+    features = [
+        (
+            f'{{"type":"Feature","id":{i},"geometry":{{"type":"Point","coordinates":[{x:.7f},{y:.7f}]}},'
+            f'"properties":{{"pole_id":{i},"transformer_id":{i // 8},"material_type":"Wood",'
+            f'"height_meters":12.5,"installation_year":2011,"created_at":"2024-01-01T12:00:00"}}}}'
+        ).encode()
+        for i, (x, y) in enumerate(zip(lons, lats), 1)
+    ]
+    return np.arange(1, rows + 1), np.column_stack([lons, lats]), features
+
+
+def rss_mb() -> float:
+    gc.collect()
+    ctypes.CDLL("libc.so.6").malloc_trim(0)  # hand freed build buffers back first
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2 ** 20
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--queries", type=int, default=2000)
+    args = parser.parse_args()
+    rng = np.random.default_rng(1)
+
+    ids, coords, features = make_features(args.rows, rng)
+    per_million = 1e6 / args.rows
+    # Index cost alone, with empty features, then the real thing
+    before = rss_mb()
+    bare = LayerSnapshot("poles", ids, coords, [b""] * args.rows)
+    index_mb = rss_mb() - before
+    del bare
+    started = time.perf_counter()
+    snapshot = LayerSnapshot("poles", ids, coords, features)
+    built = time.perf_counter() - started
+    del features
+    print(f"built {args.rows:,} points in {built:.2f}s")
+    print(f"ids, coordinates and STRtree: {index_mb * per_million:8.1f} MB per million points")
+    print(f"packed GeoJSON features:      {len(snapshot._blob) / 2 ** 20 * per_million:8.1f} MB per million points")
+
+    queries = random.Random(2)
+    started = time.perf_counter()
+    for _ in range(args.queries):
+        x, y = queries.uniform(-99.9, -90.1), queries.uniform(30.1, 39.9)
+        snapshot.query_bbox((x, y, x + 0.05, y + 0.05), 1000)
+    print(f"bbox query:  {(time.perf_counter() - started) / args.queries * 1e6:8.1f} us")
+
+    started = time.perf_counter()
+    points = [(queries.uniform(-99.9, -90.1), queries.uniform(30.1, 39.9)) for _ in range(args.queries)]
+    for x, y in points:
+        snapshot.nearest(x, y, 5, None)
+    print(f"5-nearest:   {(time.perf_counter() - started) / args.queries * 1e6:8.1f} us")
+
+    for x, y in points[:20]:
+        expected = np.argsort(haversine(x, y, coords[:, 0], coords[:, 1]))[:5] + 1
+        found = [id_ for _, id_, _ in snapshot.nearest(x, y, 5, None)]
+        assert found == list(expected), (found, list(expected))
+    snapshot.apply(int(ids[0]), None)
+    snapshot.apply(args.rows + 1, (-95.0, 35.0, b'{"id":"new"}'))
+    assert snapshot.nearest(-95.0, 35.0, 1, None)[0][1] == args.rows + 1
+    print("OK: nearest results match brute force")
+
+
+if __name__ == "__main__":
+    main()
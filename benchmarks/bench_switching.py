@@ -0,0 +1,70 @@
+"""Throughput of app.services.switching.simulate_plans on the synthetic network.
+
+Each plan opens a few closed switches and closes a few normally-open ties.
+A batch of plans is evaluated concurrently, and a sample of the plans is
+checked against a breadth-first search from the feeder heads.
+
+    python -m benchmarks.bench_switching [--meters 1000000] [--plans 50] [--changes 6]
+"""
+import argparse
+import asyncio
+import time
+
+import numpy as np
+
+from app.services.outage import supply_change
+from app.services.switching import conductor_overrides, simulate_plan, simulate_plans
+from app.services.topology import Topology
+from benchmarks.bench_outage import energized
+from benchmarks.bench_topology import make_network
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--meters", type=int, default=1_000_000)
+    parser.add_argument("--plans", type=int, default=50)
+    parser.add_argument("--changes", type=int, default=6)
+    args = parser.parse_args()
+    rng = np.random.default_rng(7)
+
+    hierarchy, conductors, switches, fuses = make_network(args.meters, rng)
+    transformer_ids = hierarchy["transformers"][0]
+    kva = (transformer_ids, rng.choice([25.0, 50.0, 75.0, 100.0, 167.0], len(transformer_ids)))
+    topology = Topology(hierarchy, conductors, switches, fuses, kva)
+
+    switch_ids, on, is_open = topology.devices["switches"]
+    closed_ids, open_ids = switch_ids[(on >= 0) & ~is_open], switch_ids[(on >= 0) & is_open]
+    half = args.changes // 2
+    plans = [
+        [(int(s), True) for s in rng.choice(closed_ids, args.changes - half)]
+        + [(int(s), False) for s in rng.choice(open_ids, half)]
+        for _ in range(args.plans)
+    ]
+
+    started = time.perf_counter()
+    for plan in plans:
+        simulate_plan(topology, plan)
+    sequential = time.perf_counter() - started
+    started = time.perf_counter()
+    results = asyncio.run(simulate_plans(topology, plans))
+    concurrent = time.perf_counter() - started
+    print(f"{args.plans} plans of {args.changes} changes: {sequential * 1e3:8.1f} ms one by one, "
+          f"{concurrent * 1e3:8.1f} ms concurrently ({concurrent / args.plans * 1e3:.2f} ms per plan)")
+    interrupted = [r["interrupted"]["customers"] for r in results]
+    restored = [r["restored"]["customers"] for r in results]
+    print(f"customers interrupted {np.mean(interrupted):8.0f} on average, restored {np.mean(restored):8.0f}")
+
+    base = energized(topology)
+    for plan in plans[:5]:
+        overrides = conductor_overrides(topology, plan)
+        opened = [c for c, o in overrides.items() if o]
+        closed = [c for c, o in overrides.items() if not o]
+        after = energized(topology, opened, closed)
+        lost, gained = supply_change(topology, overrides)
+        assert np.array_equal(lost, np.flatnonzero(base & ~after))
+        assert np.array_equal(gained, np.flatnonzero(~base & after))
+    print("OK: plans match a breadth-first search from the feeder heads")
+
+
+if __name__ == "__main__":
+    main()
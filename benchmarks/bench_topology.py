@@ -0,0 +1,134 @@
+"""Build time, memory and traversal latency of app.services.topology.Topology.
+
+Generates a synthetic network (no database) with the shape of a utility:
+each substation feeds feeders, transformers, poles, meters and one customer
+and service point per meter, with conductors forming a radial tree over the
+poles of each feeder plus a few loops and normally-open ties. Results are checked against a naive walk of the parent array,
+before and after patching in a batch of meter and customer edits.
+
+    python -m benchmarks.bench_topology [--meters 1000000]
+"""
+import argparse
+import time
+
+import numpy as np
+
+from app.services.topology import Topology
+
+
+def make_network(meters: int, rng):
+    counts = {
+        "substations": max(1, meters // 20_000),
+        "feeders": max(1, meters // 1_000),
+        "transformers": max(1, meters // 8),
+        "poles": max(1, meters // 2),
+        "meters": meters,
+        "customers": meters,
+        "service_points": meters,
+    }
+    parents = {"feeders": "substations", "transformers": "feeders", "poles": "transformers",
+               "meters": "poles", "customers": "meters", "service_points": "meters"}
+    hierarchy = {}
+    for name, count in counts.items():
+        # Shuffled, gappy ids so the id remapping is exercised
+        ids = rng.permutation(count).astype(np.int64) * 3 + 7
+        if name in parents:
+            parent_ids = hierarchy[parents[name]][0]
+            pids = parent_ids[rng.integers(0, len(parent_ids), count)]
+            pids[rng.random(count) < 0.001] = -1  # a few unassigned rows
+        else:
+            pids = np.full(count, -1, dtype=np.int64)
+        hierarchy[name] = (ids, pids)
+
+    # Each feeder's poles form a radial tree of short branches, drawn from the
+    # source side; a few closed conductors make loops inside a feeder and
+    # normally-open ties join random feeders
+    pole_ids, pole_transformers = hierarchy["poles"]
+    transformer_ids, transformer_feeders = hierarchy["transformers"]
+    lookup = np.full(transformer_ids.max() + 1, -1, dtype=np.int64)
+    lookup[transformer_ids] = transformer_feeders
+    feeder = np.where(pole_transformers >= 0, lookup[np.maximum(pole_transformers, 0)], -1)
+    by_feeder = np.argsort(feeder, kind="stable")
+    group = feeder[by_feeder]
+    position = np.arange(len(by_feeder))
+    first = np.maximum.accumulate(np.where(np.r_[True, group[1:] != group[:-1]], position, 0))
+    upstream = np.maximum(first, position - rng.integers(1, 5, len(position)))
+    radial = upstream < position
+    starts, ends = pole_ids[by_feeder[upstream[radial]]], pole_ids[by_feeder[position[radial]]]
+    loops = rng.integers(0, len(position), len(position) // 200)
+    loop_ends = np.minimum(loops + rng.integers(5, 50, len(loops)), len(position) - 1)
+    loops, loop_ends = loops[group[loops] == group[loop_ends]], loop_ends[group[loops] == group[loop_ends]]
+    ties = rng.integers(0, len(pole_ids), (len(pole_ids) // 100, 2))
+    starts = np.concatenate([starts, pole_ids[by_feeder[loops]], pole_ids[ties[:, 0]]])
+    ends = np.concatenate([ends, pole_ids[by_feeder[loop_ends]], pole_ids[ties[:, 1]]])
+    conductor_ids = np.arange(1, len(starts) + 1, dtype=np.int64)
+    conductors = (conductor_ids, starts, ends)
+
+    tie_ids = conductor_ids[-len(ties):]
+    switch_on = rng.choice(conductor_ids[:-len(ties)], size=len(conductor_ids) // 50, replace=False)
+    switch_open = np.r_[rng.random(len(switch_on)) < 0.01, np.ones(len(tie_ids), dtype=bool)]
+    switch_on = np.concatenate([switch_on, tie_ids])
+    switches = (np.arange(len(switch_on)), switch_on, switch_open)
+    fuse_on = rng.choice(conductor_ids, size=len(conductor_ids) // 20, replace=False)
+    fuses = (np.arange(len(fuse_on)), fuse_on, np.zeros(len(fuse_on), dtype=bool))
+    return hierarchy, conductors, switches, fuses
+
+
+def time_per_call(fn, args, repeat=1):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        for a in args:
+            fn(*a)
+    return (time.perf_counter() - started) / (len(args) * repeat)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--meters", type=int, default=1_000_000)
+    args = parser.parse_args()
+    rng = np.random.default_rng(7)
+
+    hierarchy, conductors, switches, fuses = make_network(args.meters, rng)
+    started = time.perf_counter()
+    topology = Topology(hierarchy, conductors, switches, fuses)
+    built = time.perf_counter() - started
+    nodes = len(topology)
+    print(f"nodes:       {nodes:,} ({len(topology.conductor_ids):,} conductors), built in {built:.2f}s")
+    print(f"memory:      {topology.nbytes() / 2 ** 20:8.1f} MB, {topology.nbytes() / nodes:.1f} B/node")
+
+    meters = [("meters", int(i)) for i in rng.choice(hierarchy["meters"][0], 2000)]
+    print(f"upstream:    {time_per_call(topology.upstream, meters) * 1e6:8.2f} us (meter to substation)")
+    for kind in ("transformers", "feeders", "substations"):
+        nodes_of_kind = [(topology.index(kind, int(i)),) for i in rng.choice(hierarchy[kind][0], 200)]
+        counts = time_per_call(topology.downstream_counts, nodes_of_kind)
+        subtree = time_per_call(lambda n: topology.group_ids(topology.subtree(n), ["customers"]), nodes_of_kind)
+        print(f"{kind + ':':<13}{counts * 1e6:8.2f} us counts, {subtree * 1e6:9.2f} us customer ids")
+
+    # A batch of change-feed edits: meters re-parented, customers deleted and added
+    meter_ids, pole_ids = hierarchy["meters"][0], hierarchy["poles"][0]
+    customer_ids = hierarchy["customers"][0]
+    edits = {
+        "meters": {int(i): int(p) for i, p in zip(rng.choice(meter_ids, 100), rng.choice(pole_ids, 100))},
+        "customers": {int(i): None for i in rng.choice(customer_ids, 50)},
+    }
+    new_customers = int(customer_ids.max()) + 1 + np.arange(50)
+    edits["customers"].update({int(i): int(m) for i, m in zip(new_customers, rng.choice(meter_ids, 50))})
+    started = time.perf_counter()
+    patched = topology.with_leaves(edits)
+    print(f"leaf patch:  {(time.perf_counter() - started) * 1e3:8.2f} ms for {sum(map(len, edits.values()))} edits")
+
+    # Check subtrees against a climb of the parent array from every node
+    for graph in (topology, patched):
+        for kind in ("feeders", "poles"):
+            for id_ in rng.choice(hierarchy[kind][0], 5):
+                root = graph.index(kind, int(id_))
+                walk = np.arange(len(graph))
+                inside = walk == root
+                for _ in range(6):
+                    walk = np.where(walk >= 0, graph.parent[walk], -1)
+                    inside |= walk == root
+                assert set(graph.subtree(root).tolist()) == set(np.flatnonzero(inside).tolist())
+    print("OK: subtrees match a walk of the parent array, before and after the patch")
+
+if __name__ == "__main__":
+    main()
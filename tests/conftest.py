@@ -0,0 +1,91 @@
+from dataclasses import dataclass
+from typing import Dict, Set, Tuple
+
+import numpy as np
+import pytest
+
+from app.services.topology import KIND_INDEX, NODE_KINDS, Topology
+
+
+@dataclass
+class Network:
+    """Rows of a small network as plain dicts, edited by the tests and rebuilt from scratch."""
+
+    # kind -> {id: parent id, -1 for NULL}
+    hierarchy: Dict[str, Dict[int, int]]
+    # id -> (start pole id, end pole id)
+    conductors: Dict[int, Tuple[int, int]]
+    # kind -> {id: (conductor id, -1 for NULL; open)}
+    devices: Dict[str, Dict[int, Tuple[int, bool]]]
+
+    def build(self) -> Topology:
+        hierarchy = {
+            kind: (np.array(list(rows), dtype=np.int64), np.array(list(rows.values()), dtype=np.int64))
+            for kind, rows in self.hierarchy.items()
+        }
+        conductors = (
+            np.array(list(self.conductors), dtype=np.int64),
+            np.array([start for start, _ in self.conductors.values()], dtype=np.int64),
+            np.array([end for _, end in self.conductors.values()], dtype=np.int64),
+        )
+        devices = [
+            (np.array(list(rows), dtype=np.int64),
+             np.array([c for c, _ in rows.values()], dtype=np.int64),
+             np.array([o for _, o in rows.values()], dtype=bool))
+            for rows in (self.devices["switches"], self.devices["fuses"])
+        ]
+        return Topology(hierarchy, conductors, *devices)
+
+    def energized(self) -> Set[int]:
+        """Pole ids fed from a feeder head in a topology rebuilt from these rows."""
+        graph = self.build()
+        return set(graph.ids[KIND_INDEX["poles"]][graph.feed_tin >= 0].tolist())
+
+
+def random_network(rng, poles: int = 40) -> Network:
+    """A few substations down to service points, with gappy shuffled ids and some NULL parents.
+
+    Conductors form short radial branches over the poles plus random extra
+    conductors (loops and ties); switches and fuses sit on random conductors,
+    a few open and a few on conductors that do not exist.
+    """
+    counts = {"substations": 2, "feeders": 4, "transformers": max(2, poles // 4), "poles": poles,
+              "meters": 2 * poles, "customers": 2 * poles, "service_points": 2 * poles}
+    hierarchy: Dict[str, Dict[int, int]] = {}
+    for kind in NODE_KINDS:
+        ids = (rng.permutation(counts[kind.name]) * 3 + 5).tolist()
+        if kind.parent_kind is None:
+            hierarchy[kind.name] = {i: -1 for i in ids}
+            continue
+        parents = list(hierarchy[kind.parent_kind])
+        hierarchy[kind.name] = {
+            i: -1 if rng.random() < 0.05 else int(parents[rng.integers(len(parents))]) for i in ids
+        }
+
+    pole_ids = list(hierarchy["poles"])
+    conductors: Dict[int, Tuple[int, int]] = {}
+    order = rng.permutation(len(pole_ids))
+    for position in range(1, len(order)):
+        if rng.random() < 0.9:
+            upstream = order[rng.integers(max(0, position - 4), position)]
+            conductors[len(conductors) + 1] = (pole_ids[upstream], pole_ids[order[position]])
+    for _ in range(len(pole_ids) // 5):
+        a, b = rng.choice(len(pole_ids), 2, replace=False)
+        conductors[len(conductors) + 1] = (pole_ids[a], pole_ids[b])
+    # One conductor to a pole that is not loaded
+    conductors[len(conductors) + 1] = (pole_ids[0], max(pole_ids) + 1)
+
+    conductor_ids = list(conductors)
+    devices = {}
+    for kind, start in (("switches", 100), ("fuses", 500)):
+        devices[kind] = {
+            start + i: (int(conductor_ids[rng.integers(len(conductor_ids))]) if rng.random() < 0.95 else 9999,
+                        bool(rng.random() < 0.2))
+            for i in range(len(conductor_ids) // 3)
+        }
+    return Network(hierarchy, conductors, devices)
+
+
+@pytest.fixture(params=range(8))
+def network(request) -> Network:
+    return random_network(np.random.default_rng(request.param))
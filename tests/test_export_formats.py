@@ -0,0 +1,69 @@
+import asyncio
+import io
+from decimal import Decimal
+
+import pytest
+
+from app.services import export_formats
+from app.services.export_formats import (
+    ARROW_MEDIA_TYPE, CSV_MEDIA_TYPE, PARQUET_MEDIA_TYPE, export_stream, negotiate_export,
+)
+
+pa = pytest.importorskip("pyarrow")
+pq = pytest.importorskip("pyarrow.parquet")
+
+COLUMNS = ["id", "amount", "geom"]
+BATCHES = [
+    [(1, Decimal("1.5"), None), (2, None, None)],
+    [(3, Decimal("7"), b"\x01\x02"), (4, Decimal("2.25"), b"\x03")],
+]
+
+
+async def _batches():
+    for rows in BATCHES:
+        yield COLUMNS, rows
+
+
+def _export(media_type, wkb_columns=()):
+    async def collect():
+        return b"".join([chunk async for chunk in export_stream(media_type, _batches(), wkb_columns)])
+    return asyncio.run(collect())
+
+
+@pytest.mark.parametrize("accept, expected", [
+    ("application/vnd.apache.arrow.stream", ARROW_MEDIA_TYPE),
+    ("text/csv;q=0.5, application/vnd.apache.parquet;q=0.9", PARQUET_MEDIA_TYPE),
+    ("application/json, text/csv;q=0.5", None),
+    ("text/csv;q=0", None),
+    ("*/*", None),
+])
+def test_negotiate_export(accept, expected):
+    assert negotiate_export(accept) == expected
+
+
+def test_arrow_keeps_first_batch_types():
+    table = pa.ipc.open_stream(_export(ARROW_MEDIA_TYPE, ("geom",))).read_all()
+    assert table.schema.field("amount").type == pa.float64()
+    assert table.schema.field("geom").type == pa.binary()
+    assert table.schema.field("geom").metadata[b"ARROW:extension:name"] == b"geoarrow.wkb"
+    assert table.column("amount").to_pylist() == [1.5, None, 7.0, 2.25]
+    assert table.column("geom").to_pylist() == [None, None, b"\x01\x02", b"\x03"]
+
+
+def test_parquet_round_trip():
+    table = pq.read_table(io.BytesIO(_export(PARQUET_MEDIA_TYPE, ("geom",))))
+    assert table.column("id").to_pylist() == [1, 2, 3, 4]
+    assert table.column("geom").to_pylist() == [None, None, b"\x01\x02", b"\x03"]
+
+
+def test_csv_hex_encodes_binary_in_later_batches():
+    lines = _export(CSV_MEDIA_TYPE).decode().splitlines()
+    assert lines == ["id,amount,geom", "1,1.5,", "2,,", "3,7,0102", "4,2.25,03"]
+
+
+def test_columnar_exports_need_pyarrow(monkeypatch):
+    monkeypatch.setattr(export_formats, "pa", None)
+    with pytest.raises(RuntimeError, match="pyarrow"):
+        export_stream(ARROW_MEDIA_TYPE, _batches())
+    # CSV does not
+    assert _export(CSV_MEDIA_TYPE).startswith(b"id,amount,geom")
@@ -0,0 +1,147 @@
+import asyncio
+import copy
+
+import numpy as np
+import pytest
+
+from app.services import islands as islands_module
+from app.services.islands import IslandIndex, Islands
+from app.services.topology import KIND_INDEX
+
+STATES = {"switches": ("Closed", "Open"), "fuses": ("Operational", "Blown")}
+KEYS = {"switches": "switch_id", "fuses": "fuse_id"}
+
+
+def _components(islands: Islands):
+    """Each island as (frozenset of pole ids, sorted substation ids)."""
+    poles = islands.graph.ids[KIND_INDEX["poles"]]
+    members = {}
+    for pole in range(len(poles)):
+        members.setdefault(islands.find(pole), set()).add(int(poles[pole]))
+    return {(frozenset(ids), tuple(sorted(islands.sources.get(root, ())))) for root, ids in members.items()}
+
+
+def _partition(islands: Islands):
+    return {ids for ids, _ in _components(islands)}
+
+
+def _device_row(kind, id_, conductor_id, is_open):
+    return {KEYS[kind]: id_, "conductor_id": None if conductor_id < 0 else conductor_id,
+            "operational_status": STATES[kind][is_open]}
+
+
+def _device_edit(rng, network):
+    """A random switch/fuse insert, update or delete as a change-feed payload; applied to ``network`` too."""
+    kind = ("switches", "fuses")[rng.integers(2)]
+    rows, conductors = network.devices[kind], list(network.conductors)
+    id_ = int(rng.choice(list(rows)))
+    old = _device_row(kind, id_, *rows[id_])
+    action = rng.random()
+    if action < 0.1:
+        del rows[id_]
+        return {"table": kind, "op": "DELETE", "row": old}
+    if action < 0.2:
+        id_ = max(rows) + 1
+        rows[id_] = (int(rng.choice(conductors)), bool(rng.random() < 0.5))
+        return {"table": kind, "op": "INSERT", "row": _device_row(kind, id_, *rows[id_])}
+    conductor_id, is_open = rows[id_]
+    if action < 0.35:
+        conductor_id = int(rng.choice(conductors))
+    else:
+        is_open = not is_open
+    rows[id_] = (conductor_id, is_open)
+    return {"table": kind, "op": "UPDATE", "row": _device_row(kind, id_, *rows[id_]), "old": old}
+
+
+def _conductor_edit(rng, network):
+    """A random conductor insert, re-route or delete; applied to ``network`` too."""
+    poles, rows = list(network.hierarchy["poles"]), network.conductors
+    id_ = int(rng.choice(list(rows)))
+    action = rng.random()
+    if action < 0.4:
+        start, end = rows.pop(id_)
+        return {"table": "conductors", "op": "DELETE",
+                "row": {"conductor_id": id_, "start_pole_id": start, "end_pole_id": end}}
+    op = "UPDATE"
+    if action < 0.7:
+        id_, op = max(rows) + 1, "INSERT"
+    rows[id_] = tuple(int(p) for p in rng.choice(poles, 2, replace=False))
+    return {"table": "conductors", "op": op,
+            "row": {"conductor_id": id_, "start_pole_id": rows[id_][0], "end_pole_id": rows[id_][1]}}
+
+
+def test_islands_match_a_rebuild_after_device_edits(network):
+    rng = np.random.default_rng(len(network.conductors))
+    islands = Islands(network.build())
+    for _ in range(30):
+        change = _device_edit(rng, network)
+        islands.handle_change(change)
+        assert _components(islands) == _components(Islands(network.build()))
+        # The same edit again, as a replay after a rebuild would, changes nothing
+        islands.handle_change(change)
+        assert _components(islands) == _components(Islands(network.build()))
+
+
+def test_islands_match_a_rebuild_after_conductor_edits(network):
+    rng = np.random.default_rng(len(network.conductors) + 1)
+    islands = Islands(network.build())
+    for _ in range(30):
+        edit = _conductor_edit if rng.random() < 0.6 else _device_edit
+        islands.handle_change(edit(rng, network))
+        # Heads (and so substations) move only with a topology load; the islands must already match
+        assert _partition(islands) == _partition(Islands(network.build()))
+
+
+def _feed_slices(graph):
+    """Pole id -> pole ids in its feed forest slice, for fed poles."""
+    poles = graph.ids[KIND_INDEX["poles"]]
+    return {
+        int(poles[p]): set(poles[graph.feed_order[graph.feed_tin[p]:graph.feed_tin[p] + graph.feed_size[p]]].tolist())
+        for p in np.flatnonzero(graph.feed_tin >= 0).tolist()
+    }
+
+
+def test_with_conductors_matches_a_rebuild(network):
+    rng = np.random.default_rng(len(network.conductors) + 2)
+    graph = network.build()
+    for _ in range(3):
+        edits = {}
+        for _ in range(5):
+            change = _conductor_edit(rng, network)
+            row = change["row"]
+            edits[row["conductor_id"]] = None if change["op"] == "DELETE" else (row["start_pole_id"],
+                                                                                row["end_pole_id"])
+        graph = graph.with_conductors(edits)
+    rebuilt = network.build()
+    assert np.array_equal(graph.conductor_ids, rebuilt.conductor_ids)
+    assert np.array_equal(graph.conductor_open, rebuilt.conductor_open)
+    assert graph.unlinked_devices == rebuilt.unlinked_devices
+    assert _feed_slices(graph) == _feed_slices(rebuilt)
+
+
+class _Holder:
+    def __init__(self):
+        self.on_load = []
+
+
+def test_rebuild_replays_edits_made_during_the_build(network, monkeypatch):
+    rng = np.random.default_rng(len(network.conductors) + 3)
+    graph = network.build()
+    before = copy.deepcopy(network)
+    changes = [_device_edit(rng, network) for _ in range(10)]
+    index = IslandIndex(_Holder())
+
+    async def build_while_edits_arrive(build, snapshot):
+        for change in changes:
+            index.handle_change(change)
+        return build(snapshot)
+
+    monkeypatch.setattr(islands_module, "run_in_threadpool", build_while_edits_arrive)
+    asyncio.run(index.rebuild(graph))
+    assert _components(index.get()) == _components(Islands(network.build()))
+    assert _components(Islands(graph)) == _components(Islands(before.build()))
+
+
+def test_get_before_build():
+    with pytest.raises(RuntimeError):
+        IslandIndex(_Holder()).get()
@@ -0,0 +1,57 @@
+import asyncio
+
+import numpy as np
+import pytest
+
+pytest.importorskip("geoalchemy2")
+
+from app.services import nearest as nearest_module  # noqa: E402
+from app.services.layers import LAYERS  # noqa: E402
+
+
+def _haversine(lon, lat, lons, lats):
+    lon, lat, lons, lats = map(np.radians, (lon, lat, lons, lats))
+    a = np.sin((lats - lat) / 2) ** 2 + np.cos(lat) * np.cos(lats) * np.sin((lons - lon) / 2) ** 2
+    return 2 * 6_371_008.8 * np.arcsin(np.sqrt(a))
+
+
+class _Session:
+    """Answers both statements from arrays: ``<->`` as planar degree order, distances by haversine."""
+
+    def __init__(self, lons, lats):
+        self.lons, self.lats = lons, lats
+        self.ids = np.arange(len(lons))
+
+    async def execute(self, statement, params):
+        rows = []
+        radii = params.get("radii", [None] * len(params["lons"]))
+        for ordinal, (lon, lat, radius) in enumerate(zip(params["lons"], params["lats"], radii), 1):
+            distance = _haversine(lon, lat, self.lons, self.lats)
+            if radius is None:
+                planar = np.hypot(self.lons - lon, self.lats - lat)
+                hits = np.argsort(planar, kind="stable")[:params["candidates"]]
+            else:
+                hits = np.flatnonzero(distance <= radius)
+            rows += [(ordinal, int(self.ids[i]), float(distance[i]), "{}") for i in hits]
+        return rows
+
+
+@pytest.mark.parametrize("k", [1, 3, 10])
+def test_nearest_matches_brute_force_where_planar_order_is_wrong(k):
+    rng = np.random.default_rng(k)
+    # At 80 degrees a degree of longitude is a sixth of a degree of latitude, so the
+    # planar <-> order ranks rows due north/south well ahead of nearer rows due east/west
+    lons = rng.uniform(0.0, 20.0, 3000)
+    lats = rng.uniform(78.0, 82.0, 3000)
+    session = _Session(lons, lats)
+    points = list(zip(rng.uniform(5.0, 15.0, 20), rng.uniform(79.0, 81.0, 20)))
+    results = asyncio.run(nearest_module.nearest(session, LAYERS["poles"], points, k, None))
+    for (lon, lat), hits in zip(points, results):
+        expected = np.sort(_haversine(lon, lat, lons, lats))[:k]
+        assert [hit["distance_m"] for hit in hits] == pytest.approx(expected.tolist())
+
+
+def test_short_probe_is_not_rechecked():
+    hits = [[(5.0, 1, "{}")], [(float(i), i, "{}") for i in range(2 * nearest_module.KNN_OVERSAMPLE)]]
+    radii = nearest_module.recheck_radii(hits, 2, max_distance=0.5)
+    assert radii == {1: 0.5}
@@ -0,0 +1,67 @@
+import copy
+
+import numpy as np
+
+from app.services.outage import supply_change, trace_outage
+from app.services.topology import KIND_INDEX
+
+
+def _forced(network, overrides):
+    """A copy of ``network`` with conductors forced open or closed: {conductor id: open}."""
+    forced = copy.deepcopy(network)
+    for rows in forced.devices.values():
+        for id_, (conductor_id, _) in rows.items():
+            if overrides.get(conductor_id) is False:
+                rows[id_] = (conductor_id, False)
+    switches = forced.devices["switches"]
+    for conductor_id, is_open in overrides.items():
+        if is_open:
+            switches[max(switches) + 1] = (conductor_id, True)
+    return forced
+
+
+def _poles(graph, local):
+    return set(graph.ids[KIND_INDEX["poles"]][local].tolist())
+
+
+def test_trace_outage_matches_a_rebuild(network):
+    rng = np.random.default_rng(len(network.conductors))
+    graph = network.build()
+    opened = {}
+    for kind in ("switches", "fuses"):
+        closed = [id_ for id_, (c, is_open) in network.devices[kind].items() if not is_open and c in network.conductors]
+        opened[kind] = rng.choice(closed, min(len(closed), 2), replace=False).tolist()
+    result = trace_outage(graph, opened["switches"], opened["fuses"])
+
+    after = copy.deepcopy(network)
+    for kind, ids in opened.items():
+        for id_ in ids:
+            after.devices[kind][id_] = (after.devices[kind][id_][0], True)
+    lost = network.energized() - after.energized()
+    meters = {m for m, pole in network.hierarchy["meters"].items() if pole in lost}
+    customers = {c for c, meter in network.hierarchy["customers"].items() if meter in meters}
+    assert result["poles"] == sorted(lost)
+    assert result["meters"] == sorted(meters)
+    assert result["customers"] == sorted(customers)
+    assert result["counts"]["poles"] == len(lost)
+
+
+def test_supply_change_matches_a_rebuild_after_device_edits(network):
+    rng = np.random.default_rng(len(network.conductors) + 1)
+    graph = network.build()
+    # Device edits applied in place, as the change feed does, leave the feed forest pending
+    for kind in ("switches", "fuses"):
+        rows = network.devices[kind]
+        for id_ in rng.choice(list(rows), 4, replace=False).tolist():
+            conductor_id, is_open = rows[id_]
+            rows[id_] = (conductor_id, not is_open)
+            graph.set_device(kind, id_, conductor_id, not is_open)
+
+    conductors = rng.choice(len(graph.conductor_ids), 6, replace=False).tolist()
+    overrides = {c: bool(rng.random() < 0.5) for c in conductors}
+    lost, restored = supply_change(graph, overrides)
+
+    before = network.energized()
+    after = _forced(network, {int(graph.conductor_ids[c]): is_open for c, is_open in overrides.items()}).energized()
+    assert _poles(graph, lost) == before - after
+    assert _poles(graph, restored) == after - before
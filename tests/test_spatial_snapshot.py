@@ -0,0 +1,42 @@
+import numpy as np
+import pytest
+
+pytest.importorskip("shapely")
+
+from app.services.spatial_snapshot import LayerSnapshot, haversine  # noqa: E402
+
+
+def _brute_force(lon, lat, lons, lats, ids, k):
+    distance = haversine(lon, lat, lons, lats)
+    return [int(ids[i]) for i in np.lexsort((ids, distance))[:k]]
+
+
+@pytest.fixture(scope="module")
+def points():
+    rng = np.random.default_rng(3)
+    n = 5000
+    lons = rng.uniform(-180, 180, n)
+    lats = np.degrees(np.arcsin(rng.uniform(-1, 1, n)))
+    # Crowd the antimeridian and the north pole, where lon/lat boxes go wrong
+    lons[:500], lats[:500] = rng.uniform(179, 180, 500), rng.uniform(-2, 2, 500)
+    lats[500:1000] = rng.uniform(87, 90, 500)
+    return np.arange(n, dtype=np.int64), lons, lats
+
+
+@pytest.mark.parametrize("lon, lat", [(-179.99, 0.5), (179.99, -1.0), (0.0, 89.9), (120.0, 88.0), (10.0, -45.0)])
+@pytest.mark.parametrize("k", [1, 5, 20])
+def test_nearest_matches_brute_force(points, lon, lat, k):
+    ids, lons, lats = points
+    snapshot = LayerSnapshot("poles", ids, np.c_[lons, lats], [b"{}"] * len(ids))
+    assert [id_ for _, id_, _ in snapshot.nearest(lon, lat, k, None)] == _brute_force(lon, lat, lons, lats, ids, k)
+
+
+def test_nearest_sees_overlay_edits(points):
+    ids, lons, lats = points
+    snapshot = LayerSnapshot("poles", ids, np.c_[lons, lats], [b"{}"] * len(ids))
+    nearest = snapshot.nearest(10.0, -45.0, 1, None)[0][1]
+    snapshot.apply(nearest, None)
+    snapshot.apply(10**6, (10.0, -45.0, b'{"new": true}'))
+    hits = snapshot.nearest(10.0, -45.0, 2, None)
+    assert hits[0][1:] == (10**6, '{"new": true}')
+    assert nearest not in [id_ for _, id_, _ in hits]
@@ -0,0 +1,83 @@
+import asyncio
+import copy
+
+import numpy as np
+
+from app.services import switching
+from app.services.switching import simulate_plan, simulate_plans
+
+
+def _impact(network, poles):
+    meters = {m for m, pole in network.hierarchy["meters"].items() if pole in poles}
+    transformers = {network.hierarchy["poles"][p] for p in poles} & set(network.hierarchy["transformers"])
+    return {
+        "poles": len(poles),
+        "meters": len(meters),
+        "customers": sum(1 for meter in network.hierarchy["customers"].values() if meter in meters),
+        "transformers": len(transformers),
+        "kva": 0.0,
+    }
+
+
+def _expected(network, plan):
+    after = copy.deepcopy(network)
+    switches = after.devices["switches"]
+    for id_, is_open in plan:
+        switches[id_] = (switches[id_][0], is_open)
+    before, after = network.energized(), after.energized()
+    return _impact(network, before - after), _impact(network, after - before)
+
+
+def _random_plans(rng, network, count):
+    ids = list(network.devices["switches"])
+    return [
+        [(int(i), bool(rng.random() < 0.6)) for i in rng.choice(ids, int(rng.integers(1, 6)))]
+        for _ in range(count)
+    ]
+
+
+def _check(results, network, plans):
+    for result, plan in zip(results, plans):
+        interrupted, restored = _expected(network, plan)
+        assert result["interrupted"] == interrupted
+        assert result["restored"] == restored
+
+
+def test_plans_match_rebuilds(network, monkeypatch):
+    monkeypatch.setattr(switching, "SIMULATION_WORKERS", 3)
+    rng = np.random.default_rng(len(network.conductors))
+    graph = network.build()
+    # Device edits applied in place since the feed forest was built
+    for id_ in rng.choice(list(network.devices["switches"]), 3, replace=False).tolist():
+        conductor_id, is_open = network.devices["switches"][id_]
+        network.devices["switches"][id_] = (conductor_id, not is_open)
+        graph.set_device("switches", id_, conductor_id, not is_open)
+    plans = _random_plans(rng, network, 10)
+    results = asyncio.run(simulate_plans(graph, plans))
+    assert len(results) == len(plans)
+    _check(results, network, plans)
+    # Plans never write to the topology, so each one alone gives the same answer
+    assert results == [simulate_plan(graph, plan) for plan in plans]
+
+
+def test_edits_during_a_batch_do_not_change_it(network, monkeypatch):
+    monkeypatch.setattr(switching, "SIMULATION_WORKERS", 2)
+    rng = np.random.default_rng(len(network.conductors) + 1)
+    graph = network.build()
+    plans = _random_plans(rng, network, 6)
+    live = copy.deepcopy(network)
+    toggled = rng.choice(list(network.devices["switches"]), 5, replace=False).tolist()
+
+    async def run_while_edits_arrive(fn, snapshot, chunk):
+        # The change feed toggles switches on the live graph while the chunks run
+        for id_ in toggled:
+            conductor_id, is_open = live.devices["switches"][id_]
+            live.devices["switches"][id_] = (conductor_id, not is_open)
+            graph.set_device("switches", id_, conductor_id, not is_open)
+        toggled.clear()
+        return fn(snapshot, chunk)
+
+    monkeypatch.setattr(switching, "run_in_threadpool", run_while_edits_arrive)
+    _check(asyncio.run(simulate_plans(graph, plans)), network, plans)
+    # ...while the live graph has the edits
+    _check([simulate_plan(graph, plan) for plan in plans], live, plans)
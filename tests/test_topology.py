@@ -0,0 +1,86 @@
+import numpy as np
+import pytest
+
+from app.services.topology import LEAF_KINDS, NODE_KINDS, Topology, parse_kinds
+
+
+def _parents(graph: Topology):
+    return {graph.node(i): graph.node(p) if p >= 0 else None for i, p in enumerate(graph.parent.tolist())}
+
+
+def _subtrees(graph: Topology):
+    """(kind, id) -> set of (kind, id) in its preorder slice."""
+    return {graph.node(i): {graph.node(j) for j in graph.subtree(i).tolist()} for i in range(len(graph))}
+
+
+def _walked_subtrees(graph: Topology):
+    """(kind, id) -> set of (kind, id) found by climbing the parent array from every node."""
+    found = {graph.node(i): set() for i in range(len(graph))}
+    for i in range(len(graph)):
+        node = i
+        while node >= 0:
+            found[graph.node(node)].add(graph.node(i))
+            node = int(graph.parent[node])
+    return found
+
+
+def _check_arrays(graph: Topology):
+    n = len(graph)
+    assert np.array_equal(graph.tin[graph.order], np.arange(n))
+    assert np.array_equal(graph.kind_in_order, graph.kind[graph.order])
+    for i in range(n):
+        children = graph.children[graph.child_ptr[i]:graph.child_ptr[i + 1]]
+        assert set(children.tolist()) == set(np.flatnonzero(graph.parent == i).tolist())
+    assert _subtrees(graph) == _walked_subtrees(graph)
+
+
+def test_preorder_slices_match_a_walk_of_the_parent_array(network):
+    _check_arrays(network.build())
+
+
+def _leaf_edits(rng, network):
+    """Re-parent, delete and add a few rows of every leaf kind; applied to ``network`` too."""
+    edits = {}
+    for kind in NODE_KINDS:
+        if kind.name not in LEAF_KINDS:
+            continue
+        rows = network.hierarchy[kind.name]
+        parents = list(network.hierarchy[kind.parent_kind]) + [-1]
+        ids = list(rows)
+        edited = {}
+        for id_ in rng.choice(ids, min(len(ids), 6), replace=False).tolist():
+            edited[id_] = None if rng.random() < 0.4 else int(parents[rng.integers(len(parents))])
+        for id_ in range(max(ids) + 1, max(ids) + 1 + int(rng.integers(0, 4))):
+            edited[id_] = int(parents[rng.integers(len(parents))])
+        for id_, parent in edited.items():
+            if parent is None:
+                rows.pop(id_, None)
+            else:
+                rows[id_] = parent
+        edits[kind.name] = edited
+    return edits
+
+
+@pytest.mark.parametrize("rounds", [1, 4])
+def test_with_leaves_matches_a_rebuild(network, rounds):
+    rng = np.random.default_rng(rounds)
+    graph = network.build()
+    for _ in range(rounds):
+        graph = graph.with_leaves(_leaf_edits(rng, network))
+    rebuilt = network.build()
+    assert _parents(graph) == _parents(rebuilt)
+    assert _subtrees(graph) == _subtrees(rebuilt)
+    _check_arrays(graph)
+
+
+def test_with_leaves_rejects_other_kinds(network):
+    pole = next(iter(network.hierarchy["poles"]))
+    with pytest.raises(ValueError):
+        network.build().with_leaves({"poles": {pole: None}})
+
+
+def test_parse_kinds():
+    assert parse_kinds(None) is None
+    assert parse_kinds("customers,,meters") == ["customers", "meters"]
+    with pytest.raises(ValueError, match="wires"):
+        parse_kinds("meters,wires")